@@ -0,0 +1,101 @@
+"""
+Command line entry point of the data collection stage.
+
+Run from the src directory, e.g.:
+
+    python -m data_collection collect --repo tensorflow/tensorflow --label "TF 2.18" --workers 16
+    python -m data_collection collect --repo grafana/grafana --milestone 12.0.x --dbname grafana_data_02
+    python -m data_collection collect --repo grafana/grafana --milestone 12.0.x --archive archive/grafana
+    python -m data_collection collect --repo grafana/grafana --milestone 12.0.x --archive archive/grafana --replay
+
+The database settings come from the environment (see src/db.py) and the GitHub token
+from `GITHUB_TOKEN`.
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bulk_ingest import LAYOUTS
+from collector import collect
+from dotenv import load_dotenv
+from github_client import GitHubClient
+from log_config import configure_logging
+from response_archive import ResponseArchive
+import db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m data_collection", description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    collect_parser = subparsers.add_parser("collect", help="Collect the issues and comments of a release")
+    collect_parser.add_argument("--repo", required=True, help="owner/name")
+    release = collect_parser.add_mutually_exclusive_group()
+    release.add_argument("--label")
+    release.add_argument("--milestone")
+    collect_parser.add_argument("--query", help="Extra search qualifiers")
+    collect_parser.add_argument("--release", help="Release stored with the issues (defaults to the label or milestone)")
+    collect_parser.add_argument("--state", choices=["closed", "open", "all"], default="closed")
+    collect_parser.add_argument("--dbname", help="Database to use instead of PGDATABASE")
+    collect_parser.add_argument("--layout", choices=list(LAYOUTS), default="collector")
+    collect_parser.add_argument("--workers", type=int, default=16)
+    collect_parser.add_argument("--search-workers", type=int, default=4)
+    collect_parser.add_argument("--batch-size", type=int, default=50)
+    collect_parser.add_argument("--upsert", action="store_true", help="Update the rows that changed")
+    collect_parser.add_argument("--api-url", default="https://api.github.com")
+    collect_parser.add_argument("--archive", help="Directory where the raw GitHub pages are archived")
+    collect_parser.add_argument("--replay", action="store_true", help="Answer every request from --archive, offline")
+
+    args = parser.parse_args(argv)
+    if args.replay and not args.archive:
+        parser.error("--replay needs --archive")
+
+    configure_logging()
+    load_dotenv()
+    repo_owner, repo_name = args.repo.split("/")
+    archive = ResponseArchive(args.archive, replay=args.replay) if args.archive else None
+    client = GitHubClient(
+        token=os.getenv("GITHUB_TOKEN"),
+        base_url=args.api_url,
+        pool_size=max(32, args.workers + args.search_workers),
+        archive=archive
+    )
+
+    statements = db.add_timing_hook(db.StatementStats())
+    try:
+        with db.connection(args.dbname) as conn:
+            collect(
+                conn,
+                repo_owner,
+                repo_name,
+                label=args.label,
+                milestone=args.milestone,
+                query=args.query,
+                release_id=args.release,
+                state=None if args.state == "all" else args.state,
+                client=client,
+                workers=args.workers,
+                search_workers=args.search_workers,
+                batch_size=args.batch_size,
+                layout=args.layout,
+                upsert=args.upsert
+            )
+    finally:
+        db.remove_timing_hook(statements)
+        # Writes the pages still buffered, also when the crawl failed halfway.
+        if archive is not None:
+            archive.close()
+
+    logging.info("Slowest statements:")
+    for statement, calls, total, slowest in statements.report(5):
+        logging.info(f"  {total:8.2f} s | {calls:>6} calls | max {slowest:6.2f} s | {statement[:80]}")
+
+    logging.info("Collection finished.")
+
+
+if __name__ == "__main__":
+    main()
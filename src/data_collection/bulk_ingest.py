@@ -0,0 +1,259 @@
+from io import StringIO
+import logging
+import weakref
+
+
+# Table names of each database layout: the collector's tables, and the per-release tables
+# of the TensorFlow crawl that the preprocessing and classification code read. Both have
+# the columns of `ISSUES` and `COMMENTS`, only the release column is named differently.
+LAYOUTS = {
+    "collector": {"issues": "issues", "comments": "comments", "release": "release"},
+    "release": {"issues": "issues_from_release", "comments": "issue_comments_from_release", "release": "release_number"},
+}
+
+
+def table_specs(layout="collector"):
+    """
+    Returns the `(issues, comments)` specs of a key of `LAYOUTS`, as used by `bulk_save`.
+    """
+    tables = LAYOUTS[layout]
+    issues = tables["issues"]
+    comments = tables["comments"]
+    release = tables["release"]
+
+    issue_spec = {
+        "table": issues,
+        "key": "issue_id",
+        "columns": [
+            "issue_id", release, "title", "body", "state", "created_at",
+            "updated_at", "closed_at", "author", "repo_name", "url"
+        ],
+        "update": ["title", "body", "state", "updated_at", "closed_at"],
+        "ddl": f"""
+            CREATE TABLE IF NOT EXISTS {issues} (
+                issue_id BIGINT PRIMARY KEY,
+                {release} TEXT,
+                title TEXT,
+                body TEXT,
+                state TEXT,
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP,
+                closed_at TIMESTAMP,
+                author TEXT,
+                repo_name TEXT,
+                url TEXT
+            );
+        """,
+    }
+
+    comment_spec = {
+        "table": comments,
+        "key": "comment_id",
+        "columns": ["comment_id", "issue_id", "body", "author", "created_at", "updated_at"],
+        "update": ["body", "author", "updated_at"],
+        "ddl": f"""
+            CREATE TABLE IF NOT EXISTS {comments} (
+                comment_id BIGINT PRIMARY KEY,
+                issue_id BIGINT,
+                body TEXT,
+                author TEXT,
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP
+            );
+        """,
+    }
+
+    return issue_spec, comment_spec
+
+
+ISSUES, COMMENTS = table_specs("collector")
+
+# Tables already created (and staged) on each connection, so the DDL runs once per session.
+_prepared = weakref.WeakKeyDictionary()
+
+
+def is_psycopg2(conn):
+    return type(conn).__module__.startswith("psycopg2")
+
+
+def prepare_table(conn, spec):
+    """
+    Creates the target table of `spec` and its session-local staging table, once per connection.
+    """
+    prepared = _prepared.setdefault(conn, set())
+    if spec["table"] in prepared:
+        return
+
+    cursor = conn.cursor()
+    cursor.execute(spec["ddl"])
+    cursor.execute(
+        f"""
+        CREATE TEMP TABLE IF NOT EXISTS stage_{spec["table"]}
+        (LIKE {spec["table"]});
+        """
+    )
+    conn.commit()
+
+    prepared.add(spec["table"])
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def copy_rows(conn, table, columns, rows):
+    """
+    Streams `rows` into `table` with a single `COPY ... FROM STDIN`, on psycopg2 or psycopg 3.
+    """
+    cursor = conn.cursor()
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+
+    if is_psycopg2(conn):
+        buffer = StringIO()
+        for row in rows:
+            buffer.write("\t".join(_copy_value(value) for value in row))
+            buffer.write("\n")
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+    else:
+        with cursor.copy(statement) as copy:
+            for row in rows:
+                copy.write_row(row)
+
+
+def bulk_save(conn, spec, rows, upsert=False, chunk_size=5000):
+    """
+    Saves `rows` into the table described by `spec`, one transaction per chunk.
+
+    Each chunk is copied into the staging table and merged with a single
+    `INSERT ... SELECT ... ON CONFLICT`. Existing rows are skipped, or updated when
+    `upsert` is set and their `updated_at` changed.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        spec (dict):
+            `ISSUES`, `COMMENTS` or a spec of `table_specs`.
+        rows (iterable of tuple):
+            Rows in the order of `spec["columns"]`.
+        upsert (bool, optional):
+            Update changed rows instead of skipping them.
+        chunk_size (int, optional):
+            Number of rows per transaction.
+
+    Returns:
+        int:
+            Number of rows inserted or updated.
+    """
+    prepare_table(conn, spec)
+
+    table = spec["table"]
+    key = spec["key"]
+    columns = ", ".join(spec["columns"])
+
+    if upsert:
+        assignments = ", ".join(f"{column} = EXCLUDED.{column}" for column in spec["update"])
+        conflict = (
+            f"DO UPDATE SET {assignments}"
+            f" WHERE {table}.updated_at IS DISTINCT FROM EXCLUDED.updated_at"
+        )
+    else:
+        conflict = "DO NOTHING"
+
+    merge = f"""
+        INSERT INTO {table} ({columns})
+        SELECT DISTINCT ON ({key}) {columns}
+        FROM stage_{table}
+        ORDER BY {key}
+        ON CONFLICT ({key}) {conflict};
+    """
+
+    cursor = conn.cursor()
+    written = 0
+    chunk = []
+
+    def flush():
+        nonlocal written
+        try:
+            cursor.execute(f"TRUNCATE stage_{table};")
+            copy_rows(conn, f"stage_{table}", spec["columns"], chunk)
+            cursor.execute(merge)
+            written += cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            flush()
+            chunk = []
+
+    if chunk:
+        flush()
+
+    logging.info(f"  {written} rows written to {table}")
+
+    return written
+
+
+def issue_rows(issues, release_id, repo_owner, repo_name):
+    for issue in issues:
+        yield (
+            issue["id"],
+            release_id,
+            issue["title"],
+            issue["body"],
+            issue["state"],
+            issue["created_at"],
+            issue["updated_at"],
+            issue["closed_at"],
+            issue["user"]["login"],
+            f"{repo_owner}/{repo_name}",
+            issue["html_url"],
+        )
+
+
+def comment_rows(batch):
+    for issue_id, comments in batch:
+        for comment in comments:
+            yield (
+                comment["id"],
+                issue_id,
+                comment["body"],
+                comment["user"]["login"],
+                comment["created_at"],
+                comment["updated_at"],
+            )
+
+
+def save_issues_bulk(
+    conn, issues, release_id, repo_owner, repo_name, upsert=False, chunk_size=5000, layout="collector"
+):
+    """
+    Bulk version of `save_issues_to_postgres`, into the issues table of `layout`.
+    Raises on failure; committed chunks are kept.
+    """
+    spec, _ = table_specs(layout)
+    return bulk_save(
+        conn, spec, issue_rows(issues, release_id, repo_owner, repo_name), upsert, chunk_size
+    )
+
+
+def save_comments_bulk(conn, batch, upsert=False, chunk_size=5000, layout="collector"):
+    """
+    Bulk version of `save_comments_to_postgres` for a list of `(issue_id, comments)` pairs,
+    into the comments table of `layout`. Raises on failure; committed chunks are kept.
+    """
+    _, spec = table_specs(layout)
+    return bulk_save(conn, spec, comment_rows(batch), upsert, chunk_size)
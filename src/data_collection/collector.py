@@ -0,0 +1,347 @@
+from bulk_ingest import save_comments_bulk, save_issues_bulk
+from github_client import get_default_client
+from search_pager import iter_search_issues
+from utils import fetch_comments_for_issue
+import logging
+import queue
+import threading
+import time
+
+
+# Marks the end of a queue; every fetch worker forwards it once to the writer.
+_DONE = object()
+
+
+class StageStats:
+    """
+    Time spent by one stage of the pipeline, over all its threads.
+
+    `busy` is the time doing the stage's own work (GitHub requests, database writes),
+    `starved` the time waiting for input from the previous stage and `blocked` the time
+    waiting for room in the queue of the next one. A stage that is mostly starved is
+    waiting on its upstream; one that is mostly blocked is held back by its downstream.
+    """
+
+    def __init__(self, name, threads=1):
+        self.name = name
+        self.threads = threads
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy=0.0, starved=0.0, blocked=0.0, items=0):
+        with self._lock:
+            self.busy += busy
+            self.starved += starved
+            self.blocked += blocked
+            self.items += items
+
+
+class PipelineStats:
+    """
+    Per-stage timing of a `run_pipeline` call.
+
+    Usage:
+        stats = collect(conn, "tensorflow", "tensorflow", label="TF 2.18")
+        print(stats.report())
+    """
+
+    def __init__(self, workers):
+        self.stages = {
+            "search": StageStats("search"),
+            "comments": StageStats("comments", workers),
+            "write": StageStats("write"),
+        }
+        self.issues = 0
+        self.comments = 0
+        self.elapsed = 0.0
+
+    def report(self):
+        """
+        Returns:
+            str:
+                One line per stage, with its busy/starved/blocked seconds per thread.
+        """
+        lines = [
+            f"{self.issues} issues and {self.comments} comments collected in {self.elapsed:.1f} s"
+        ]
+        for stage in self.stages.values():
+            threads = stage.threads
+            lines.append(
+                f"  {stage.name:<9} {stage.items:>7} items | threads {threads:>3} | "
+                f"busy {stage.busy / threads:8.1f} s | starved {stage.starved / threads:8.1f} s | "
+                f"blocked {stage.blocked / threads:8.1f} s"
+            )
+        return "\n".join(lines)
+
+
+def _quoted(value):
+    value = value.strip('"')
+    return f'"{value}"' if any(char.isspace() for char in value) else value
+
+
+def build_query(repo, label=None, milestone=None, state="closed", extra=None):
+    """
+    Search query of the issues of a repository, optionally restricted to a label or milestone.
+
+    Ex.: `build_query("tensorflow/tensorflow", label="TF 2.18")` returns
+    'repo:tensorflow/tensorflow is:issue is:closed label:"TF 2.18"'.
+    """
+    qualifiers = [f"repo:{repo}", "is:issue"]
+    if state:
+        qualifiers.append(f"is:{state}")
+    if label:
+        qualifiers.append(f"label:{_quoted(label)}")
+    if milestone:
+        qualifiers.append(f"milestone:{_quoted(milestone)}")
+    if extra:
+        qualifiers.append(extra)
+
+    return " ".join(qualifiers)
+
+
+def _put(items, item, stop):
+    # Waits for room in the queue, giving up when another stage failed.
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(items, stop):
+    while not stop.is_set():
+        try:
+            return items.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def run_pipeline(
+    conn, issues, repo_owner, repo_name, release_id, token=None, client=None, workers=16,
+    batch_size=50, queue_size=None, layout="collector", since=None, upsert=False
+):
+    """
+    Saves issues and their comments with three stages connected by bounded queues.
+
+    1. search: a thread iterates `issues` (ex.: the lazy `iter_search_issues`) into the issue queue;
+    2. comments: `workers` threads fetch the comments of each issue into the result queue;
+    3. write: the calling thread saves the issues and comments of every `batch_size` issues
+       with the bulk `COPY` path, into the tables of `layout`.
+
+    The stages overlap, so searching, fetching and writing proceed at the same time, and
+    the bounded queues keep memory flat when a stage is slower than the others. The time of
+    each stage is kept in the returned `PipelineStats`, to see where a crawl spends its time.
+    If a stage fails, the others stop and the error is raised; the batches already written
+    are kept.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection. Only used by the calling thread.
+        issues (iterable of dict):
+            Issues as returned by the search API (or `search_pager.slim_issue`).
+        repo_owner (str):
+            The username or organization that owns the repository.
+        repo_name (str):
+            The name of the repository.
+        release_id (str):
+            Release (milestone or label) stored with the issues.
+        token (str, optional):
+            GitHub token.
+        client (GitHubClient, optional):
+            Client used for the requests. Defaults to the shared client of `token`.
+        workers (int, optional):
+            Issues whose comments are fetched at the same time.
+        batch_size (int, optional):
+            Issues written per transaction.
+        queue_size (int, optional):
+            Capacity of each queue. Defaults to `2 * max(workers, batch_size)`.
+        layout (str, optional):
+            Key of `bulk_ingest.LAYOUTS`: 'collector' (issues / comments) or
+            'release' (issues_from_release / issue_comments_from_release).
+        since (str, optional):
+            Only fetch comments updated at or after this ISO 8601 timestamp.
+        upsert (bool, optional):
+            Update issues and comments that already exist (and changed) instead of skipping them.
+
+    Returns:
+        PipelineStats
+
+    Raises:
+        GitHubAPIError:
+            If a page still fails after the client's retries.
+    """
+    client = client or get_default_client(token)
+    queue_size = queue_size or 2 * max(workers, batch_size)
+
+    stats = PipelineStats(workers)
+    search, fetch, write = stats.stages.values()
+
+    issue_queue = queue.Queue(maxsize=queue_size)
+    result_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        iterator = iter(issues)
+        try:
+            while True:
+                start = time.perf_counter()
+                issue = next(iterator, _DONE)
+                fetched = time.perf_counter()
+                search.add(busy=fetched - start)
+
+                if issue is _DONE:
+                    break
+                if not _put(issue_queue, issue, stop):
+                    return
+                search.add(blocked=time.perf_counter() - fetched, items=1)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            # Stops the search threads of a lazy iterator when another stage failed.
+            if hasattr(iterator, "close"):
+                iterator.close()
+            for _ in range(workers):
+                _put(issue_queue, _DONE, stop)
+
+    def consume():
+        try:
+            while True:
+                start = time.perf_counter()
+                issue = _get(issue_queue, stop)
+                received = time.perf_counter()
+                fetch.add(starved=received - start)
+
+                if issue is _DONE:
+                    break
+
+                comments = fetch_comments_for_issue(
+                    issue_number=issue["number"],
+                    repo_owner=repo_owner,
+                    repo_name=repo_name,
+                    client=client,
+                    since=since
+                )
+                fetched = time.perf_counter()
+                fetch.add(busy=fetched - received)
+
+                if not _put(result_queue, (issue, comments), stop):
+                    return
+                fetch.add(blocked=time.perf_counter() - fetched, items=1)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(result_queue, _DONE, stop)
+
+    def save(batch):
+        start = time.perf_counter()
+        save_issues_bulk(
+            conn, [issue for issue, _ in batch], release_id, repo_owner, repo_name,
+            upsert=upsert, chunk_size=len(batch), layout=layout
+        )
+        pairs = [(issue["id"], comments) for issue, comments in batch]
+        save_comments_bulk(
+            conn, pairs, upsert=upsert, chunk_size=max(1, sum(len(c) for _, c in pairs)), layout=layout
+        )
+        write.add(busy=time.perf_counter() - start, items=len(batch))
+
+        stats.issues += len(batch)
+        stats.comments += sum(len(comments) for _, comments in batch)
+        logging.info(f"{stats.issues} issues and {stats.comments} comments of {repo_owner}/{repo_name} saved")
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=produce, name="search", daemon=True)]
+    threads += [threading.Thread(target=consume, name=f"comments-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    batch = []
+    finished = 0
+    try:
+        while finished < workers and not stop.is_set():
+            start = time.perf_counter()
+            item = _get(result_queue, stop)
+            write.add(starved=time.perf_counter() - start)
+
+            if item is _DONE:
+                finished += 1
+                continue
+
+            batch.append(item)
+            if len(batch) >= batch_size:
+                save(batch)
+                batch = []
+
+        if batch and not errors:
+            save(batch)
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+        stats.elapsed = time.perf_counter() - started
+
+    if errors:
+        raise errors[0]
+
+    logging.info(stats.report())
+
+    return stats
+
+
+def collect(
+    conn, repo_owner, repo_name, label=None, milestone=None, query=None, release_id=None, state="closed",
+    token=None, client=None, workers=16, search_workers=4, batch_size=50, layout="collector", upsert=False
+):
+    """
+    Collects the issues of a repository (optionally of one label or milestone) and their
+    comments, streaming the search results of `iter_search_issues` through `run_pipeline`.
+
+    Parameters:
+        label (str, optional):
+            Label of the release (ex.: 'TF 2.18').
+        milestone (str, optional):
+            Milestone of the release (ex.: '12.0.x').
+        query (str, optional):
+            Extra search qualifiers (ex.: 'created:>2024-01-01').
+        release_id (str, optional):
+            Release stored with the issues. Defaults to the label or milestone as quoted in
+            the search query (ex.: '"TF 2.18"').
+        state (str, optional):
+            'closed', 'open' or None for both.
+        search_workers (int, optional):
+            `created:` windows searched at the same time.
+
+        The other parameters are those of `run_pipeline`.
+
+    Returns:
+        PipelineStats
+    """
+    client = client or get_default_client(token)
+    search = build_query(f"{repo_owner}/{repo_name}", label, milestone, state, query)
+    # Stored as written in the query ('"TF 2.18"', '12.0.x'), like the rows of the earlier crawls.
+    release_id = release_id or (_quoted(label or milestone) if label or milestone else None)
+
+    logging.info(f"Collecting {search}")
+
+    return run_pipeline(
+        conn,
+        iter_search_issues(search, client=client, max_workers=search_workers),
+        repo_owner,
+        repo_name,
+        release_id,
+        client=client,
+        workers=workers,
+        batch_size=batch_size,
+        layout=layout,
+        upsert=upsert
+    )
@@ -0,0 +1,375 @@
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+import requests
+
+
+GITHUB_API_URL = "https://api.github.com"
+
+RETRY_STATUSES = {403, 429, 500, 502, 503, 504}
+
+# Minimum wait, in seconds, after a secondary rate limit that gives no `Retry-After`
+# (GitHub asks to wait at least one minute).
+SECONDARY_RATE_LIMIT_WAIT = 60.0
+
+
+class GitHubAPIError(Exception):
+    """Raised when a GitHub request fails for good (non-retryable status or retries exhausted)."""
+
+    def __init__(self, status_code, url, message):
+        super().__init__(f"{status_code} for {url}: {message}")
+        self.status_code = status_code
+        self.url = url
+
+
+class GitHubPage:
+    """
+    A decoded page of a GitHub API response.
+
+    Attributes:
+        data (dict or list):
+            The decoded JSON body.
+        links (dict):
+            The parsed `Link` header, in the same format as `requests.Response.links`.
+        from_cache (bool):
+            True when the server answered `304 Not Modified` and the body came from the ETag cache.
+    """
+
+    def __init__(self, data, links, from_cache=False):
+        self.data = data
+        self.links = links
+        self.from_cache = from_cache
+
+
+class ETagCache:
+    """
+    Stores the ETag and body of successful GETs, keyed by the full request URL.
+
+    Once `max_entries` pages are stored, the least recently written ones are evicted,
+    so a full crawl does not keep every page body.
+
+    Parameters:
+        path (str, optional):
+            SQLite file used to keep the cache between runs. By default the cache lives in memory.
+        max_entries (int, optional):
+            Maximum number of pages kept, or None for no limit.
+    """
+
+    def __init__(self, path=None, max_entries=10_000):
+        self._lock = threading.Lock()
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False)
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS etags (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                body TEXT,
+                links TEXT
+            );
+            """
+        )
+        self._db.commit()
+        self._count = self._db.execute("SELECT COUNT(*) FROM etags;").fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def get(self, url):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, body, links FROM etags WHERE url = ?;", (url,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        etag, body, links = row
+        return etag, json.loads(body), json.loads(links)
+
+    def put(self, url, etag, data, links):
+        with self._lock:
+            if self._db.execute("SELECT 1 FROM etags WHERE url = ?;", (url,)).fetchone() is None:
+                self._count += 1
+
+            # REPLACE gives the row a new rowid, so rowid order is the order of the last writes.
+            self._db.execute(
+                "INSERT OR REPLACE INTO etags (url, etag, body, links) VALUES (?, ?, ?, ?);",
+                (url, etag, json.dumps(data), json.dumps(links)),
+            )
+
+            if self.max_entries is not None and self._count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM etags WHERE rowid IN (SELECT rowid FROM etags ORDER BY rowid LIMIT ?);",
+                    (self._count - self.max_entries,),
+                )
+                self._count = self.max_entries
+
+            self._db.commit()
+
+
+class GitHubClient:
+    """
+    Shared, thread-safe GitHub REST client used by every fetcher.
+
+    - keeps pooled keep-alive connections through a single `requests.Session`;
+    - paces requests with the `X-RateLimit-Remaining`/`X-RateLimit-Reset` headers,
+      pausing every thread once the remaining quota drops to `min_remaining`;
+    - retries 429/5xx responses, rate-limit 403s (`X-RateLimit-Remaining: 0`, a
+      `Retry-After` header, or a body mentioning a secondary rate limit) and connection
+      errors with jittered exponential backoff, honouring `Retry-After` and waiting at
+      least `SECONDARY_RATE_LIMIT_WAIT` after a secondary rate limit; other 403s
+      (permissions, bad token) fail at once;
+    - sends `If-None-Match` for URLs already in the ETag cache, so unchanged pages come
+      back as `304 Not Modified`, which GitHub does not count against the quota.
+      Conditional requests are not paused when the quota is spent: a page that did
+      change gets a rate-limit 403, retried once the window resets;
+    - optionally keeps every page in a `ResponseArchive`, or answers from it offline.
+
+    Parameters:
+        token (str, optional):
+            GitHub token.
+        base_url (str, optional):
+            Root of the API (defaults to https://api.github.com).
+        max_retries (int, optional):
+            Number of retries before giving up on a request.
+        backoff_base (float, optional):
+            Base delay, in seconds, of the exponential backoff.
+        backoff_max (float, optional):
+            Upper bound, in seconds, of a single backoff delay.
+        min_remaining (int, optional):
+            Remaining quota at which requests are paused until the rate-limit window resets.
+        pool_size (int, optional):
+            Maximum number of pooled connections (should be at least the number of worker threads).
+        etag_cache (ETagCache, optional):
+            Cache used for conditional requests. A new bounded in-memory cache is used by default.
+        timeout (float, optional):
+            Timeout, in seconds, of every request.
+        archive (ResponseArchive, optional):
+            Archive of the raw pages. In replay mode, requests are answered from it
+            and never sent.
+    """
+
+    def __init__(
+        self,
+        token=None,
+        base_url=GITHUB_API_URL,
+        max_retries=5,
+        backoff_base=1.0,
+        backoff_max=60.0,
+        min_remaining=5,
+        pool_size=32,
+        etag_cache=None,
+        timeout=30,
+        archive=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.min_remaining = min_remaining
+        self.etag_cache = etag_cache if etag_cache is not None else ETagCache()
+        self.timeout = timeout
+        self.archive = archive
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept"] = "application/vnd.github+json"
+        if token:
+            self.session.headers["Authorization"] = f"Bearer {token}"
+
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._warned_reset = None
+
+    def get(self, url, params=None, headers=None, use_cache=True):
+        """
+        Sends a GET request and returns the decoded page.
+
+        Parameters:
+            url (str):
+                Absolute URL or path relative to `base_url` (e.g. '/search/issues').
+            params (dict, optional):
+                Query string parameters.
+            headers (dict, optional):
+                Extra headers for this request.
+            use_cache (bool, optional):
+                Send a conditional request and keep the page in the ETag cache.
+
+        Returns:
+            GitHubPage:
+                The decoded body and links of the response.
+
+        Raises:
+            GitHubAPIError:
+                If the response is not successful after all retries.
+        """
+        if url.startswith("/"):
+            url = self.base_url + url
+
+        cache_key = url
+        if params:
+            separator = "&" if "?" in url else "?"
+            cache_key = f"{url}{separator}{urlencode(sorted(params.items()))}"
+
+        # Archived pages are keyed without the host, so they replay against any `base_url`.
+        archive_key = cache_key[len(self.base_url):] if cache_key.startswith(self.base_url) else cache_key
+        if self.archive is not None and self.archive.replay:
+            archived = self.archive.get(archive_key)
+            if archived is None:
+                raise GitHubAPIError(None, url, f"{archive_key} is not in the response archive")
+            return GitHubPage(*archived, from_cache=True)
+
+        cached = self.etag_cache.get(cache_key) if use_cache else None
+
+        request_headers = dict(headers or {})
+        if cached is not None:
+            request_headers["If-None-Match"] = cached[0]
+
+        for attempt in range(self.max_retries + 1):
+            if cached is None:
+                self._wait_for_quota()
+
+            try:
+                response = self.session.get(
+                    url, params=params, headers=request_headers, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise GitHubAPIError(None, url, str(e)) from e
+
+                delay = self._backoff(attempt)
+                logging.warning(f"Request to {url} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            self._update_quota(response)
+
+            if response.status_code == 304 and cached is not None:
+                _, data, links = cached
+                if self.archive is not None:
+                    self.archive.put(archive_key, data, links)
+                return GitHubPage(data, links, from_cache=True)
+
+            if response.status_code == 200:
+                data = response.json()
+                etag = response.headers.get("ETag")
+                if etag and use_cache:
+                    self.etag_cache.put(cache_key, etag, data, response.links)
+                if self.archive is not None:
+                    self.archive.put(archive_key, data, response.links)
+                return GitHubPage(data, response.links)
+
+            if not self._is_retryable(response) or attempt == self.max_retries:
+                raise GitHubAPIError(response.status_code, url, response.text)
+
+            delay = self._retry_delay(response, attempt)
+            logging.warning(
+                f"GitHub answered {response.status_code} for {url}, retrying in {delay:.1f}s"
+                f" ({attempt + 1}/{self.max_retries})"
+            )
+            time.sleep(delay)
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _is_retryable(self, response):
+        if response.status_code not in RETRY_STATUSES:
+            return False
+
+        # A 403 is only a rate limit when GitHub says so; otherwise retrying cannot help.
+        if response.status_code == 403:
+            return (
+                response.headers.get("X-RateLimit-Remaining") == "0"
+                or "Retry-After" in response.headers
+                or _is_secondary_rate_limit(response)
+            )
+
+        return True
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            return _parse_retry_after(retry_after) + random.uniform(0, self.backoff_base)
+
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            reset = float(response.headers.get("X-RateLimit-Reset", 0))
+            return max(0.0, reset - time.time()) + random.uniform(0, self.backoff_base)
+
+        if _is_secondary_rate_limit(response):
+            return max(SECONDARY_RATE_LIMIT_WAIT, self._backoff(attempt)) + random.uniform(0, self.backoff_base)
+
+        return self._backoff(attempt)
+
+    def _update_quota(self, response):
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+
+        if int(remaining) <= self.min_remaining:
+            with self._lock:
+                self._paused_until = max(self._paused_until, float(reset))
+                # Logged once per window, not for every response received until the reset.
+                first_warning = self._warned_reset != reset
+                self._warned_reset = reset
+
+            if first_warning:
+                logging.warning(
+                    f"Only {remaining} requests left in the rate-limit window,"
+                    f" pausing until {time.ctime(float(reset))}"
+                )
+
+    def _wait_for_quota(self):
+        with self._lock:
+            paused_until = self._paused_until
+
+        delay = paused_until - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def _is_secondary_rate_limit(response):
+    """True when the body says the request hit a (secondary) rate limit, often sent without headers."""
+    return "rate limit" in response.text.lower()
+
+
+def _parse_retry_after(value):
+    """Seconds to wait for a `Retry-After` header, given in seconds or as an HTTP date."""
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+_default_clients = {}
+_default_clients_lock = threading.Lock()
+
+
+def get_default_client(token=None):
+    """
+    Returns the process-wide client for the given token, creating it on first use,
+    so all fetchers share the same connection pool, quota tracking and ETag cache.
+    """
+    with _default_clients_lock:
+        if token not in _default_clients:
+            _default_clients[token] = GitHubClient(token=token)
+        return _default_clients[token]
@@ -0,0 +1,156 @@
+from bulk_ingest import save_issues_bulk
+from datetime import datetime, timezone
+from github_client import get_default_client
+from utils import (
+    fetch_issues_from_query,
+    fetch_and_save_comments_for_issues_concurrently
+)
+import logging
+
+
+def ensure_watermark_table(conn):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS crawl_watermarks (
+            repo TEXT,
+            scope TEXT,
+            last_updated_at TIMESTAMP,
+            crawled_at TIMESTAMP,
+            PRIMARY KEY (repo, scope)
+        );
+        """
+    )
+
+    conn.commit()
+
+
+def get_watermark(conn, repo, scope):
+    """
+    Returns the `updated_at` high-water mark of the last crawl of (repo, scope), or None.
+    """
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        SELECT
+            last_updated_at
+        FROM
+            crawl_watermarks
+        WHERE
+            repo = %s AND scope = %s;
+        """,
+        (repo, scope)
+    )
+    row = cursor.fetchone()
+
+    return row[0] if row else None
+
+
+def set_watermark(conn, repo, scope, last_updated_at):
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        INSERT INTO crawl_watermarks (repo, scope, last_updated_at, crawled_at)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (repo, scope) DO UPDATE SET
+            last_updated_at = EXCLUDED.last_updated_at,
+            crawled_at = EXCLUDED.crawled_at;
+        """,
+        (repo, scope, last_updated_at, datetime.now(timezone.utc).replace(tzinfo=None))
+    )
+
+    conn.commit()
+
+
+def to_github_timestamp(value):
+    """Formats a naive UTC datetime (as stored in the TIMESTAMP columns) the way GitHub expects it."""
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def incremental_crawl(
+    conn, query, release_id, repo_owner, repo_name, scope=None, token=None, client=None, max_workers=8
+):
+    """
+    Collects only the issues and comments that changed since the previous crawl of the same scope.
+
+    The first run of a (repo, scope) pair is a full crawl. It stores the highest issue
+    `updated_at` it saw as the scope's watermark. Later runs add an `updated:>` qualifier
+    to the search query, fetch the comments of the changed issues with the `since` parameter,
+    and upsert everything, so edited issues and comments are refreshed instead of skipped.
+    The watermark only moves forward after all rows were saved, so a failed run is
+    repeated as a whole the next time.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        query (str):
+            Search query of the scope (ex.: 'repo:microsoft/vscode is:issue is:closed milestone:"April 2025"').
+        release_id (str):
+            Release stored with the issues.
+        repo_owner (str):
+            The username or organization that owns the repository.
+        repo_name (str):
+            The name of the repository.
+        scope (str, optional):
+            Name of the milestone/label the watermark is kept for. Defaults to `release_id`.
+        token (str, optional):
+            GitHub token.
+        client (GitHubClient, optional):
+            Client used for the requests. Defaults to the shared client of `token`.
+        max_workers (int, optional):
+            Number of issues whose comments are fetched concurrently.
+
+    Returns:
+        list of dict:
+            The issues that changed since the previous crawl.
+    """
+    client = client or get_default_client(token)
+    repo = f"{repo_owner}/{repo_name}"
+    scope = scope or release_id
+
+    ensure_watermark_table(conn)
+    watermark = get_watermark(conn, repo, scope)
+
+    if watermark is None:
+        logging.info(f"No watermark for {repo} ({scope}), running a full crawl.")
+        since = None
+        delta_query = query
+    else:
+        since = to_github_timestamp(watermark)
+        logging.info(f"Crawling {repo} ({scope}) for changes since {since}.")
+        delta_query = f"{query} updated:>{since}"
+
+    issues = fetch_issues_from_query(delta_query, client=client)
+
+    if not issues:
+        logging.info(f"{repo} ({scope}) is up to date.")
+        return []
+
+    save_issues_bulk(conn, issues, release_id, repo_owner, repo_name, upsert=True)
+
+    saved = fetch_and_save_comments_for_issues_concurrently(
+        issues=issues,
+        repo_owner=repo_owner,
+        repo_name=repo_name,
+        conn=conn,
+        client=client,
+        max_workers=max_workers,
+        since=since,
+        upsert=True
+    )
+
+    if not saved:
+        logging.error(f"Some rows of {repo} ({scope}) were not saved, keeping the previous watermark.")
+        return issues
+
+    new_watermark = max(
+        datetime.strptime(issue["updated_at"], "%Y-%m-%dT%H:%M:%SZ") for issue in issues
+    )
+    set_watermark(conn, repo, scope, new_watermark)
+
+    logging.info(f"{len(issues)} changed issues collected, watermark moved to {to_github_timestamp(new_watermark)}.")
+
+    return issues
@@ -0,0 +1,234 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from datetime import datetime, timedelta
+from urllib.parse import urlparse, parse_qs, urlencode
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class MockGitHubServer:
+    """
+    Minimal local stand-in for the GitHub REST API, used by the benchmarks.
+
+    It serves deterministic data for the two endpoints the collectors use:
+    `/search/issues` (paginated with a `Link: rel="next"` header) and
+    `/repos/{owner}/{repo}/issues/{number}/comments` (paginated until an empty page),
+    honouring the `updated:>` and `created:start..end` search qualifiers and the `since`
+    comments parameter. Like GitHub, search pages past the first `search_limit` results
+    are answered with a 422. Issue n is created n * `created_step` seconds after 2020-01-01.
+    Every request sleeps for `latency` seconds to simulate the network round-trip.
+
+    Like GitHub, every response carries an `ETag` and the `X-RateLimit-*` headers, and
+    a request whose `If-None-Match` matches the current ETag gets a `304 Not Modified`
+    that does not consume quota. Once the quota of the window is spent, the other
+    requests get a `403` with `X-RateLimit-Remaining: 0` until the window resets.
+
+    Parameters:
+        num_issues (int):
+            Number of issues returned by the search endpoint.
+        comments_per_issue (int):
+            Number of comments served for every issue.
+        latency (float):
+            Artificial delay, in seconds, added to every response.
+        rate_limit (int):
+            Size of the simulated rate-limit window.
+        rate_limit_window (float):
+            Seconds before the rate-limit window resets.
+        failures (list of int or tuple):
+            Status codes answered, in order, to the first requests (e.g. `[403, 429, 502]`),
+            each with `Retry-After: 0`, or `(status, headers)` / `(status, headers, body)`
+            tuples to send other headers or a body.
+        search_limit (int):
+            Number of search results served per query.
+        created_step (int):
+            Seconds between the creation dates of consecutive issues.
+    """
+
+    def __init__(
+        self, num_issues=100, comments_per_issue=5, latency=0.05, rate_limit=5000, failures=(),
+        search_limit=1000, created_step=600, rate_limit_window=3600
+    ):
+        self.num_issues = num_issues
+        self.comments_per_issue = comments_per_issue
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.remaining = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.reset_at = time.time() + rate_limit_window
+        self.failures = list(failures)
+        self.search_limit = search_limit
+        self.created_step = created_step
+        self._issues = None
+        self.request_count = 0
+        self.not_modified_count = 0
+        self.rate_limited_count = 0
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def issue(self, number):
+        return {
+            "id": 1_000_000 + number,
+            "number": number,
+            "title": f"Issue {number}",
+            "body": f"Body of issue {number}",
+            "state": "closed",
+            "created_at": (datetime(2020, 1, 1) + timedelta(seconds=number * self.created_step)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "updated_at": "2025-01-02T00:00:00Z",
+            "closed_at": "2025-01-03T00:00:00Z",
+            "user": {"login": f"user{number % 10}"},
+            "html_url": f"https://github.com/mock/mock/issues/{number}",
+        }
+
+    def issues(self):
+        with self._lock:
+            if self._issues is None:
+                self._issues = [self.issue(n) for n in range(1, self.num_issues + 1)]
+            return self._issues
+
+    def comment(self, issue_number, index):
+        return {
+            "id": issue_number * 1_000 + index,
+            "body": f"Comment {index} on issue {issue_number}",
+            "user": {"login": f"user{index % 10}"},
+            "created_at": "2025-01-01T00:00:00Z",
+            "updated_at": "2025-01-01T00:00:00Z",
+        }
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with mock._lock:
+                    mock.request_count += 1
+                    failure = mock.failures.pop(0) if mock.failures else None
+                    if time.time() >= mock.reset_at:
+                        mock.remaining = mock.rate_limit
+                        mock.reset_at = time.time() + mock.rate_limit_window
+
+                time.sleep(mock.latency)
+
+                if failure is not None:
+                    if not isinstance(failure, tuple):
+                        failure = (failure, {"Retry-After": "0"})
+                    status, headers, body = (failure + ("",))[:3]
+                    body = body.encode()
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                parsed = urlparse(self.path)
+                params = parse_qs(parsed.query)
+                per_page = int(params.get("per_page", ["30"])[0])
+                page = int(params.get("page", ["1"])[0])
+                parts = parsed.path.strip("/").split("/")
+
+                if parts == ["search", "issues"]:
+                    query = params.get("q", [""])[0]
+                    updated_after = re.search(r"updated:>(\S+)", query)
+                    issues = mock.issues()
+                    if updated_after:
+                        issues = [i for i in issues if i["updated_at"] > updated_after.group(1)]
+                    created = re.search(r"created:(\S+)\.\.(\S+)", query)
+                    if created:
+                        issues = [i for i in issues if created.group(1) <= i["created_at"] <= created.group(2)]
+                    if page * per_page > mock.search_limit:
+                        self.send_error(422, "Only the first 1000 search results are available")
+                        return
+                    items = issues[(page - 1) * per_page:page * per_page]
+                    has_next = page * per_page < min(len(issues), mock.search_limit)
+                    self._send_json({"total_count": len(issues), "items": items}, has_next)
+                elif len(parts) == 6 and parts[0] == "repos" and parts[5] == "comments":
+                    issue_number = int(parts[4])
+                    since = params.get("since", [""])[0]
+                    comments = [mock.comment(issue_number, i) for i in range(mock.comments_per_issue)]
+                    comments = [c for c in comments if c["updated_at"] >= since]
+                    items = comments[(page - 1) * per_page:page * per_page]
+                    self._send_json(items, False)
+                else:
+                    self.send_error(404)
+
+            def _send_json(self, payload, has_next):
+                body = json.dumps(payload).encode()
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+                if self.headers.get("If-None-Match") == etag:
+                    with mock._lock:
+                        mock.not_modified_count += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self._send_rate_limit_headers()
+                    self.end_headers()
+                    return
+
+                with mock._lock:
+                    exhausted = mock.remaining == 0
+                    if exhausted:
+                        mock.rate_limited_count += 1
+                    else:
+                        mock.remaining -= 1
+
+                if exhausted:
+                    self.send_response(403)
+                    self.send_header("Content-Length", "0")
+                    self._send_rate_limit_headers()
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self._send_rate_limit_headers()
+                if has_next:
+                    parsed = urlparse(self.path)
+                    params = parse_qs(parsed.query)
+                    params["page"] = [str(int(params.get("page", ["1"])[0]) + 1)]
+                    query = urlencode({key: values[0] for key, values in params.items()})
+                    self.send_header("Link", f'<{mock.url}{parsed.path}?{query}>; rel="next"')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_rate_limit_headers(self):
+                self.send_header("X-RateLimit-Limit", str(mock.rate_limit))
+                self.send_header("X-RateLimit-Remaining", str(mock.remaining))
+                # Rounded up, so a client waiting until the reset never comes back early.
+                self.send_header("X-RateLimit-Reset", str(math.ceil(mock.reset_at)))
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,198 @@
+from datetime import datetime, timezone
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import pyarrow as pa
+import sqlite3
+import threading
+
+
+class ResponseArchive:
+    """
+    Archive of the raw GitHub pages fetched by a `GitHubClient`, replayable without network.
+
+    Pages are kept as NDJSON records (`{"sha", "data", "links"}`), appended to an in-memory
+    segment that is zstd-compressed and written once it reaches `segment_size` bytes (or on
+    `close`) as `segments/<sha256 of the file>.ndjson.zst`, readable with `zstdcat`. Records
+    are content-addressed by the sha256 of their body: a page fetched again unchanged is not
+    stored twice. `index.sqlite` maps every request (path and sorted query string, without the
+    API host) to the sha of its latest body, and every sha to its segment and byte range.
+    Index rows are only committed with their segment, so an interrupted run never leaves
+    references to missing data.
+
+    With `replay=True`, the client answers every request from the archive and raises
+    `GitHubAPIError` for pages that were never archived, without touching the network.
+
+    Usage:
+        with ResponseArchive("archive/grafana") as archive:
+            client = GitHubClient(token, archive=archive)
+            issues = fetch_issues_from_query(query, client=client)
+
+        client = GitHubClient(archive=ResponseArchive("archive/grafana", replay=True))
+        issues = fetch_issues_from_query(query, client=client)
+
+    Parameters:
+        root (str or Path):
+            Directory of the archive, created if needed.
+        replay (bool, optional):
+            Serve pages from the archive instead of recording them.
+        segment_size (int, optional):
+            Uncompressed bytes buffered before a segment is written.
+        compression_level (int, optional):
+            zstd level of the segments.
+    """
+
+    def __init__(self, root, replay=False, segment_size=16 * 2 ** 20, compression_level=9):
+        self.root = Path(root)
+        self.replay = replay
+        self.segment_size = segment_size
+        self._codec = pa.Codec("zstd", compression_level=compression_level)
+
+        (self.root / "segments").mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(self.root / "index.sqlite", check_same_thread=False)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                key TEXT PRIMARY KEY,
+                sha TEXT,
+                fetched_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha TEXT PRIMARY KEY,
+                segment TEXT,
+                start INTEGER,
+                length INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+        self._db.commit()
+
+        # Records of the segment being filled, and their index rows.
+        self._buffer = bytearray()
+        self._pending_blobs = {}
+        self._pending_pages = {}
+        # Last decompressed segment, since a replay reads the pages in about the order they were written.
+        self._segment_name = None
+        self._segment = None
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns:
+            tuple:
+                `(data, links)` of the latest page archived for `key`, or None.
+        """
+        with self._lock:
+            sha = self._pending_pages.get(key, (None,))[0]
+            if sha is None:
+                row = self._db.execute("SELECT sha FROM pages WHERE key = ?;", (key,)).fetchone()
+                sha = row[0] if row else None
+
+            if sha is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            record = json.loads(self._read(sha))
+            return record["data"], record["links"]
+
+    def put(self, key, data, links):
+        """Archives the body and links of the page of `key`."""
+        body = json.dumps({"data": data, "links": links}, sort_keys=True, separators=(",", ":"))
+        sha = hashlib.sha256(body.encode()).hexdigest()
+        fetched_at = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        with self._lock:
+            if sha not in self._pending_blobs and not self._db.execute(
+                "SELECT 1 FROM blobs WHERE sha = ?;", (sha,)
+            ).fetchone():
+                line = f'{{"sha":"{sha}",{body[1:]}\n'.encode()
+                self._pending_blobs[sha] = (len(self._buffer), len(line))
+                self._buffer += line
+
+            self._pending_pages[key] = (sha, fetched_at)
+
+            if len(self._buffer) >= self.segment_size:
+                self.flush()
+
+    def search_end(self, query, now):
+        """
+        End of the `created:` range of a search (see `search_pager.iter_search_issues`):
+        `now` when recording, and the end recorded for the same query when replaying, so the
+        replayed windows have the same keys.
+        """
+        key = f"search_end:{query}"
+        with self._lock:
+            if not self.replay:
+                self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?);", (key, now.isoformat()))
+                self._db.commit()
+                return now
+
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?;", (key,)).fetchone()
+
+        return datetime.fromisoformat(row[0]) if row else now
+
+    def flush(self):
+        """Writes the buffered records as a segment and commits their index rows."""
+        with self._lock:
+            if self._buffer:
+                compressed = self._codec.compress(bytes(self._buffer), asbytes=True)
+                name = f"{hashlib.sha256(compressed).hexdigest()}.ndjson.zst"
+                path = self.root / "segments" / name
+
+                temporary = path.with_suffix(".tmp")
+                temporary.write_bytes(compressed)
+                os.replace(temporary, path)
+
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO blobs (sha, segment, start, length) VALUES (?, ?, ?, ?);",
+                    [(sha, name, start, length) for sha, (start, length) in self._pending_blobs.items()],
+                )
+                logging.info(f"Archived {len(self._pending_blobs)} pages in {name} ({len(compressed) / 2 ** 20:.1f} MiB)")
+
+            self._db.executemany(
+                "INSERT OR REPLACE INTO pages (key, sha, fetched_at) VALUES (?, ?, ?);",
+                [(key, sha, fetched_at) for key, (sha, fetched_at) in self._pending_pages.items()],
+            )
+            self._db.commit()
+
+            self._buffer = bytearray()
+            self._pending_blobs = {}
+            self._pending_pages = {}
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read(self, sha):
+        if sha in self._pending_blobs:
+            start, length = self._pending_blobs[sha]
+            return bytes(self._buffer[start:start + length])
+
+        segment, start, length = self._db.execute(
+            "SELECT segment, start, length FROM blobs WHERE sha = ?;", (sha,)
+        ).fetchone()
+
+        if segment != self._segment_name:
+            with pa.CompressedInputStream(pa.OSFile(str(self.root / "segments" / segment)), "zstd") as stream:
+                self._segment = stream.read()
+            self._segment_name = segment
+
+        return self._segment[start:start + length]
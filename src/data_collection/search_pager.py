@@ -0,0 +1,159 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta, timezone
+from github_client import get_default_client
+import logging
+import re
+
+
+# The search API serves at most this many results per query, whatever the page size.
+SEARCH_LIMIT = 1000
+
+# Oldest `created:` date worth searching (GitHub's launch).
+EPOCH = datetime(2008, 1, 1, tzinfo=timezone.utc)
+
+_CREATED = re.compile(r"\bcreated:")
+
+
+def slim_issue(issue):
+    """Keeps the fields of a search result that the collectors save (see `bulk_ingest.issue_rows`)."""
+    return {
+        "id": issue["id"],
+        "number": issue["number"],
+        "title": issue["title"],
+        "body": issue["body"],
+        "state": issue["state"],
+        "created_at": issue["created_at"],
+        "updated_at": issue["updated_at"],
+        "closed_at": issue["closed_at"],
+        "user": {"login": (issue.get("user") or {}).get("login")},
+        "html_url": issue["html_url"],
+    }
+
+
+def _timestamp(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _window_query(query, window):
+    if window is None:
+        return query
+    start, end = window
+    return f"{query} created:{_timestamp(start)}..{_timestamp(end)}"
+
+
+def fetch_window(client, query, window, per_page=100, use_cache=False):
+    """
+    Fetches the issues of one `created:` window, or tells that it must be split.
+
+    The first page doubles as the count: when the window holds more than `SEARCH_LIMIT`
+    results and is longer than a second, no other page is fetched.
+
+    Returns:
+        tuple:
+            `(halves, None)` when the window must be split, else `(None, issues)` with
+            the slimmed issues of the window.
+    """
+    params = {"q": _window_query(query, window), "per_page": per_page, "page": 1}
+    page = client.get("/search/issues", params=params, use_cache=use_cache)
+    total = page.data.get("total_count", 0)
+
+    if total > SEARCH_LIMIT and window is not None:
+        start, end = window
+        if end > start:
+            middle = start + (end - start) / 2
+            middle = middle.replace(microsecond=0)
+            return [(start, middle), (middle + timedelta(seconds=1), end)], None
+
+        logging.warning(f"{total} issues created at {_timestamp(start)}, only the first {SEARCH_LIMIT} are served.")
+
+    if total > SEARCH_LIMIT and window is None:
+        logging.warning(f"{total} issues match a query with its own created: qualifier, only {SEARCH_LIMIT} are served.")
+
+    issues = [slim_issue(issue) for issue in page.data.get("items", [])]
+    while "next" in page.links and params["page"] * per_page < SEARCH_LIMIT:
+        params["page"] += 1
+        page = client.get("/search/issues", params=params, use_cache=use_cache)
+        issues.extend(slim_issue(issue) for issue in page.data.get("items", []))
+
+    return None, issues
+
+
+def iter_search_issues(
+    query, token=None, client=None, max_workers=4, per_page=100, start=None, end=None, use_cache=False
+):
+    """
+    Streams every issue matching a search query, beyond the 1,000 results the search API serves.
+
+    The query is run over `created:` windows, bisected until each holds at most
+    `SEARCH_LIMIT` results, and up to `max_workers` windows are fetched at the same time.
+    Issues are yielded as slim records (`slim_issue`) as soon as their window is complete,
+    so memory holds at most `max_workers` windows, whatever the size of the release.
+    Windows are disjoint, so every issue is yielded once, in no particular order.
+
+    Parameters:
+        query (str):
+            Search query (ex.: 'repo:tensorflow/tensorflow is:issue is:closed label:"TF 2.18"').
+            A query with its own `created:` qualifier is paged as is.
+        token (str, optional):
+            GitHub token.
+        client (GitHubClient, optional):
+            Client used for the requests. Defaults to the shared client of `token`.
+        max_workers (int, optional):
+            Windows fetched at the same time.
+        per_page (int, optional):
+            Results per page (at most 100).
+        start (datetime, optional):
+            Oldest creation date searched. Defaults to `EPOCH`.
+        end (datetime, optional):
+            Newest creation date searched. Defaults to now, or to the date the query was
+            recorded when the client replays a `ResponseArchive`.
+        use_cache (bool, optional):
+            Keep the pages in the client's ETag cache. Off by default, since the cache
+            would hold every page of the crawl.
+
+    Yields:
+        dict:
+            Slimmed issues.
+
+    Raises:
+        GitHubAPIError:
+            If a page still fails after the client's retries.
+    """
+    client = client or get_default_client(token)
+
+    if _CREATED.search(query):
+        pending = [None]
+    else:
+        if end is None:
+            end = datetime.now(timezone.utc).replace(microsecond=0)
+            # A replayed crawl must search the same windows as the recorded one.
+            if getattr(client, "archive", None) is not None:
+                end = client.archive.search_end(query, end)
+        pending = [(start or EPOCH, end)]
+
+    count = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        try:
+            while pending or running:
+                while pending and len(running) < max_workers:
+                    window = pending.pop()
+                    future = executor.submit(fetch_window, client, query, window, per_page, use_cache)
+                    running[future] = window
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    halves, issues = future.result()
+
+                    if halves is not None:
+                        pending.extend(halves)
+                        continue
+
+                    count += len(issues)
+                    yield from issues
+        finally:
+            for future in running:
+                future.cancel()
+
+    logging.info(f"Number of collected issues: {count}")
@@ -0,0 +1,341 @@
+from pathlib import Path
+from pyarrow.fs import LocalFileSystem
+import bulk_ingest
+import logging
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+# Tables of each database layout: the collector's (`utils.save_issues_to_postgres`) and the
+# per-release tables read by the classification notebooks.
+SOURCES = bulk_ingest.LAYOUTS
+
+PARTITION_COLUMNS = ["repo", "release"]
+
+
+def _schemas():
+    timestamp = pa.timestamp("us")
+    partition = [("repo", pa.string()), ("release", pa.string())]
+
+    return {
+        "partitioning": pa.schema(partition),
+        "issues": pa.schema(partition + [
+            ("issue_id", pa.int64()),
+            ("title", pa.string()),
+            ("body", pa.string()),
+            ("state", pa.string()),
+            ("created_at", timestamp),
+            ("updated_at", timestamp),
+            ("closed_at", timestamp),
+            ("author", pa.string()),
+            ("url", pa.string()),
+        ]),
+        "comments": pa.schema(partition + [
+            ("comment_id", pa.int64()),
+            ("issue_id", pa.int64()),
+            ("author", pa.string()),
+            ("created_at", timestamp),
+            ("updated_at", timestamp),
+            ("body", pa.string()),
+        ]),
+        "sentiments": pa.schema(partition + [
+            ("comment_id", pa.int64()),
+            ("model", pa.string()),
+            ("label", pa.string()),
+            ("raw_label", pa.string()),
+            ("classified_at", timestamp),
+        ]),
+        "filters": pa.schema(partition + [
+            ("comment_id", pa.int64()),
+            ("rule", pa.string()),
+            ("action", pa.string()),
+            ("label", pa.string()),
+        ]),
+    }
+
+
+def _sentiment_columns(cursor, table):
+    cursor.execute(
+        """
+        SELECT attname
+        FROM pg_attribute
+        WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped AND attname LIKE 'sentiment\\_%%'
+        ORDER BY attnum;
+        """,
+        (table,)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _has_table(cursor, table):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (table,))
+    return cursor.fetchone()[0]
+
+
+def _export_query(source, dataset, sentiment_columns):
+    tables = SOURCES[source]
+
+    if dataset == "filters":
+        return f"""
+            SELECT
+                i.repo_name, i.{tables["release"]}, f.comment_id, f.rule, f.action, f.label
+            FROM
+                comment_filters f
+            JOIN
+                {tables["comments"]} c ON c.comment_id = f.comment_id
+            JOIN
+                {tables["issues"]} i ON i.issue_id = c.issue_id
+            ORDER BY
+                i.repo_name, i.{tables["release"]}, f.comment_id;
+        """
+
+    if dataset == "sentiments":
+        return f"""
+            SELECT
+                i.repo_name, i.{tables["release"]}, s.comment_id, s.model, s.label, s.raw_label, s.classified_at
+            FROM
+                comment_sentiments s
+            JOIN
+                {tables["comments"]} c ON c.comment_id = s.comment_id
+            JOIN
+                {tables["issues"]} i ON i.issue_id = c.issue_id
+            ORDER BY
+                i.repo_name, i.{tables["release"]}, s.comment_id, s.model;
+        """
+
+    if dataset == "issues":
+        return f"""
+            SELECT
+                repo_name, {tables["release"]}, issue_id, title, body, state,
+                created_at, updated_at, closed_at, author, url
+            FROM
+                {tables["issues"]}
+            ORDER BY
+                repo_name, {tables["release"]}, issue_id;
+        """
+
+    sentiments = "".join(f", c.{column}" for column in sentiment_columns)
+    return f"""
+        SELECT
+            i.repo_name, i.{tables["release"]}, c.comment_id, c.issue_id, c.author,
+            c.created_at, c.updated_at, c.body{sentiments}
+        FROM
+            {tables["comments"]} c
+        JOIN
+            {tables["issues"]} i ON i.issue_id = c.issue_id
+        ORDER BY
+            i.repo_name, i.{tables["release"]}, c.issue_id, c.created_at;
+    """
+
+
+def write_dataset(root, dataset, batches, schema, max_rows_per_group=64 * 1024):
+    """
+    Writes record batches to `root/dataset` as Parquet (zstd), partitioned by repo and release.
+
+    Partitions present in `batches` are replaced; the others are kept, so a snapshot can be
+    refreshed one release at a time.
+    """
+    options = ds.ParquetFileFormat().make_write_options(compression="zstd")
+
+    ds.write_dataset(
+        batches,
+        Path(root) / dataset,
+        schema=schema,
+        format="parquet",
+        file_options=options,
+        partitioning=PARTITION_COLUMNS,
+        partitioning_flavor="hive",
+        existing_data_behavior="delete_matching",
+        max_rows_per_group=max_rows_per_group,
+    )
+
+
+def export_snapshot(conn, root, source="release", chunk_size=10_000):
+    """
+    Snapshots the issues and comments of a database into a local Parquet dataset.
+
+    Each table is streamed through a named (server-side) cursor in chunks of `chunk_size`
+    and written to `root/issues` and `root/comments`, partitioned as `repo=.../release=...`.
+    The `sentiment_*` columns of the comments table are exported with the comments, and
+    the labels of `comment_sentiments` (every model, normalized) to `root/sentiments` and the
+    flags of `comment_rules` (`comment_filters`) to `root/filters`.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        root (str or Path):
+            Directory of the snapshot.
+        source (str, optional):
+            Key of `SOURCES`: 'release' for issues_from_release / issue_comments_from_release,
+            'collector' for issues / comments.
+        chunk_size (int, optional):
+            Rows per fetch and per record batch.
+
+    Returns:
+        dict:
+            Number of rows exported per dataset.
+    """
+    schemas = _schemas()
+    cursor = conn.cursor()
+    sentiment_columns = _sentiment_columns(cursor, SOURCES[source]["comments"])
+    tables = {"sentiments": "comment_sentiments", "filters": "comment_filters"}
+    datasets = ("issues", "comments") + tuple(
+        dataset for dataset, table in tables.items() if _has_table(cursor, table)
+    )
+    conn.commit()
+
+    exported = {}
+    for dataset in datasets:
+        schema = schemas[dataset]
+        if dataset == "comments":
+            for column in sentiment_columns:
+                schema = schema.append(pa.field(column, pa.string()))
+
+        stream = conn.cursor(name=f"snapshot_{dataset}")
+        stream.itersize = chunk_size
+        stream.execute(_export_query(source, dataset, sentiment_columns))
+
+        exported[dataset] = 0
+
+        def batches():
+            while True:
+                rows = stream.fetchmany(chunk_size)
+                if not rows:
+                    return
+                exported[dataset] += len(rows)
+                columns = list(zip(*rows))
+                yield pa.RecordBatch.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema
+                )
+
+        try:
+            write_dataset(root, dataset, batches(), schema)
+        finally:
+            stream.close()
+            conn.commit()
+
+        logging.info(f"{exported[dataset]} rows of {dataset} exported to {root}.")
+
+    return exported
+
+
+def _snapshot_field(field):
+    # Same types as the exported tables, so the schemas of all partitions can be unified.
+    if field.name in PARTITION_COLUMNS or pa.types.is_large_string(field.type) or pa.types.is_null(field.type):
+        return field.with_type(pa.string())
+    if pa.types.is_timestamp(field.type):
+        return field.with_type(pa.timestamp("us"))
+    return field
+
+
+def xlsx_to_snapshot(path, root, repo, release=None):
+    """
+    Adds one of the `data/issue_comments/*_data_issue_comments.xlsx` files to the
+    comments dataset of a snapshot, with proper types (ids as integers, dates as timestamps).
+
+    Parameters:
+        path (str or Path):
+            The xlsx file.
+        root (str or Path):
+            Directory of the snapshot.
+        repo (str):
+            Repository of the comments (ex.: 'tensorflow/tensorflow').
+        release (str, optional):
+            Release of the comments, if known.
+
+    Returns:
+        int:
+            Number of comments written.
+    """
+    frame = pd.read_excel(path)
+    frame.insert(0, "repo", repo)
+    frame.insert(1, "release", release)
+    for column in ("created_at", "updated_at"):
+        frame[column] = pd.to_datetime(frame[column])
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.cast(pa.schema([_snapshot_field(field) for field in table.schema]))
+
+    write_dataset(root, "comments", table.to_batches(), table.schema)
+
+    logging.info(f"{len(frame)} comments of {path} added to {root}.")
+
+    return len(frame)
+
+
+def open_dataset(root, dataset, memory_map=True):
+    """
+    Opens a dataset of a snapshot as a `pyarrow.dataset.Dataset`.
+
+    Files are memory-mapped, and partitions written with different columns (ex.: a release
+    classified by more models) are read with their unified schema.
+    """
+    path = str(Path(root).resolve() / dataset)
+    options = {
+        "format": "parquet",
+        "partitioning": ds.partitioning(_schemas()["partitioning"], flavor="hive"),
+        "filesystem": LocalFileSystem(use_mmap=memory_map),
+    }
+
+    discovered = ds.dataset(path, **options)
+    schema = pa.unify_schemas(
+        [fragment.physical_schema for fragment in discovered.get_fragments()] + [discovered.partitioning.schema]
+    )
+    return ds.dataset(path, schema=schema, **options)
+
+
+def load_snapshot(root, dataset, columns=None, filters=None, memory_map=True):
+    """
+    Loads a dataset of a snapshot into pandas, without a database connection.
+
+    Filters are pushed down: partitions of other repos and releases are not opened, and
+    row groups whose statistics exclude the predicate are skipped.
+
+    Parameters:
+        root (str or Path):
+            Directory of the snapshot.
+        dataset (str):
+            'issues' or 'comments'.
+        columns (list of str, optional):
+            Columns to read. Defaults to all.
+        filters (list of tuple, optional):
+            Predicates in the pyarrow/pandas format, ex.: `[("repo", "=", "tensorflow/tensorflow"),
+            ("release", "in", ["2.12", "2.13"])]`.
+        memory_map (bool, optional):
+            Memory-map the Parquet files.
+
+    Returns:
+        pandas.DataFrame
+    """
+    expression = pq.filters_to_expression(filters) if filters else None
+    table = open_dataset(root, dataset, memory_map).to_table(columns=columns, filter=expression)
+    return table.to_pandas()
+
+
+def restore_snapshot(conn, root, filters=None, upsert=False, chunk_size=5000):
+    """
+    Imports the issues and comments of a snapshot into the collector's `issues` and
+    `comments` tables, with `bulk_ingest.bulk_save`.
+
+    Returns:
+        dict:
+            Number of rows written per table.
+    """
+    expression = pq.filters_to_expression(filters) if filters else None
+
+    def rows(dataset, columns):
+        scanner = open_dataset(root, dataset).scanner(columns=columns, filter=expression, batch_size=chunk_size)
+        for batch in scanner.to_batches():
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+
+    issue_columns = ["repo" if column == "repo_name" else column for column in bulk_ingest.ISSUES["columns"]]
+
+    return {
+        "issues": bulk_ingest.bulk_save(conn, bulk_ingest.ISSUES, rows("issues", issue_columns), upsert, chunk_size),
+        "comments": bulk_ingest.bulk_save(
+            conn, bulk_ingest.COMMENTS, rows("comments", bulk_ingest.COMMENTS["columns"]), upsert, chunk_size
+        ),
+    }
@@ -1,255 +1,86 @@
-import requests
-import psycopg2
+from bulk_ingest import save_comments_bulk
+from collector import build_query, collect, run_pipeline
 from dotenv import load_dotenv
+from github_client import get_default_client
+from search_pager import iter_search_issues
 import os
+import sys
+import utils
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import db
 
 load_dotenv()
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
 
+REPO_OWNER = "tensorflow"
+REPO_NAME = "tensorflow"
+
+# Este script é um atalho para a coleta do TensorFlow nas tabelas por release
+# (issues_from_release / issue_comments_from_release). Equivale a:
+#
+#     python -m data_collection collect --repo tensorflow/tensorflow --label "TF 2.18" \
+#         --layout release --dbname tensorflow_data
+
 def fetch_issues_from_release(release_label, token=None, per_page=100):
     """
-    Busca issues na API do GitHub usando a query fornecida e retorna todas as issues encontradas.
+    Busca as issues fechadas do TensorFlow com o label da release e retorna todas as issues encontradas.
     
     Parâmetros:
-      - query (str): Query de busca (ex.: 'is:issue milestone:"October 2024 Recovery 2" is:closed')
+      - release_label (str): Label da release (ex.: '"TF 2.18"')
       - token (str, opcional): Token de acesso para autenticação na API do GitHub.
       - per_page (int, opcional): Número máximo de itens por página (padrão é 100).
     
     Retorna:
       - list: Lista com todas as issues coletadas.
     """
-    query = f'is:issue state:closed label:{release_label}'
-
-    if not query:
-        print("Nenhuma query fornecida.")
-        return []
-
-    url_api = f"https://api.github.com/search/issues?q={query}"
-    print(url_api)
-    params = {
-        'per_page': per_page,
-        'page': 1
-    }
-    headers = {'Authorization': f'token {token}'} if token else {}
-
-    all_issues = []
-    while True:
-        response = requests.get(url_api, headers=headers, params=params)
-        if response.status_code != 200:
-            print(f"Erro na requisição: {response.status_code} - {response.text}")
-            break
+    query = build_query(f"{REPO_OWNER}/{REPO_NAME}", label=release_label)
 
-        data = response.json()
-        issues = data.get('items', [])
-        all_issues.extend(issues)
-
-        # Verifica se há próxima página pela presença do link 'next'
-        if 'next' not in response.links:
-            break
-
-        params['page'] += 1
+    all_issues = list(iter_search_issues(query, token=token or GITHUB_TOKEN, per_page=per_page))
 
     print(f"Total de issues coletadas: {len(all_issues)}")
     return all_issues
 
 def dump_github_issues_from_release(release_label, github_token=None, per_page=100):
     """
-    Realiza o dump das issues do GitHub de acordo com a query informada.
-    
-    Parâmetros:
-      - query (str): A query de busca (ex.: 'is:issue milestone:"October 2024 Recovery 2" is:closed')
-      - github_token (str, opcional): Token de acesso para autenticação na API do GitHub.
-      - per_page (int, opcional): Número de itens por página (padrão 100).
-    
-    Retorna:
-      - all_issues (list): Lista com todas as issues coletadas.
+    Mesmo que `fetch_issues_from_release`, mantido para os scripts que já o usam.
     """
-    headers = {'Authorization': f'token {github_token}'} if github_token else {}
-
-    query = f'is:issue state:closed label:{release_label}'
-
-    url = 'https://api.github.com/search/issues'
-    params = {
-        'q': query,
-        'per_page': per_page,
-        'page': 1
-    }
-
-    all_issues = []
-
-    while True:
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code != 200:
-            print(f"Erro na requisição: {response.status_code}")
-            print(response.text)
-            break
-
-        data = response.json()
-        issues = data.get('items', [])
-        all_issues.extend(issues)
-
-        # Verifica se há mais páginas pela presença do link 'next'
-        if 'next' not in response.links:
-            break
-
-        params['page'] += 1
-
-    print(f"Total de issues coletadas: {len(all_issues)}")
-    return all_issues
+    return fetch_issues_from_release(release_label, github_token, per_page)
 
 # Função para buscar comentários de uma issue
 def fetch_comments_for_issue(repo_owner, repo_name, issue_number):
-    headers = {"Authorization": f"Bearer {GITHUB_TOKEN}"}
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/issues/{issue_number}/comments"
-    params = {"per_page": 100, "page": 1}
-
-    comments = []
-    while True:
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code != 200:
-            print(f"Erro ao buscar comentários da issue #{issue_number}: {response.status_code}")
-            break
-
-        data = response.json()
-        if not data:
-            break
-
-        comments.extend(data)
-        params["page"] += 1
-
-    return comments
+    return utils.fetch_comments_for_issue(
+        issue_number, repo_owner, repo_name, client=get_default_client(GITHUB_TOKEN)
+    )
 
 # Função para salvar comentários no PostgreSQL
 def save_comments_to_postgres(conn, issue_id, comments):
     try:
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS issue_comments_from_release (
-            comment_id BIGINT PRIMARY KEY,
-            issue_id BIGINT,
-            body TEXT,
-            author TEXT,
-            created_at TIMESTAMP,
-            updated_at TIMESTAMP
-            );
-            """
-        )
-
-        for comment in comments:
-            print(f"Inserindo comentário {comment['id']}")
-
-            cursor.execute(
-                """
-                INSERT INTO issue_comments_from_release (comment_id, issue_id, body, author, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (comment_id) DO NOTHING;
-                """,
-                (
-                    comment["id"],
-                    issue_id,
-                    comment["body"],
-                    comment["user"]["login"],
-                    comment["created_at"],
-                    comment["updated_at"],
-                ),
-            )
-
-        conn.commit()
+        save_comments_bulk(conn, [(issue_id, comments)], layout="release")
         print(f"{len(comments)} comentários inseridos para a issue {issue_id}")
 
     except Exception as e:
         print(f"Erro ao salvar comentários: {e}")
 
 def save_issues_to_postgres(conn, issues, release_number, repo_owner, repo_name):
+    """
+    Salva as issues e busca e salva os comentários de cada uma, com o pipeline de
+    `collector.run_pipeline` (busca dos comentários em paralelo e escrita em lotes).
+    """
     try:
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS issues_from_release (
-                issue_id BIGINT PRIMARY KEY,
-                release_number TEXT,
-                title TEXT,
-                body TEXT,
-                state TEXT,
-                created_at TIMESTAMP,
-                updated_at TIMESTAMP,
-                closed_at TIMESTAMP,
-                author TEXT,
-                repo_name TEXT,
-                url TEXT
-            );
-            """
+        run_pipeline(
+            conn, issues, repo_owner, repo_name, release_number, token=GITHUB_TOKEN, layout="release"
         )
-
-        for i, issue in enumerate(issues):
-            issue_id = issue["id"]
-            issue_number = issue["number"]
-
-            print(f"Inserindo issue #{issue_number} --- {i + 1}/{len(issues)}")
-
-            # Salvar a issue
-            cursor.execute(
-                """
-                INSERT INTO issues_from_release (issue_id, release_number, title, body, state, created_at, updated_at, closed_at, author, repo_name, url)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (issue_id) DO NOTHING;
-                """,
-                (
-                    issue["id"],
-                    release_number,
-                    issue["title"],
-                    issue["body"],
-                    issue["state"],
-                    issue["created_at"],
-                    issue["updated_at"],
-                    issue["closed_at"],
-                    issue["user"]["login"],
-                    f"{repo_owner}/{repo_name}",
-                    issue["html_url"],  # URL da issue
-                ),
-            )
-
-            # Buscar e salvar os comentários da issue
-            comments = fetch_comments_for_issue(repo_owner, repo_name, issue_number)
-            save_comments_to_postgres(conn, issue_id, comments)
-
-        conn.commit()
-        print(f"{len(issues)} issues e seus comentários inseridos com sucesso.")
     except Exception as e:
         print(f"Erro ao salvar no PostgreSQL: {e}")
 
 if __name__ == "__main__":
-    # Coleta as informações do usuário
-    repo_owner = "tensorflow"
-    repo_name = "tensorflow"
     dbname = "tensorflow_data"
 
-    DATABASE_CONFIG = {
-        "dbname": dbname,
-        "user": "postgres",
-        "password": "YzLq4UAMQ7LOadXh",
-        "host": "humanely-winged-bluebird.data-1.use1.tembo.io",
-        "port": 5432,
-    }
-
     try:
-        # Conecta ao banco de dados
-        conn = psycopg2.connect(**DATABASE_CONFIG)
-        cursor = conn.cursor()
-
-
-        release_number = '"TF 2.18"'
-
-        issues = fetch_issues_from_release(release_number, GITHUB_TOKEN)
-
-        print(f"{len(issues)} issues fechadas encontradas.")
-        save_issues_to_postgres(conn, issues, release_number, repo_owner, repo_name)
+        # Conecta ao banco de dados (credenciais do ambiente/.env, ver src/db.py)
+        with db.connection(dbname) as conn:
+            collect(conn, REPO_OWNER, REPO_NAME, label="TF 2.18", token=GITHUB_TOKEN, layout="release")
 
     except Exception as e:
         print(f"Erro ao conectar ao banco de dados ou executar o processo: {e}")
-    finally:
-        if 'conn' in locals() and conn:
-            conn.close()
\ No newline at end of file
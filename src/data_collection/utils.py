@@ -1,81 +1,84 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from bulk_ingest import save_comments_bulk, save_issues_bulk
+from github_client import get_default_client
 from log_config import configure_logging
+from search_pager import iter_search_issues
 import logging
-import requests
 
 
 configure_logging()
 
 
-def fetch_issues_from_query(query, token=None, per_page=100):
+def fetch_issues_from_query(query, token=None, per_page=100, client=None):
     """
     Busca issues na API do GitHub usando a query fornecida e retorna todas as issues encontradas.
+
+    A busca é dividida em janelas de `created:` (ver `search_pager.iter_search_issues`),
+    então consultas com mais de 1.000 resultados não são truncadas.
     
     Parâmetros:
       - query (str): Query de busca (ex.: 'repo:microsoft/vscode is:issue is:closed milestone:"April 2025"')
       - token (str, opcional): Token de acesso para autenticação na API do GitHub.
       - per_page (int, opcional): Número máximo de itens por página (padrão é 100).
+      - client (GitHubClient, opcional): Cliente usado nas requisições (padrão: cliente compartilhado do token).
     
     Retorna:
-      - list: Lista com todas as issues coletadas.
+      - list: Lista com todas as issues coletadas, só com os campos salvos (`search_pager.slim_issue`).
+
+    Levanta:
+      - GitHubAPIError: Se uma página falhar mesmo após as novas tentativas.
     """
     if not query:
         logging.error("No query received.")
         return []
 
-    url_api = f"https://api.github.com/search/issues?q={query}"
-    
-    params = {
-        'per_page': per_page,
-        'page': 1
-    }
-
-    headers = {'Authorization': f'token {token}'} if token else {}
-
-    issues = []
-    while True:
-        response = requests.get(url_api, headers=headers, params=params)
-
-        if response.status_code != 200:
-            logging.error(f"Error with the request: {response.status_code} - {response.text}")
-            break
+    client = client or get_default_client(token)
 
-        data = response.json()
-
-        curr_issues = data.get('items', [])
-        
-        issues.extend(curr_issues)
+    return list(iter_search_issues(query, client=client, per_page=per_page))
 
-        if 'next' not in response.links:
-            break
 
-        params['page'] += 1
+def fetch_comments_for_issue(issue_number, repo_owner, repo_name, headers=None, client=None, since=None):
+    """
+    Fetches every comment of an issue, page by page, until an empty page is returned.
 
-    logging.info(f"Number of collected issues: {len(issues)}")
+    Parameters:
+        issue_number (int):
+            The number of the issue in the repository.
+        repo_owner (str):
+            The username or organization that owns the repository.
+        repo_name (str):
+            The name of the repository.
+        headers (dict, optional):
+            Extra headers sent with every request.
+        client (GitHubClient, optional):
+            Client used for the requests. Defaults to the shared anonymous client.
+        since (str, optional):
+            ISO 8601 timestamp; only comments updated at or after it are returned.
 
-    return issues
+    Returns:
+        list of dict:
+            The comments as returned by the GitHub API.
 
+    Raises:
+        GitHubAPIError:
+            If a page still fails after the client's retries.
+    """
+    client = client or get_default_client()
 
-def fetch_comments_for_issue(issue_number, repo_owner, repo_name, headers):
-    url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/issues/{issue_number}/comments"
+    url = f"/repos/{repo_owner}/{repo_name}/issues/{issue_number}/comments"
     params = {"per_page": 100, "page": 1}
+    if since:
+        params["since"] = since
     
     comments = []
     while True:
-        response = requests.get(url, headers=headers, params=params)
+        page = client.get(url, params=params, headers=headers)
 
-        if response.status_code != 200:
-            logging.error(
-                "Error when fetching comments for issue"
-                f" #{issue_number}: {response.status_code}"
-            )
+        if not page.data:
             break
 
-        data = response.json()
-
-        if not data:
-            break
-
-        comments.extend(data)
+        comments.extend(page.data)
 
         params["page"] += 1
     
@@ -86,7 +89,7 @@ def fetch_comments_for_issue(issue_number, repo_owner, repo_name, headers):
     return comments
 
 
-def fetch_and_save_comments_for_issues(issues, repo_owner, repo_name, conn, token=None):
+def fetch_and_save_comments_for_issues(issues, repo_owner, repo_name, conn, token=None, client=None):
     """
     Fetches and saves all comments for the given issue by iterating through paginated API results.
 
@@ -103,12 +106,14 @@ def fetch_and_save_comments_for_issues(issues, repo_owner, repo_name, conn, toke
             The name of the repository.
         token (str):
             GitHub token.
+        client (GitHubClient, optional):
+            Client used for the requests. Defaults to the shared client of `token`.
 
     Returns:
         list of dict:
             A list of comment objects as returned by the GitHub API. Each dict represents one comment.
     """
-    headers = {"Authorization": f"Bearer {token}"}
+    client = client or get_default_client(token)
 
     for i, issue in enumerate(issues):
         issue_number = issue['number']
@@ -122,7 +127,7 @@ def fetch_and_save_comments_for_issues(issues, repo_owner, repo_name, conn, toke
             issue_number=issue_number,
             repo_owner=repo_owner,
             repo_name=repo_name,
-            headers=headers
+            client=client
         )
 
         logging.info(
@@ -142,124 +147,200 @@ def fetch_and_save_comments_for_issues(issues, repo_owner, repo_name, conn, toke
     logging.info(f"Finished fetching and saving all of the comments.")
 
 
-def save_comments_to_postgres(conn, issue_id, comments):
+def fetch_and_save_comments_for_issues_concurrently(
+    issues, repo_owner, repo_name, conn, token=None, max_workers=8, batch_size=50, client=None,
+    since=None, upsert=False, writer=None
+):
+    """
+    Concurrent version of `fetch_and_save_comments_for_issues`.
+
+    Up to `max_workers` issues have their comments fetched at the same time by a
+    thread pool, while the calling thread acts as the single database writer:
+    it consumes the fetched comments in the original issue order and saves them
+    in batches of `batch_size` issues (one commit per batch). The rows written are
+    the same as in the serial path, and every committed batch is kept even if the
+    run is interrupted.
+
+    Parameters:
+        issues (list):
+            List of issues.
+        repo_owner (str):
+            The username or organization that owns the repository.
+        repo_name (str):
+            The name of the repository.
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection. Only used by the calling thread.
+        token (str):
+            GitHub token.
+        max_workers (int):
+            Maximum number of issues being fetched at the same time.
+        batch_size (int):
+            Number of issues whose comments are written per transaction.
+        client (GitHubClient, optional):
+            Client used for the requests. Defaults to the shared client of `token`.
+        since (str, optional):
+            Only fetch comments updated at or after this ISO 8601 timestamp.
+        upsert (bool, optional):
+            Update comments that already exist instead of skipping them.
+        writer (callable, optional):
+            Called with each batch of `(issue_id, comments)` pairs and returning whether it
+            was saved. Defaults to `save_comment_batch_to_postgres` on `conn`.
+
+    Returns:
+        bool:
+            True if every batch was saved.
+    """
+    client = client or get_default_client(token)
+
+    if writer is None:
+        def writer(batch):
+            return save_comment_batch_to_postgres(conn, batch, upsert=upsert)
+
+    saved = True
+    in_flight = deque()
+    batch = []
+    issues_iter = iter(enumerate(issues))
+
+    def submit_next(executor):
+        for i, issue in issues_iter:
+            future = executor.submit(
+                fetch_comments_for_issue,
+                issue_number=issue['number'],
+                repo_owner=repo_owner,
+                repo_name=repo_name,
+                client=client,
+                since=since
+            )
+            in_flight.append((i, issue, future))
+            return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for _ in range(max_workers):
+                submit_next(executor)
+
+            while in_flight:
+                i, issue, future = in_flight.popleft()
+                comments = future.result()
+                submit_next(executor)
+
+                batch.append((issue['id'], comments))
+
+                if len(batch) >= batch_size:
+                    saved &= writer(batch)
+                    batch = []
+                    logging.info(
+                        f"Finished issue #{issue['number']} --- {i + 1}/{len(issues)}"
+                    )
+        finally:
+            for _, _, future in in_flight:
+                future.cancel()
+
+            if batch:
+                saved &= writer(batch)
+
+    logging.info(f"Finished fetching and saving all of the comments.")
+
+    return saved
+
+
+def save_comments_to_postgres(conn, issue_id, comments, upsert=False):
     """
     Saves a list of GitHub issue comments into a PostgreSQL database.
 
-    This function ensures the target table `comments` exists,
-    then inserts each comment into the table. If a comment with the same `comment_id`
-    already exists, it will be skipped (avoiding duplicate entries via `ON CONFLICT DO NOTHING`).
+    The comments are written with the bulk `COPY` path of `bulk_ingest`, which creates
+    the `comments` table once per connection. If a comment with the same `comment_id`
+    already exists, it is skipped, or updated when `upsert` is set and it changed.
 
     Parameters:
-        conn (psycopg2.connection):
+        conn (psycopg2.connection or psycopg.Connection):
             An active PostgreSQL database connection.
         issue_id (int):
             The ID of the GitHub issue associated with the comments.
         comments (list of dict):
             A list of comment dictionaries, typically retrieved from the GitHub API.
             Each comment must include 'id', 'body', 'user' (with 'login'), 'created_at', and 'updated_at'.
+        upsert (bool, optional):
+            Update comments that already exist (and changed) instead of skipping them.
+
+    Returns:
+        bool:
+            True if the comments were saved.
     """
-    try:
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS comments (
-            comment_id BIGINT PRIMARY KEY,
-            issue_id BIGINT,
-            body TEXT,
-            author TEXT,
-            created_at TIMESTAMP,
-            updated_at TIMESTAMP
-            );
-            """
+    saved = save_comment_batch_to_postgres(conn, [(issue_id, comments)], upsert=upsert)
+
+    if saved:
+        logging.info(
+            f"  {len(comments)} comments inserted for issue {issue_id}"
         )
 
-        for i, comment in enumerate(comments):
-            logging.info(
-                f"  Inserting comment {comment['id']}"
-                f" --- {i + 1}/{len(comments)}"
-            )
+    return saved
 
-            cursor.execute(
-                """
-                INSERT INTO comments (comment_id, issue_id, body, author, created_at, updated_at)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                ON CONFLICT (comment_id) DO NOTHING;
-                """,
-                (
-                    comment["id"],
-                    issue_id,
-                    comment["body"],
-                    comment["user"]["login"],
-                    comment["created_at"],
-                    comment["updated_at"],
-                ),
-            )
 
-        conn.commit()
+def save_comment_batch_to_postgres(conn, batch, upsert=False):
+    """
+    Saves the comments of several issues into the `comments` table with the bulk
+    `COPY` path of `bulk_ingest`, in a single transaction.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        batch (list of tuple):
+            List of `(issue_id, comments)` pairs, where `comments` is the list of
+            comment dictionaries returned by `fetch_comments_for_issue`.
+        upsert (bool, optional):
+            Update comments that already exist (and changed) instead of skipping them.
+
+    Returns:
+        bool:
+            True if the batch was saved. On failure, the transaction is rolled back.
+    """
+    try:
+        save_comments_bulk(conn, batch, upsert=upsert, chunk_size=max(1, sum(len(c) for _, c in batch)))
 
         logging.info(
-            f"  {len(comments)} comments inserted for issue {issue_id}"
+            f"  Comments of {len(batch)} issues saved"
         )
 
+        return True
+
     except Exception as e:
+        conn.rollback()
         logging.error(f"Error when saving the comments: {e}")
+        return False
 
 
-def save_issues_to_postgres(conn, issues, release_id, repo_owner, repo_name):
-    try:
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS issues (
-                issue_id BIGINT PRIMARY KEY,
-                release TEXT,
-                title TEXT,
-                body TEXT,
-                state TEXT,
-                created_at TIMESTAMP,
-                updated_at TIMESTAMP,
-                closed_at TIMESTAMP,
-                author TEXT,
-                repo_name TEXT,
-                url TEXT
-            );
-            """
-        )
+def save_issues_to_postgres(conn, issues, release_id, repo_owner, repo_name, upsert=False):
+    """
+    Saves a list of GitHub issues into the `issues` table, with the bulk `COPY` path
+    of `bulk_ingest`. The table is created once per connection.
 
-        for i, issue in enumerate(issues):
-            issue_id = issue["id"]
-            issue_number = issue["number"]
-
-            logging.info(f"Inserting issue #{issue_number} --- {i + 1}/{len(issues)}")
-
-            # Salvar a issue
-            cursor.execute(
-                """
-                INSERT INTO issues (issue_id, release, title, body, state, created_at, updated_at, closed_at, author, repo_name, url)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (issue_id) DO NOTHING;
-                """,
-                (
-                    issue["id"],
-                    release_id,
-                    issue["title"],
-                    issue["body"],
-                    issue["state"],
-                    issue["created_at"],
-                    issue["updated_at"],
-                    issue["closed_at"],
-                    issue["user"]["login"],
-                    f"{repo_owner}/{repo_name}",
-                    issue["html_url"],  # URL da issue
-                ),
-            )
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        issues (list of dict):
+            Issues as returned by the GitHub search API.
+        release_id (str):
+            Release (milestone or label) the issues belong to.
+        repo_owner (str):
+            The username or organization that owns the repository.
+        repo_name (str):
+            The name of the repository.
+        upsert (bool, optional):
+            Update issues that already exist (and changed) instead of skipping them.
 
-        conn.commit()
+    Returns:
+        bool:
+            True if the issues were saved.
+    """
+    try:
+        save_issues_bulk(conn, issues, release_id, repo_owner, repo_name, upsert=upsert)
 
         logging.info("Issues successfully inserted.")
+
+        return True
         
     except Exception as e:
+        conn.rollback()
         logging.error(f"Error when saving the issues: {e}")
+        return False
@@ -0,0 +1,348 @@
+from labels import LABELS
+from pathlib import Path
+from sentiment_store import LEGACY_COLUMNS, existing_legacy_columns
+import hashlib
+import json
+import logging
+import pandas as pd
+import re
+
+
+SENTIMENTS = list(LABELS)
+
+# Time buckets: PostgreSQL `date_trunc` unit -> pandas period.
+BUCKETS = {"day": "D", "week": "W-SUN", "month": "M"}
+
+GROUP_COLUMNS = ["repo", "release", "model"]
+
+
+def release_sort_key(release):
+    """Orders releases by version ('v2.9' before '2.12') instead of alphabetically."""
+    return tuple(int(number) for number in re.findall(r"\d+", str(release)))
+
+
+def _sort(counts):
+    if counts.empty:
+        return counts
+
+    levels = list(counts.index.names)
+    keys = counts.index.to_frame(index=False)
+    keys["release"] = keys["release"].map(release_sort_key)
+    order = keys.sort_values(levels, kind="stable").index
+    return counts.iloc[order]
+
+
+def _wide(long, bucket):
+    """Pivots `(repo, release, model[, bucket], label, count)` rows into one column per label."""
+    index = GROUP_COLUMNS + (["bucket"] if bucket else [])
+
+    if long.empty:
+        return pd.DataFrame(columns=SENTIMENTS, index=pd.MultiIndex.from_tuples([], names=index), dtype="int64")
+
+    counts = long.pivot_table(index=index, columns="label", values="count", aggfunc="sum", fill_value=0)
+    counts = counts.reindex(columns=SENTIMENTS + sorted(set(counts.columns) - set(SENTIMENTS)), fill_value=0)
+    counts.columns.name = None
+    return _sort(counts.astype("int64"))
+
+
+def _has_table(cursor, table):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL;", (table,))
+    return cursor.fetchone()[0]
+
+
+def count_labels_sql(conn, bucket=None):
+    """
+    Counts the labels per repo, release and model (and time bucket) with one grouped query.
+
+    Labels come from `comment_sentiments` and, for comments labelled before it existed,
+    from the per-model columns of `issue_comments_from_release`. Comments excluded by
+    `comment_rules` (bots, "+1" comments) are left out, even if they were labelled before.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        bucket (str, optional):
+            'day', 'week' or 'month' to also group by the comment date.
+
+    Returns:
+        pandas.DataFrame:
+            Indexed by repo, release, model (and bucket), one column per label.
+    """
+    cursor = conn.cursor()
+    legacy = existing_legacy_columns(cursor)
+    has_table = _has_table(cursor, "comment_sentiments")
+
+    sources = []
+    params = []
+    if has_table:
+        sources.append("SELECT comment_id, model, label FROM comment_sentiments")
+
+    if legacy:
+        values = ", ".join(f"(%s, c.{column})" for column in legacy.values())
+        params.extend(legacy)
+        missing = (
+            """
+            AND NOT EXISTS (
+                SELECT 1 FROM comment_sentiments s
+                WHERE s.comment_id = c.comment_id AND s.model = legacy.model
+            )
+            """
+            if has_table else ""
+        )
+        sources.append(
+            f"""
+            SELECT c.comment_id, legacy.model, legacy.label
+            FROM issue_comments_from_release c
+            CROSS JOIN LATERAL (VALUES {values}) AS legacy (model, label)
+            WHERE legacy.label IS NOT NULL {missing}
+            """
+        )
+
+    columns = ["repo", "release", "model"] + (["bucket"] if bucket else []) + ["label", "count"]
+
+    if not sources:
+        conn.commit()
+        return _wide(pd.DataFrame(columns=columns), bucket)
+
+    bucket_column = ""
+    if bucket:
+        bucket_column = "date_trunc(%s, c.created_at),"
+        params.append(bucket)
+
+    excluded = ""
+    if _has_table(cursor, "comment_filters"):
+        excluded = """
+            WHERE NOT EXISTS (
+                SELECT 1 FROM comment_filters f
+                WHERE f.comment_id = l.comment_id AND f.action = 'exclude'
+            )
+        """
+
+    labels = " UNION ALL ".join(sources)
+    cursor.execute(
+        f"""
+        WITH labels AS ({labels})
+        SELECT
+            i.repo_name,
+            i.release_number,
+            l.model,
+            {bucket_column}
+            lower(trim(l.label)),
+            COUNT(*)
+        FROM
+            labels l
+        JOIN
+            issue_comments_from_release c ON c.comment_id = l.comment_id
+        JOIN
+            issues_from_release i ON i.issue_id = c.issue_id
+        {excluded}
+        GROUP BY
+            {", ".join(str(position) for position in range(1, len(columns)))};
+        """,
+        params
+    )
+    long = pd.DataFrame(cursor.fetchall(), columns=columns)
+    conn.commit()
+
+    return _wide(long, bucket)
+
+
+def _open_snapshot(root, dataset):
+    """Opens a dataset of a snapshot with the schema unified across its partitions, or None if missing."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow.fs import LocalFileSystem
+
+    path = Path(root).resolve() / dataset
+    if not path.exists():
+        return None
+
+    options = {
+        "format": "parquet",
+        "partitioning": ds.partitioning(pa.schema([("repo", pa.string()), ("release", pa.string())]), flavor="hive"),
+        "filesystem": LocalFileSystem(use_mmap=True),
+    }
+
+    # Partitions may have different sentiment columns (ex.: a release classified by more models).
+    discovered = ds.dataset(str(path), **options)
+    schema = pa.unify_schemas(
+        [fragment.physical_schema for fragment in discovered.get_fragments()] + [discovered.partitioning.schema]
+    )
+    return ds.dataset(str(path), schema=schema, **options)
+
+
+def count_labels_snapshot(root, bucket=None, filters=None):
+    """
+    Counts the labels of a Parquet snapshot (see data_collection/snapshot.py) with a
+    vectorized pandas groupby, reading only the columns it needs.
+
+    As in `count_labels_sql`, labels come from the `sentiments` dataset (the exported
+    `comment_sentiments`) and, for the comments and models missing there, from the
+    `sentiment_*` columns of the comments; comments flagged 'exclude' in the `filters`
+    dataset are left out.
+
+    Parameters:
+        root (str or Path):
+            Directory of the snapshot.
+        bucket (str, optional):
+            'day', 'week' or 'month' to also group by the comment date.
+        filters (list of tuple, optional):
+            Predicates pushed down to the snapshot, ex.: `[("repo", "=", "tensorflow/tensorflow")]`.
+
+    Returns:
+        pandas.DataFrame:
+            Same layout as `count_labels_sql`.
+    """
+    import pyarrow.parquet as pq
+
+    expression = pq.filters_to_expression(filters) if filters else None
+    comment_columns = ["repo", "release", "comment_id"] + (["created_at"] if bucket else [])
+
+    comments = _open_snapshot(root, "comments")
+    sentiments = _open_snapshot(root, "sentiments")
+    filters_dataset = _open_snapshot(root, "filters")
+    sentiment_columns = [name for name in comments.schema.names if name.startswith("sentiment_")]
+
+    frame = comments.to_table(columns=comment_columns + sentiment_columns, filter=expression).to_pandas()
+
+    if filters_dataset is not None:
+        flags = filters_dataset.to_table(columns=["comment_id", "action"], filter=expression).to_pandas()
+        frame = frame[~frame["comment_id"].isin(flags.loc[flags["action"] == "exclude", "comment_id"])]
+
+    long = frame.melt(id_vars=comment_columns, value_vars=sentiment_columns, var_name="model", value_name="label")
+    models = {column: model for model, column in LEGACY_COLUMNS.items()}
+    long["model"] = long["model"].map(lambda column: models.get(column, column.removeprefix("sentiment_")))
+
+    if sentiments is not None:
+        normalized = sentiments.to_table(
+            columns=["repo", "release", "comment_id", "model", "label"], filter=expression
+        ).to_pandas()
+        normalized = normalized.merge(frame[comment_columns], on=["repo", "release", "comment_id"])
+
+        # A label of `comment_sentiments` replaces the legacy column of the same comment and model.
+        legacy = long.merge(
+            normalized[["comment_id", "model"]], on=["comment_id", "model"], how="left", indicator=True
+        )
+        long = pd.concat([legacy[legacy["_merge"] == "left_only"].drop(columns="_merge"), normalized])
+
+    long = long.dropna(subset=["label"])
+    if long.empty:
+        columns = GROUP_COLUMNS + (["bucket"] if bucket else []) + ["label", "count"]
+        return _wide(pd.DataFrame(columns=columns), bucket)
+
+    long["label"] = long["label"].str.strip().str.lower()
+
+    if bucket:
+        long["bucket"] = long["created_at"].dt.to_period(BUCKETS[bucket]).dt.start_time
+
+    long = long.groupby(GROUP_COLUMNS + (["bucket"] if bucket else []) + ["label"], observed=True).size()
+    return _wide(long.rename("count").reset_index(), bucket)
+
+
+def database_version(conn):
+    """
+    Cheap fingerprint of the labels in the database: size and last write of
+    `comment_sentiments` and `comment_filters`, and the write counters of the tables
+    the counts are read from.
+    """
+    cursor = conn.cursor()
+    version = []
+
+    if _has_table(cursor, "comment_sentiments"):
+        cursor.execute("SELECT COUNT(*), MAX(classified_at)::text FROM comment_sentiments;")
+        version.append(list(cursor.fetchone()))
+
+    if _has_table(cursor, "comment_filters"):
+        cursor.execute("SELECT COUNT(*), MAX(filtered_at)::text FROM comment_filters;")
+        version.append(list(cursor.fetchone()))
+
+    # Other sessions' writes show up in the statistics once they flush them (within a second or so).
+    cursor.execute("SELECT pg_stat_clear_snapshot();")
+    cursor.execute(
+        """
+        SELECT relname, n_tup_ins, n_tup_upd, n_tup_del
+        FROM pg_stat_user_tables
+        WHERE relid IN (
+            to_regclass('issues_from_release'),
+            to_regclass('issue_comments_from_release'),
+            to_regclass('comment_sentiments'),
+            to_regclass('comment_filters')
+        )
+        ORDER BY relname;
+        """
+    )
+    version.extend(list(row) for row in cursor.fetchall())
+    conn.commit()
+
+    return version
+
+
+def snapshot_version(root):
+    """Fingerprint of a Parquet snapshot: path, size and modification time of its comment, label and filter files."""
+    files = sorted(
+        path
+        for dataset in ("comments", "sentiments", "filters")
+        for path in (Path(root) / dataset).rglob("*.parquet")
+    )
+    return [[str(path.relative_to(root)), path.stat().st_size, path.stat().st_mtime_ns] for path in files]
+
+
+def sentiment_counts(source, bucket=None, filters=None, cache_dir=".aggregation_cache"):
+    """
+    Label counts per repo, release and model (and time bucket), cached per dataset version.
+
+    The counts are recomputed only when the labels change: the cache key combines the
+    parameters with a fingerprint of the source (`database_version` or `snapshot_version`),
+    and cached results are kept as Parquet files in `cache_dir`.
+
+    Parameters:
+        source (connection, str or Path):
+            An active PostgreSQL connection, or the directory of a Parquet snapshot.
+        bucket (str, optional):
+            'day', 'week' or 'month' to also group by the comment date.
+        filters (list of tuple, optional):
+            Predicates for a snapshot source (ignored for a database).
+        cache_dir (str or Path, optional):
+            Directory of the cached results. None disables the cache.
+
+    Returns:
+        pandas.DataFrame:
+            Indexed by repo, release, model (and bucket), with `negative`, `neutral` and
+            `positive` columns (plus any other label found).
+    """
+    is_snapshot = isinstance(source, (str, Path))
+
+    if is_snapshot:
+        version = ["snapshot", str(Path(source).resolve()), snapshot_version(source), filters]
+    else:
+        dsn = getattr(source, "dsn", None) or source.info.dsn
+        version = ["database", dsn, database_version(source)]
+
+    key = hashlib.sha256(json.dumps([version, bucket], default=str).encode()).hexdigest()[:16]
+    cache_path = Path(cache_dir) / f"counts-{key}.parquet" if cache_dir else None
+
+    if cache_path and cache_path.exists():
+        logging.info(f"Sentiment counts loaded from {cache_path}.")
+        return pd.read_parquet(cache_path)
+
+    if is_snapshot:
+        counts = count_labels_snapshot(source, bucket, filters)
+    else:
+        counts = count_labels_sql(source, bucket)
+
+    if cache_path:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        counts.to_parquet(cache_path)
+
+    return counts
+
+
+def release_series(counts, repo, model):
+    """
+    Per-release counts of one repo and model, in release order, ready for a grouped bar chart.
+
+    Returns:
+        pandas.DataFrame:
+            Indexed by release, with one column per label.
+    """
+    return counts.xs((repo, model), level=("repo", "model"))
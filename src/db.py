@@ -0,0 +1,278 @@
+"""
+Database access shared by the collection, preprocessing and classification code.
+
+Settings come from the environment (and a `.env` file, through python-dotenv):
+`DATABASE_URL`, or the libpq variables `PGHOST`, `PGPORT`, `PGDATABASE`, `PGUSER`,
+`PGPASSWORD` and `PGSSLMODE`. Connections are psycopg (3) connections from a
+`psycopg_pool.ConnectionPool`, so notebooks, scripts and their worker threads reuse
+open connections instead of paying a new TLS handshake to the remote host each time.
+
+Notebooks and scripts of the package directories import it with
+`sys.path.append("..")`.
+"""
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import atexit
+import logging
+import os
+import threading
+import time
+
+
+SETTINGS = {
+    "host": "PGHOST",
+    "port": "PGPORT",
+    "dbname": "PGDATABASE",
+    "user": "PGUSER",
+    "password": "PGPASSWORD",
+    "sslmode": "PGSSLMODE",
+}
+
+# TCP keepalives, so idle pooled connections to the remote host are not dropped silently.
+KEEPALIVES = {"keepalives": 1, "keepalives_idle": 30, "keepalives_interval": 10, "keepalives_count": 3}
+
+_pools = {}
+_pools_lock = threading.Lock()
+_timing_hooks = []
+
+
+def load_settings(dbname=None):
+    """
+    Connection settings read from the environment, after loading `.env`.
+
+    Parameters:
+        dbname (str, optional):
+            Database to use instead of `PGDATABASE` (ex.: 'grafana_data_02').
+
+    Returns:
+        str:
+            A libpq connection string.
+    """
+    from psycopg.conninfo import make_conninfo
+
+    load_dotenv()
+
+    settings = {key: os.getenv(variable) for key, variable in SETTINGS.items() if os.getenv(variable)}
+    if dbname:
+        settings["dbname"] = dbname
+
+    return make_conninfo(os.getenv("DATABASE_URL", ""), **{**KEEPALIVES, **settings})
+
+
+def add_timing_hook(hook):
+    """
+    Registers `hook(statement, seconds)`, called after every statement run through a
+    cursor of a pooled connection (ex.: `log_slow_statements`, `StatementStats`).
+    """
+    _timing_hooks.append(hook)
+    return hook
+
+
+def remove_timing_hook(hook):
+    if hook in _timing_hooks:
+        _timing_hooks.remove(hook)
+
+
+def _timed(method):
+    def timed(self, query, *args, **kwargs):
+        # Empty statements are the pool's connection checks.
+        if not _timing_hooks or query == "":
+            return method(self, query, *args, **kwargs)
+
+        start = time.perf_counter()
+        try:
+            return method(self, query, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            for hook in list(_timing_hooks):
+                hook(query, elapsed)
+
+    return timed
+
+
+def _cursor_classes():
+    import psycopg
+
+    class TimedCursor(psycopg.Cursor):
+        execute = _timed(psycopg.Cursor.execute)
+        executemany = _timed(psycopg.Cursor.executemany)
+
+    class TimedServerCursor(psycopg.ServerCursor):
+        execute = _timed(psycopg.ServerCursor.execute)
+
+    return TimedCursor, TimedServerCursor
+
+
+def log_slow_statements(threshold=1.0):
+    """Timing hook that logs the statements slower than `threshold` seconds."""
+    def hook(statement, seconds):
+        if seconds >= threshold:
+            logging.warning(f"Slow statement ({seconds:.2f} s): {' '.join(str(statement).split())[:200]}")
+
+    return hook
+
+
+class StatementStats:
+    """
+    Timing hook that accumulates calls and time per statement.
+
+    Usage:
+        stats = add_timing_hook(StatementStats())
+        ...
+        stats.report()
+    """
+
+    def __init__(self):
+        self.statements = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, statement, seconds):
+        key = " ".join(str(statement).split())
+        with self._lock:
+            calls, total, slowest = self.statements.get(key, (0, 0.0, 0.0))
+            self.statements[key] = (calls + 1, total + seconds, max(slowest, seconds))
+
+    def report(self, limit=10):
+        """
+        Returns:
+            list of tuple:
+                `(statement, calls, total_seconds, max_seconds)`, the most expensive first.
+        """
+        with self._lock:
+            rows = [(statement, *values) for statement, values in self.statements.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)[:limit]
+
+
+def get_pool(dbname=None, min_size=1, max_size=10, **kwargs):
+    """
+    Connection pool of a database, created on first use and shared afterwards.
+
+    Connections are checked before being handed out (a dropped connection is replaced
+    transparently), recycled after `max_idle`/`max_lifetime`, and reconnected in the
+    background when the server goes away.
+
+    Parameters:
+        dbname (str, optional):
+            Database to use instead of `PGDATABASE`.
+        min_size (int, optional):
+            Connections kept open.
+        max_size (int, optional):
+            Maximum connections, ex.: the number of collector or classifier threads.
+        **kwargs:
+            Other `psycopg_pool.ConnectionPool` arguments.
+
+    Returns:
+        psycopg_pool.ConnectionPool
+    """
+    from psycopg_pool import ConnectionPool
+
+    conninfo = load_settings(dbname)
+
+    with _pools_lock:
+        pool = _pools.get(conninfo)
+        if pool is None:
+            cursor_factory, server_cursor_factory = _cursor_classes()
+
+            def configure(conn):
+                conn.server_cursor_factory = server_cursor_factory
+
+            options = {
+                "min_size": min_size,
+                "max_size": max_size,
+                "kwargs": {"cursor_factory": cursor_factory},
+                "configure": configure,
+                "check": ConnectionPool.check_connection,
+                "max_idle": 300,
+                "max_lifetime": 3600,
+                "reconnect_timeout": 300,
+                "name": dbname or "default",
+                **kwargs,
+            }
+            pool = ConnectionPool(conninfo, open=True, **options)
+            _pools[conninfo] = pool
+
+    return pool
+
+
+def close_pools():
+    """Closes every pool (registered to run at exit)."""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+atexit.register(close_pools)
+
+
+@contextmanager
+def connection(dbname=None):
+    """
+    Borrows a connection from the pool of `dbname` and gives it back afterwards.
+    Work left uncommitted is committed, or rolled back if the block raised.
+    """
+    with get_pool(dbname).connection() as conn:
+        yield conn
+
+
+@contextmanager
+def transaction(conn=None, dbname=None):
+    """
+    Runs a block in one transaction and yields its cursor: committed when the block
+    ends, rolled back if it raises.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection, optional):
+            Connection to use. Defaults to one borrowed from the pool of `dbname`.
+        dbname (str, optional):
+            Database to use instead of `PGDATABASE`.
+
+    Usage:
+        with transaction() as cursor:
+            save_sentiments(cursor, "gpt-4o-mini", sentiments)
+    """
+    if conn is None:
+        with connection(dbname) as conn:
+            with transaction(conn) as cursor:
+                yield cursor
+        return
+
+    cursor = conn.cursor()
+    try:
+        yield cursor
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def health_check(dbname=None, timeout=5.0):
+    """
+    Checks the idle connections of the pool, replacing the broken ones, and that the
+    database answers.
+
+    Returns:
+        dict:
+            `ok`, the round trip `latency` in seconds (None on failure), the `error` if
+            any, and the pool statistics (`pool_size`, `pool_available`, `requests_waiting`, ...).
+    """
+    pool = get_pool(dbname)
+
+    status = {"ok": False, "latency": None, "error": None}
+    try:
+        # Drops the idle connections that went away (ex.: server restart, idle timeout) and opens new ones.
+        pool.check()
+
+        with pool.connection(timeout=timeout) as conn:
+            start = time.perf_counter()
+            conn.execute("SELECT 1;")
+            status["latency"] = time.perf_counter() - start
+            status["ok"] = True
+    except Exception as e:
+        status["error"] = str(e)
+        logging.error(f"Health check of {pool.name} failed: {e}")
+
+    status.update(pool.get_stats())
+    return status
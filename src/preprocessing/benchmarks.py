@@ -0,0 +1,303 @@
+"""
+Benchmarks for the preprocessing stage, run over the bundled `data/issue_comments/*.xlsx` corpora.
+
+Run from this directory, e.g.:
+
+    python benchmarks.py pipeline --repeat 5
+    python benchmarks.py job --dsn postgresql://localhost/postgres --comments 100000 --workers 1 2 4
+    python benchmarks.py tokens --copies 1 --processes 1 2 [--model en_core_web_sm]
+    python benchmarks.py release-tokens --dsn postgresql://localhost/postgres --comments 5000
+"""
+from itertools import cycle, islice
+from pathlib import Path
+from text_pipeline import chained_pipeline, preprocess
+import argparse
+import pandas as pd
+import preprocess_job
+import psycopg2
+import time
+import token_stats
+import tracemalloc
+
+
+CORPORA_DIR = Path(__file__).resolve().parents[2] / "data" / "issue_comments"
+
+
+def load_corpora(corpora_dir=CORPORA_DIR):
+    """Returns a mapping of corpus name to its list of comment bodies."""
+    return {
+        path.stem: pd.read_excel(path)["body"].tolist()
+        for path in sorted(Path(corpora_dir).glob("*.xlsx"))
+    }
+
+
+def _throughput(function, texts, megabytes, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            function(text)
+        best = min(best, time.perf_counter() - start)
+    return megabytes / best
+
+
+def benchmark_pipeline(repeat):
+    print(f"{'corpus':<45} {'texts':>6} {'MB':>6} {'chained MB/s':>13} {'single-pass MB/s':>17} {'speedup':>8}")
+
+    for name, texts in load_corpora().items():
+        texts = [text for text in texts if isinstance(text, str)]
+        megabytes = sum(len(text.encode()) for text in texts) / 1e6
+
+        mismatches = sum(1 for text in texts if preprocess(text) != chained_pipeline(text))
+        if mismatches:
+            raise AssertionError(f"{mismatches} texts of {name} differ from the chained pipeline")
+
+        chained = _throughput(chained_pipeline, texts, megabytes, repeat)
+        single_pass = _throughput(preprocess, texts, megabytes, repeat)
+
+        print(f"{name:<45} {len(texts):>6} {megabytes:>6.2f} {chained:>13.2f} {single_pass:>17.2f} {single_pass / chained:>7.1f}x")
+
+
+def _create_release(conn, bodies, num_comments, comments_per_issue):
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        DROP SCHEMA IF EXISTS preprocessing_benchmark CASCADE;
+        CREATE SCHEMA preprocessing_benchmark;
+        SET search_path TO preprocessing_benchmark;
+
+        CREATE TABLE issues_from_release (
+            issue_id BIGINT PRIMARY KEY,
+            release_number TEXT,
+            title TEXT,
+            body TEXT
+        );
+
+        CREATE TABLE issue_comments_from_release (
+            comment_id BIGINT PRIMARY KEY,
+            issue_id BIGINT,
+            created_at TIMESTAMP,
+            body TEXT
+        );
+        """
+    )
+
+    num_issues = num_comments // comments_per_issue
+    cursor.execute(
+        """
+        INSERT INTO issues_from_release
+        SELECT i, 'v2.12.0', 'Issue ' || i, 'Body of issue ' || i
+        FROM generate_series(1, %s) AS i;
+
+        INSERT INTO issue_comments_from_release
+        SELECT n, n %% %s + 1, now(), (%s::text[])[n %% %s + 1]
+        FROM generate_series(1, %s) AS n;
+        """,
+        (num_issues, num_issues, bodies, len(bodies), num_issues * comments_per_issue)
+    )
+    conn.commit()
+    preprocess_job._prepared.pop(conn, None)
+
+
+def _snapshot(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT comment_id, body FROM issue_comments_from_release ORDER BY comment_id;")
+    comments = cursor.fetchall()
+    cursor.execute("SELECT issue_id, body FROM issues_from_release ORDER BY issue_id;")
+    issues = cursor.fetchall()
+    conn.commit()
+    return issues, comments
+
+
+def _notebook_loop(conn, release):
+    # Per-row loop of data_preprocessing.ipynb, without the per-comment print.
+    cursor = conn.cursor()
+    cursor.execute("SELECT issue_id, body FROM issues_from_release WHERE release_number LIKE %s", (f"%{release}%",))
+
+    for issue_id, issue_body in cursor.fetchall():
+        cursor.execute("UPDATE issues_from_release SET body = %s WHERE issue_id = %s", (preprocess(issue_body), issue_id))
+        cursor.execute("SELECT comment_id, body FROM issue_comments_from_release WHERE issue_id = %s;", (issue_id,))
+        for comment_id, comment_body in cursor.fetchall():
+            cursor.execute(
+                "UPDATE issue_comments_from_release SET body = %s WHERE comment_id = %s",
+                (preprocess(comment_body), comment_id)
+            )
+
+    conn.commit()
+
+
+def benchmark_job(dsn, num_comments, comments_per_issue, workers, chunk_size):
+    bodies = [text for texts in load_corpora().values() for text in texts if isinstance(text, str)]
+    bodies = list(islice(cycle(bodies), min(len(bodies), num_comments)))
+
+    with psycopg2.connect(dsn) as conn:
+        _create_release(conn, bodies, num_comments, comments_per_issue)
+        start = time.perf_counter()
+        _notebook_loop(conn, "2.12")
+        loop_time = time.perf_counter() - start
+        expected = _snapshot(conn)
+
+        print(f"Comments: {num_comments} | chunk size: {chunk_size}")
+        print(f"Per-row loop:      {loop_time:6.2f} s ({num_comments / loop_time:,.0f} comments/s)")
+
+        for max_workers in workers:
+            _create_release(conn, bodies, num_comments, comments_per_issue)
+            start = time.perf_counter()
+            preprocess_job.run_preprocessing(conn, "2.12", max_workers, chunk_size)
+            job_time = time.perf_counter() - start
+
+            assert _snapshot(conn) == expected, "The job stored different bodies"
+            print(f"Job, {max_workers:>2} workers:   {job_time:6.2f} s ({num_comments / job_time:,.0f} comments/s)")
+
+        conn.cursor().execute("DROP SCHEMA preprocessing_benchmark CASCADE;")
+
+
+def _full_pipeline(model):
+    """
+    The pipeline count_tokens.ipynb ran: `model` with all its components. Without a model,
+    a blank English pipeline with untrained tok2vec, tagger, parser and ner components
+    (the trainable components of en_core_web_sm), which costs about as much per doc.
+    """
+    import spacy
+    from spacy.training import Example
+
+    if model:
+        return spacy.load(model)
+
+    nlp = spacy.blank("en")
+    for name in ["tok2vec", "tagger", "parser", "ner"]:
+        nlp.add_pipe(name)
+
+    doc = nlp.make_doc("The build fails on Windows")
+    example = Example.from_dict(doc, {
+        "tags": ["DT", "NN", "VBZ", "IN", "NNP"],
+        "heads": [1, 2, 2, 2, 3],
+        "deps": ["det", "nsubj", "ROOT", "prep", "pobj"],
+        "entities": ["O", "O", "O", "O", "U-GPE"],
+    })
+    nlp.initialize(lambda: [example])
+    return nlp
+
+
+def benchmark_tokens(model, copies, batch_size, processes):
+    texts = [text for texts in load_corpora().values() for text in texts] * copies
+    full_nlp = _full_pipeline(model)
+    nlp = token_stats.load_nlp(model)
+
+    def timed(function):
+        start = time.perf_counter()
+        result = function()
+        return result, time.perf_counter() - start
+
+    # Per-doc loop of count_tokens.ipynb, with the whole pipeline enabled.
+    expected, per_doc_time = timed(
+        lambda: [token_stats.count_doc_tokens(full_nlp(text)) if isinstance(text, str) else 0 for text in texts]
+    )
+
+    print(f"Texts: {len(texts)} | model: {model or 'untrained en_core_web_sm components'} | batch size: {batch_size}")
+    print(f"Per-doc nlp(), all pipes:       {per_doc_time:6.2f} s ({len(texts) / per_doc_time:,.0f} texts/s)")
+
+    # nlp.pipe alone, then with only the tokenizer, to separate the two gains.
+    counts, full_pipe_time = timed(lambda: token_stats.count_tokens(full_nlp, texts, batch_size))
+    assert counts == expected, "nlp.pipe counted different tokens"
+    print(f"nlp.pipe, all pipes:            {full_pipe_time:6.2f} s ({len(texts) / full_pipe_time:,.0f} texts/s), "
+          f"{per_doc_time / full_pipe_time:.1f}x")
+
+    for n_process in processes:
+        counts, pipe_time = timed(lambda: token_stats.count_tokens(nlp, texts, batch_size, n_process))
+        assert counts == expected, "nlp.pipe counted different tokens"
+        print(f"nlp.pipe, tokenizer, {n_process:>2} process: {pipe_time:6.2f} s ({len(texts) / pipe_time:,.0f} texts/s), "
+              f"{per_doc_time / pipe_time:.1f}x")
+
+
+def _notebook_token_count(conn, nlp, release):
+    # Per-issue queries and per-doc nlp() calls of count_tokens.ipynb.
+    cursor = conn.cursor()
+    cursor.execute("SELECT issue_id, body FROM issues_from_release WHERE release_number LIKE %s;", (f"%{release}%",))
+
+    comment_tokens = 0
+    for issue_id, _ in cursor.fetchall():
+        cursor.execute("SELECT comment_id, body FROM issue_comments_from_release WHERE issue_id = %s;", (issue_id,))
+        for _, comment_body in cursor.fetchall():
+            comment_tokens += token_stats.count_doc_tokens(nlp(comment_body))
+
+    conn.commit()
+    return comment_tokens
+
+
+def benchmark_release_tokens(dsn, model, num_comments, comments_per_issue, batch_size, processes):
+    bodies = [text for texts in load_corpora().values() for text in texts if isinstance(text, str)]
+    bodies = list(islice(cycle(bodies), min(len(bodies), num_comments)))
+    full_nlp = _full_pipeline(model)
+    nlp = token_stats.load_nlp(model)
+
+    with psycopg2.connect(dsn) as conn:
+        _create_release(conn, bodies, num_comments, comments_per_issue)
+
+        start = time.perf_counter()
+        expected = _notebook_token_count(conn, full_nlp, "2.12")
+        notebook_time = time.perf_counter() - start
+
+        print(f"Comments: {num_comments} | model: {model or 'untrained en_core_web_sm components'} | batch size: {batch_size}")
+        print(f"Notebook loop:        {notebook_time:6.2f} s ({num_comments / notebook_time:,.0f} comments/s)")
+
+        for n_process in processes:
+            start = time.perf_counter()
+            stats = token_stats.release_token_stats(conn, "2.12", nlp, batch_size=batch_size, n_process=n_process)
+            stats_time = time.perf_counter() - start
+
+            # Traced separately, since tracing slows the run down.
+            tracemalloc.start()
+            token_stats.release_token_stats(conn, "2.12", nlp, batch_size=batch_size, n_process=n_process)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            comment_tokens = sum(sum(issue["comment_tokens"]) for issue in stats["per_issue"].values())
+            assert comment_tokens == expected, "release_token_stats counted different tokens"
+            print(f"release_token_stats, {n_process:>2} process: {stats_time:6.2f} s "
+                  f"({num_comments / stats_time:,.0f} comments/s), {notebook_time / stats_time:.1f}x, "
+                  f"peak {peak / 2 ** 20:.1f} MiB")
+
+        conn.cursor().execute("DROP SCHEMA preprocessing_benchmark CASCADE;")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    pipeline_parser = subparsers.add_parser("pipeline", help="Chained re.sub pipeline vs single-pass preprocess")
+    pipeline_parser.add_argument("--repeat", type=int, default=5)
+
+    job_parser = subparsers.add_parser("job", help="Notebook per-row loop vs parallel chunked job")
+    job_parser.add_argument("--dsn", required=True)
+    job_parser.add_argument("--comments", type=int, default=100_000)
+    job_parser.add_argument("--comments-per-issue", type=int, default=20)
+    job_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    job_parser.add_argument("--chunk-size", type=int, default=2000)
+
+    tokens_parser = subparsers.add_parser("tokens", help="Per-doc nlp() vs nlp.pipe token counting")
+    tokens_parser.add_argument("--model", default=None, help="Installed spaCy model (default: untrained en_core_web_sm components)")
+    tokens_parser.add_argument("--copies", type=int, default=1)
+    tokens_parser.add_argument("--batch-size", type=int, default=256)
+    tokens_parser.add_argument("--processes", type=int, nargs="+", default=[1])
+
+    release_tokens_parser = subparsers.add_parser("release-tokens", help="count_tokens.ipynb loop vs release_token_stats")
+    release_tokens_parser.add_argument("--dsn", required=True)
+    release_tokens_parser.add_argument("--model", default=None, help="Installed spaCy model (default: untrained en_core_web_sm components)")
+    release_tokens_parser.add_argument("--comments", type=int, default=5_000)
+    release_tokens_parser.add_argument("--comments-per-issue", type=int, default=5)
+    release_tokens_parser.add_argument("--batch-size", type=int, default=256)
+    release_tokens_parser.add_argument("--processes", type=int, nargs="+", default=[1])
+
+    args = parser.parse_args()
+
+    if args.benchmark == "pipeline":
+        benchmark_pipeline(args.repeat)
+    elif args.benchmark == "job":
+        benchmark_job(args.dsn, args.comments, args.comments_per_issue, args.workers, args.chunk_size)
+    elif args.benchmark == "tokens":
+        benchmark_tokens(args.model, args.copies, args.batch_size, args.processes)
+    elif args.benchmark == "release-tokens":
+        benchmark_release_tokens(
+            args.dsn, args.model, args.comments, args.comments_per_issue, args.batch_size, args.processes
+        )
@@ -0,0 +1,184 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from text_pipeline import preprocess
+import logging
+import os
+import weakref
+
+
+ISSUES = {"table": "issues_from_release", "key": "issue_id"}
+COMMENTS = {"table": "issue_comments_from_release", "key": "comment_id"}
+
+# Tables already given a `preprocessed` column on each connection.
+_prepared = weakref.WeakKeyDictionary()
+
+
+def ensure_preprocessed_column(conn, spec):
+    """
+    Adds the `preprocessed` flag to the table of `spec`, once per connection.
+    Rows whose flag is set are skipped, so an interrupted job resumes where it stopped.
+    """
+    prepared = _prepared.setdefault(conn, set())
+    if spec["table"] in prepared:
+        return
+
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        ALTER TABLE
+            {spec["table"]}
+        ADD COLUMN IF NOT EXISTS
+            preprocessed BOOLEAN NOT NULL DEFAULT false;
+        """
+    )
+    conn.commit()
+
+    prepared.add(spec["table"])
+
+
+def preprocess_chunk(rows):
+    """Runs `preprocess` on `(id, body)` rows. Executed in the worker processes."""
+    return [(row_id, preprocess(body)) for row_id, body in rows]
+
+
+def save_chunk(conn, spec, rows):
+    """
+    Writes preprocessed bodies back and flags them, with one `UPDATE ... FROM (VALUES ...)`,
+    and commits.
+    """
+    placeholders = ", ".join(["(%s::bigint, %s::text)"] * len(rows))
+    params = [value for row in rows for value in row]
+
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        UPDATE
+            {spec["table"]} t
+        SET
+            body = v.body,
+            preprocessed = true
+        FROM
+            (VALUES {placeholders}) AS v (id, body)
+        WHERE
+            t.{spec["key"]} = v.id;
+        """,
+        params
+    )
+    conn.commit()
+
+
+def _pending_query(spec):
+    if spec is ISSUES:
+        return """
+            SELECT
+                issue_id, body
+            FROM
+                issues_from_release
+            WHERE
+                release_number LIKE %s
+                AND NOT preprocessed;
+        """
+
+    return """
+        SELECT
+            c.comment_id, c.body
+        FROM
+            issue_comments_from_release c
+        JOIN
+            issues_from_release i ON i.issue_id = c.issue_id
+        WHERE
+            i.release_number LIKE %s
+            AND NOT c.preprocessed;
+    """
+
+
+def _chunks(cursor, chunk_size):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def preprocess_table(conn, spec, release, executor, chunk_size=2000, max_in_flight=4):
+    """
+    Preprocesses the pending rows of one table for a release.
+
+    Rows are streamed from a named (server-side) cursor in chunks of `chunk_size`, the
+    chunks are preprocessed in `executor`, and each result is written back and committed
+    as soon as it is ready, in order. At most `max_in_flight` chunks are held in memory.
+
+    Returns:
+        int:
+            Number of rows preprocessed.
+    """
+    ensure_preprocessed_column(conn, spec)
+
+    # WITH HOLD keeps the cursor open across the per-chunk commits.
+    cursor = conn.cursor(name=f"preprocess_{spec['table']}", withhold=True)
+    cursor.itersize = chunk_size
+    cursor.execute(_pending_query(spec), (f"%{release}%",))
+
+    processed = 0
+    pending = deque()
+
+    def save_oldest():
+        rows = pending.popleft().result()
+        save_chunk(conn, spec, rows)
+        return len(rows)
+
+    try:
+        for rows in _chunks(cursor, chunk_size):
+            pending.append(executor.submit(preprocess_chunk, rows))
+
+            if len(pending) >= max_in_flight:
+                processed += save_oldest()
+                logging.info(f"{processed} rows of {spec['table']} preprocessed.")
+
+        while pending:
+            processed += save_oldest()
+    except Exception:
+        for future in pending:
+            future.cancel()
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.commit()
+
+    logging.info(f"{processed} rows of {spec['table']} preprocessed for release {release}.")
+
+    return processed
+
+
+def run_preprocessing(conn, release, max_workers=None, chunk_size=2000):
+    """
+    Preprocesses the bodies of the issues and comments of a release in parallel.
+
+    Replaces the per-row loop of data_preprocessing.ipynb: the CPU-bound regex and emoji
+    work runs in a `ProcessPoolExecutor`, while the calling process streams rows out of
+    PostgreSQL and writes the results back, one transaction per chunk. Memory stays
+    bounded by the chunks in flight, and rows already flagged as `preprocessed` are
+    not processed twice, so the job can be stopped and started again.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        release (str):
+            Release to preprocess (matched with `LIKE '%release%'`, as in the notebooks).
+        max_workers (int, optional):
+            Worker processes. Defaults to the number of CPUs.
+        chunk_size (int, optional):
+            Rows fetched, preprocessed and committed together.
+
+    Returns:
+        dict:
+            Number of issues and comments preprocessed.
+    """
+    max_workers = max_workers or os.cpu_count()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return {
+            "issues": preprocess_table(conn, ISSUES, release, executor, chunk_size, 2 * max_workers),
+            "comments": preprocess_table(conn, COMMENTS, release, executor, chunk_size, 2 * max_workers),
+        }
@@ -0,0 +1,114 @@
+import re
+import emoji
+
+
+EMOJI_DELIMITERS = ("<emoji_", ">")
+
+# A run of non-space characters, where a fenced code block counts as a single
+# character: the chained pipeline turns it into `<CODE_BLOCK>` before looking for
+# images and URLs, so they extend across code blocks.
+_RUN = r"(?:```.*?```|\S)"
+
+_TOKEN = re.compile(
+    rf"(?P<code>```.*?```)"
+    rf"|(?P<image>!\[Image\]{_RUN}*)"
+    rf"|(?P<url>(?:http|www\.){_RUN}+)",
+    re.DOTALL
+)
+
+_PLACEHOLDERS = {
+    "code": "<CODE_BLOCK>",
+    "image": "<IMAGE>",
+    "url": "<URL>",
+}
+
+
+def _demojize(segment):
+    # Every emoji sequence has a non-ASCII code point, so ASCII text is left as is.
+    if segment.isascii():
+        return segment
+    return emoji.demojize(segment, delimiters=EMOJI_DELIMITERS)
+
+
+def preprocess(text):
+    """
+    Replaces code blocks, images and URLs with placeholders and emojis with their names,
+    in a single scan of the text.
+
+    The output is identical to the chained pipeline
+    `[process_code_blocks, process_images, process_urls, process_emojis]`. Non-string values
+    (ex.: NULL bodies) are returned unchanged, as the chained pipeline did.
+
+    Parameters:
+        text (str):
+            Body of an issue or comment.
+
+    Returns:
+        str:
+            The preprocessed text.
+    """
+    if not isinstance(text, str):
+        return text
+
+    parts = []
+    position = 0
+    for match in _TOKEN.finditer(text):
+        start = match.start()
+        if start > position:
+            parts.append(_demojize(text[position:start]))
+        parts.append(_PLACEHOLDERS[match.lastgroup])
+        position = match.end()
+
+    if position < len(text):
+        parts.append(_demojize(text[position:]))
+
+    return "".join(parts)
+
+
+# Original step-by-step pipeline of data_preprocessing.ipynb, kept as the reference
+# for `preprocess` and for the benchmarks.
+
+def process_images(text):
+    try:
+        text = re.sub(r'!\[Image\]\S*', '<IMAGE>', text)
+    except Exception as e:
+        print(f"Unexpected error occurred: {e}")
+    return text
+
+def process_urls(text):
+    try:
+        text = re.sub(r'http\S+|www\.\S+', '<URL>', text)
+    except Exception as e:
+        print(f"Unexpected error occurred: {e}")
+    return text
+
+def process_code_blocks(text):
+    try:
+        text = re.sub(r'```(.*?)```', '<CODE_BLOCK>', text, flags=re.DOTALL)
+    except Exception as e:
+        print(f"Unexpected error occurred: {e}")
+    return text
+
+def process_reply(text):
+    try:
+        text = re.sub(r'(>.)(.*)', r'<user is replying to: \2 >', text)
+    except Exception as e:
+        print(f"Unexpected error occurred: {e}")
+    return text
+
+def process_emojis(text):
+    try:
+        text = emoji.demojize(text, delimiters=EMOJI_DELIMITERS)
+    except Exception as e:
+        print(f"Unexpected error occurred: {e}")
+    return text
+
+def create_pipeline(functions):
+    def pipeline(text):
+        for func in functions:
+            text = func(text)
+        return text
+    return pipeline
+
+
+chained_pipeline = create_pipeline([process_code_blocks, process_images, process_urls, process_emojis])
@@ -0,0 +1,211 @@
+from collections import deque
+from itertools import groupby, islice
+import logging
+import math
+
+
+# Components of en_core_web_sm that token counting does not use. Only the tokenizer runs.
+UNUSED_PIPES = ["tok2vec", "tagger", "parser", "senter", "attribute_ruler", "lemmatizer", "ner"]
+
+
+def load_nlp(model="en_core_web_sm"):
+    """
+    Loads a spaCy pipeline reduced to its tokenizer.
+
+    Parameters:
+        model (str, optional):
+            Installed spaCy model, or None for the blank English tokenizer (`spacy.blank("en")`),
+            which needs no download.
+    """
+    import spacy
+
+    if model is None:
+        return spacy.blank("en")
+    return spacy.load(model, exclude=UNUSED_PIPES)
+
+
+def count_doc_tokens(doc):
+    """Number of tokens of a doc, ignoring spaces and punctuation (as count_tokens.ipynb did)."""
+    return sum(1 for token in doc if not token.is_space and not token.is_punct)
+
+
+def iter_token_counts(nlp, texts, batch_size=256, n_process=1):
+    """
+    Lazy version of `count_tokens`: texts are read from the iterable as `nlp.pipe` needs
+    them, so a stream of texts is never held in memory.
+    """
+    texts = (text if isinstance(text, str) else "" for text in texts)
+    for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+        yield count_doc_tokens(doc)
+
+
+def count_tokens(nlp, texts, batch_size=256, n_process=1):
+    """
+    Counts the tokens of many texts with `nlp.pipe`.
+
+    Parameters:
+        nlp (spacy.Language):
+            Pipeline from `load_nlp`.
+        texts (iterable of str):
+            Texts to count. Non-string values (ex.: an issue without body) count as 0 tokens.
+        batch_size (int, optional):
+            Texts per `nlp.pipe` batch.
+        n_process (int, optional):
+            Processes used by `nlp.pipe`.
+
+    Returns:
+        list of int:
+            Token count of each text, in order.
+    """
+    return list(iter_token_counts(nlp, texts, batch_size, n_process))
+
+
+def _rows(cursor, chunk_size):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def iter_release_texts(conn, release, chunk_size=5000):
+    """
+    Streams the issues of a release with their comments, from a single query on a named
+    (server-side) cursor read in chunks of `chunk_size`, so memory holds one chunk and
+    one issue at a time.
+
+    Yields:
+        tuple:
+            `(issue_id, title, body, comment_bodies)`, ordered by issue, comments by date.
+    """
+    cursor = conn.cursor(name="release_texts")
+    cursor.itersize = chunk_size
+    cursor.execute(
+        """
+        SELECT
+            i.issue_id,
+            i.title,
+            i.body,
+            c.comment_id,
+            c.body
+        FROM
+            issues_from_release i
+        LEFT JOIN
+            issue_comments_from_release c ON c.issue_id = i.issue_id
+        WHERE
+            i.release_number LIKE %s
+        ORDER BY
+            i.issue_id, c.created_at;
+        """,
+        (f"%{release}%",)
+    )
+
+    try:
+        for (issue_id, title, body), rows in groupby(_rows(cursor, chunk_size), key=lambda row: row[:3]):
+            # The LEFT JOIN yields one row without comment_id for issues without comments.
+            comments = [row[4] for row in rows if row[3] is not None]
+            yield issue_id, title, body, comments
+    finally:
+        cursor.close()
+        conn.commit()
+
+
+def prompt_tokens(issue_tokens, comment_tokens, system_tokens, batch_size=None):
+    """
+    Tokens sent to a model to classify the comments of one issue.
+
+    Parameters:
+        issue_tokens (int):
+            Tokens of the issue title and body.
+        comment_tokens (list of int):
+            Tokens of each comment, in order.
+        system_tokens (int):
+            Tokens of the system prompt.
+        batch_size (int, optional):
+            Comments per request, as in `batch_classification`. None is the conversational
+            prompt of the notebooks: one request per comment, each resending the whole
+            conversation so far (with a one-token answer per previous comment).
+    """
+    if not comment_tokens:
+        return 0
+
+    if batch_size is None:
+        total = 0
+        history = 0
+        for i, tokens in enumerate(comment_tokens):
+            history += tokens
+            total += system_tokens + issue_tokens + history + i
+        return total
+
+    requests = math.ceil(len(comment_tokens) / batch_size)
+    return requests * (system_tokens + issue_tokens) + sum(comment_tokens)
+
+
+def release_token_stats(conn, release, nlp=None, prompts=None, batch_size=256, n_process=1, chunk_size=5000):
+    """
+    Token statistics of a release, to budget the cost of a classification run.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        release (str):
+            Release to count (matched with `LIKE '%release%'`, as in the notebooks).
+        nlp (spacy.Language, optional):
+            Pipeline from `load_nlp`. Defaults to `load_nlp()`.
+        prompts (dict, optional):
+            Model name mapped to a `(system_prompt, batch_size)` pair, see `prompt_tokens`.
+        batch_size (int, optional):
+            Texts per `nlp.pipe` batch.
+        n_process (int, optional):
+            Processes used by `nlp.pipe`.
+        chunk_size (int, optional):
+            Rows fetched per round trip, see `iter_release_texts`.
+
+    Returns:
+        dict:
+            `issues`, `comments` and `tokens` of the release, `per_issue` (issue_id mapped to
+            its issue and comment tokens) and `per_prompt` (model name mapped to the tokens
+            its prompt would send for the whole release).
+    """
+    nlp = nlp or load_nlp()
+
+    # The texts of the release are streamed from the cursor into one nlp.pipe call. The
+    # issue id and comment count of every issue are queued as its texts are read, so the
+    # counts coming out of the pipe can be assigned back to it.
+    layout = deque()
+
+    def texts():
+        for issue_id, title, body, comments in iter_release_texts(conn, release, chunk_size):
+            layout.append((issue_id, len(comments)))
+            yield f"{title or ''}\n{body or ''}"
+            yield from comments
+
+    counts = iter_token_counts(nlp, texts(), batch_size, n_process)
+
+    per_issue = {}
+    for issue_tokens in counts:
+        issue_id, num_comments = layout.popleft()
+        comment_tokens = list(islice(counts, num_comments))
+        per_issue[issue_id] = {"issue_tokens": issue_tokens, "comment_tokens": comment_tokens}
+
+    per_prompt = {}
+    for name, (system_prompt, prompt_batch_size) in (prompts or {}).items():
+        system_tokens = count_tokens(nlp, [system_prompt])[0]
+        per_prompt[name] = sum(
+            prompt_tokens(stats["issue_tokens"], stats["comment_tokens"], system_tokens, prompt_batch_size)
+            for stats in per_issue.values()
+        )
+
+    stats = {
+        "issues": len(per_issue),
+        "comments": sum(len(stats["comment_tokens"]) for stats in per_issue.values()),
+        "tokens": sum(
+            stats["issue_tokens"] + sum(stats["comment_tokens"]) for stats in per_issue.values()
+        ),
+        "per_issue": per_issue,
+        "per_prompt": per_prompt,
+    }
+
+    logging.info(f"Release {release}: {stats['issues']} issues, {stats['comments']} comments, {stats['tokens']} tokens.")
+
+    return stats
@@ -0,0 +1,274 @@
+from itertools import combinations
+from labels import LABELS, parse_label
+from sentiment_store import LEGACY_COLUMNS, existing_legacy_columns
+import logging
+import numpy as np
+import pandas as pd
+
+
+CLASSES = LABELS
+UNKNOWN = -1
+
+MODELS = list(LEGACY_COLUMNS)
+
+
+def normalize_label(answer):
+    """
+    Maps a free-text answer ("Neutral.", "positive\\n", "The sentiment is negative") to the
+    index of its class in `CLASSES`, or `UNKNOWN` when `labels.parse_label` cannot parse it.
+    """
+    sentiment = parse_label(answer)
+    return CLASSES.index(sentiment.value) if sentiment is not None else UNKNOWN
+
+
+def normalize_labels(answers):
+    """
+    Vectorized `normalize_label`: each distinct answer is parsed once and the codes are
+    spread back with a NumPy take, so the cost grows with the number of distinct answers.
+
+    Returns:
+        numpy.ndarray:
+            int8 class codes, `UNKNOWN` for missing or unparseable answers.
+    """
+    codes, uniques = pd.factorize(pd.Series(answers, dtype=object), use_na_sentinel=True)
+    table = np.array([normalize_label(answer) for answer in uniques] + [UNKNOWN], dtype=np.int8)
+    # Missing values have code -1, which takes the trailing UNKNOWN.
+    return table[codes]
+
+
+def load_labels(conn, models=MODELS, since=None):
+    """
+    Loads the labels of several models, one row per comment, with a single query.
+
+    The models of `LEGACY_COLUMNS` are read from their columns of
+    `issue_comments_from_release`, the others from `comment_sentiments`.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        models (list of str, optional):
+            Models to compare.
+        since (datetime, optional):
+            Only the comments with a label saved in `comment_sentiments` after this time.
+
+    Returns:
+        pandas.DataFrame:
+            Indexed by comment_id, with the `release` of the comment and one column of
+            class codes (see `normalize_labels`) per model.
+    """
+    cursor = conn.cursor()
+
+    legacy = existing_legacy_columns(cursor)
+    selected = []
+    pivoted = []
+    params = []
+    for model in models:
+        if model in legacy:
+            selected.append(f"c.{legacy[model]}")
+        else:
+            selected.append(f"s.label_{len(pivoted)}")
+            pivoted.append(model)
+
+    join = ""
+    if pivoted:
+        labels = ", ".join(
+            f"MAX(label) FILTER (WHERE model = %s) AS label_{index}" for index in range(len(pivoted))
+        )
+        join = f"""
+            LEFT JOIN (
+                SELECT comment_id, {labels}
+                FROM comment_sentiments
+                GROUP BY comment_id
+            ) s ON s.comment_id = c.comment_id
+        """
+        params.extend(pivoted)
+
+    where = ""
+    if since is not None:
+        where = "WHERE c.comment_id IN (SELECT comment_id FROM comment_sentiments WHERE classified_at > %s)"
+        params.append(since)
+
+    cursor.execute(
+        f"""
+        SELECT
+            c.comment_id,
+            i.release_number,
+            {", ".join(selected)}
+        FROM
+            issue_comments_from_release c
+        JOIN
+            issues_from_release i ON i.issue_id = c.issue_id
+        {join}
+        {where};
+        """,
+        params
+    )
+    rows = cursor.fetchall()
+    conn.commit()
+
+    frame = pd.DataFrame(rows, columns=["comment_id", "release"] + list(models)).set_index("comment_id")
+    for model in models:
+        frame[model] = normalize_labels(frame[model])
+
+    logging.info(f"Labels of {len(frame)} comments loaded for {len(models)} models.")
+
+    return frame
+
+
+def _statistics(labels, models):
+    """
+    Additive statistics of a set of labelled comments, so that comments can be
+    added (and removed, when relabelled) without recomputing from scratch.
+    """
+    codes = labels[list(models)].to_numpy(dtype=np.int8)
+    known = codes != UNKNOWN
+    classes = len(CLASSES)
+
+    confusion = {}
+    for (i, a), (j, b) in combinations(enumerate(models), 2):
+        both = known[:, i] & known[:, j]
+        cells = codes[both, i].astype(np.int64) * classes + codes[both, j]
+        confusion[(a, b)] = np.bincount(cells, minlength=classes * classes).reshape(classes, classes)
+
+    # Fleiss' kappa and disagreement use the comments labelled by every model.
+    complete = known.all(axis=1)
+    votes = np.stack([(codes[complete] == k).sum(axis=1) for k in range(classes)], axis=1)
+    raters = len(models)
+    agreement = ((votes ** 2).sum(axis=1) - raters) / (raters * (raters - 1)) if raters > 1 else np.ones(len(votes))
+
+    disagrees = votes.max(axis=1) < raters
+    releases = pd.DataFrame({
+        "release": labels["release"].to_numpy()[complete],
+        "comments": 1,
+        "disagreements": disagrees.astype(np.int64),
+    }).groupby("release")[["comments", "disagreements"]].sum()
+
+    return {
+        "confusion": confusion,
+        "fleiss": np.concatenate([[len(votes), agreement.sum()], votes.sum(axis=0)]),
+        "releases": releases,
+    }
+
+
+def _combine(total, part, sign=1):
+    for pair, matrix in part["confusion"].items():
+        total["confusion"][pair] = total["confusion"][pair] + sign * matrix
+    total["fleiss"] = total["fleiss"] + sign * part["fleiss"]
+    total["releases"] = total["releases"].add(sign * part["releases"], fill_value=0)
+    return total
+
+
+def cohen_kappa(confusion):
+    """Cohen's kappa of two models from their confusion matrix."""
+    confusion = np.asarray(confusion, dtype=float)
+    total = confusion.sum()
+    if total == 0:
+        return float("nan")
+
+    observed = np.trace(confusion) / total
+    expected = (confusion.sum(axis=0) * confusion.sum(axis=1)).sum() / total ** 2
+    return float((observed - expected) / (1 - expected)) if expected < 1 else 1.0
+
+
+def _report(statistics, models):
+    items, agreement_sum = statistics["fleiss"][:2]
+    votes = statistics["fleiss"][2:]
+
+    fleiss = float("nan")
+    if items:
+        proportions = votes / (items * len(models))
+        expected = (proportions ** 2).sum()
+        observed = agreement_sum / items
+        fleiss = float((observed - expected) / (1 - expected)) if expected < 1 else 1.0
+
+    releases = statistics["releases"].astype("int64")
+    releases = releases[releases["comments"] > 0]
+    releases["rate"] = releases["disagreements"] / releases["comments"]
+
+    return {
+        "confusion": {
+            pair: pd.DataFrame(matrix, index=CLASSES, columns=CLASSES)
+            for pair, matrix in statistics["confusion"].items()
+        },
+        "cohen_kappa": {pair: cohen_kappa(matrix) for pair, matrix in statistics["confusion"].items()},
+        "fleiss_kappa": fleiss,
+        "disagreement": releases,
+    }
+
+
+def agreement_report(labels, models=MODELS):
+    """
+    Agreement between models over a frame from `load_labels`.
+
+    Returns:
+        dict:
+            `confusion` (pair of models mapped to its confusion matrix, rows are the first model),
+            `cohen_kappa` (pair of models mapped to its kappa), `fleiss_kappa` (over the comments
+            labelled by every model) and `disagreement` (per release: comments labelled by every
+            model, how many of them the models disagree on, and the rate).
+    """
+    return _report(_statistics(labels, models), models)
+
+
+class AgreementTracker:
+    """
+    Keeps the agreement statistics up to date as new labels land.
+
+    `update` folds in new or relabelled comments (the previous labels of a relabelled
+    comment are subtracted first), and `refresh` loads only the comments labelled since
+    the last refresh, so the report never needs a full recomputation.
+
+    Parameters:
+        models (list of str, optional):
+            Models to compare.
+    """
+
+    def __init__(self, models=MODELS):
+        self.models = list(models)
+        self.labels = pd.DataFrame(columns=["release"] + self.models, index=pd.Index([], name="comment_id"))
+        self.statistics = _statistics(self.labels, self.models)
+        self.watermark = None
+
+    def update(self, labels):
+        """Adds the comments of `labels` (a frame from `load_labels`), replacing those already seen."""
+        labels = labels[~labels.index.duplicated(keep="last")]
+        previous = self.labels[self.labels.index.isin(labels.index)]
+
+        if len(previous):
+            self.statistics = _combine(self.statistics, _statistics(previous, self.models), sign=-1)
+        self.statistics = _combine(self.statistics, _statistics(labels, self.models))
+
+        self.labels = pd.concat([self.labels[~self.labels.index.isin(labels.index)], labels[self.labels.columns]])
+
+    def refresh(self, conn):
+        """
+        Loads and folds in the comments labelled since the previous refresh (all of them
+        the first time).
+
+        Returns:
+            int:
+                Number of comments loaded.
+        """
+        cursor = conn.cursor()
+        cursor.execute("SELECT to_regclass('comment_sentiments') IS NOT NULL;")
+        has_table = cursor.fetchone()[0]
+
+        watermark = None
+        if has_table:
+            # Read before the labels, so a label saved meanwhile is loaded again next time.
+            cursor.execute("SELECT MAX(classified_at) FROM comment_sentiments;")
+            watermark = cursor.fetchone()[0]
+        conn.commit()
+
+        if self.watermark is not None and watermark == self.watermark:
+            return 0
+
+        labels = load_labels(conn, self.models, since=self.watermark)
+        self.update(labels)
+        self.watermark = watermark
+
+        return len(labels)
+
+    def report(self):
+        """Same result as `agreement_report` over every comment seen so far."""
+        return _report(self.statistics, self.models)
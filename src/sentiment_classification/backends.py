@@ -0,0 +1,178 @@
+from batch_classification import classify_comments_batched
+from labels import LABELS
+import logging
+import re
+import zlib
+
+
+class ClassifierBackend:
+    """
+    Common interface of the sentiment classifiers.
+
+    Subclasses implement `classify_comments`, which receives the same
+    `(comment_id, created_at, body)` rows as `analyze_issue_sentiment_openai`
+    and returns `(comment_id, label)` pairs.
+    """
+
+    name = "backend"
+
+    def classify_comments(self, issue_title, issue_body, comments):
+        raise NotImplementedError
+
+
+class LLMBackend(ClassifierBackend):
+    """
+    Remote chat model, through a `complete(system_prompt, user_prompt)` function
+    (see `batch_classification.openai_completer` and `genai_completer`).
+    """
+
+    def __init__(self, complete, name, batch_size=20):
+        self.complete = complete
+        self.name = name
+        self.batch_size = batch_size
+
+    def classify_comments(self, issue_title, issue_body, comments):
+        return classify_comments_batched(
+            issue_title, issue_body, comments, self.complete, self.batch_size
+        )
+
+
+class HashingTokenizer:
+    """
+    Vocabulary-free word tokenizer: every word or punctuation mark is hashed
+    into `vocab_size - 1` buckets (id 0 is reserved for padding).
+    """
+
+    _TOKEN = re.compile(r"\w+|[^\w\s]")
+
+    def __init__(self, vocab_size=32768, lowercase=True):
+        self.vocab_size = vocab_size
+        self.lowercase = lowercase
+
+    def __call__(self, text, max_length):
+        if self.lowercase:
+            text = text.lower()
+
+        tokens = self._TOKEN.findall(text)[:max_length]
+        return [zlib.crc32(token.encode()) % (self.vocab_size - 1) + 1 for token in tokens] or [1]
+
+
+def build_tiny_transformer(vocab_size=32768, dim=64, heads=4, layers=2, max_length=256, num_labels=3):
+    """
+    Small transformer encoder with masked mean pooling and a linear head.
+
+    Randomly initialized, it is enough to exercise the local backend without network or GPU.
+    Trained weights can be loaded with `load_state_dict`.
+    """
+    import torch
+    from torch import nn
+
+    class TinyTransformerClassifier(nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.embedding = nn.Embedding(vocab_size, dim, padding_idx=0)
+            self.position = nn.Embedding(max_length, dim)
+            self.encoder = nn.TransformerEncoder(
+                nn.TransformerEncoderLayer(dim, heads, dim * 4, dropout=0.0, batch_first=True),
+                layers,
+                enable_nested_tensor=False
+            )
+            self.head = nn.Linear(dim, num_labels)
+
+        def forward(self, input_ids, attention_mask):
+            positions = torch.arange(input_ids.shape[1], device=input_ids.device)
+            hidden = self.embedding(input_ids) + self.position(positions)
+            hidden = self.encoder(hidden, src_key_padding_mask=~attention_mask)
+
+            mask = attention_mask.unsqueeze(-1).to(hidden.dtype)
+            pooled = (hidden * mask).sum(1) / mask.sum(1).clamp(min=1)
+            return self.head(pooled)
+
+    return TinyTransformerClassifier()
+
+
+class LocalTorchBackend(ClassifierBackend):
+    """
+    Offline classifier running a small model on the CPU with batched torch inference.
+
+    Texts are sorted by token length and split into batches of `batch_size`, so each
+    batch is padded only to its own longest text (dynamic padding over length buckets),
+    and the model runs under `torch.inference_mode`. The issue context is ignored:
+    each comment is classified on its own text.
+
+    Parameters:
+        model (torch.nn.Module, optional):
+            Called as `model(input_ids, attention_mask)` and returning `(batch, len(labels))` logits.
+            Defaults to a randomly initialized `build_tiny_transformer()`.
+        tokenizer (callable, optional):
+            `tokenizer(text, max_length) -> list of int`. Defaults to `HashingTokenizer()`.
+        labels (tuple of str, optional):
+            Label of each logit.
+        batch_size (int, optional):
+            Texts per forward pass.
+        max_length (int, optional):
+            Maximum number of tokens kept per text.
+        num_threads (int, optional):
+            Intra-op CPU threads used by torch.
+        name (str, optional):
+            Model identifier the labels are saved under.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        tokenizer=None,
+        labels=LABELS,
+        batch_size=64,
+        max_length=256,
+        num_threads=None,
+        name="local-tiny-transformer",
+    ):
+        import torch
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+
+        self.model = (model or build_tiny_transformer(max_length=max_length)).eval()
+        self.tokenizer = tokenizer or HashingTokenizer()
+        self.labels = labels
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.name = name
+
+    def classify(self, texts):
+        """
+        Classifies raw texts.
+
+        Returns:
+            list of str:
+                One label per text, in the order of `texts`.
+        """
+        import torch
+
+        encoded = [self.tokenizer(text or "", self.max_length) for text in texts]
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+        predictions = [None] * len(encoded)
+
+        with torch.inference_mode():
+            for start in range(0, len(order), self.batch_size):
+                indexes = order[start:start + self.batch_size]
+                longest = max(len(encoded[i]) for i in indexes)
+
+                input_ids = torch.zeros((len(indexes), longest), dtype=torch.long)
+                for row, i in enumerate(indexes):
+                    input_ids[row, :len(encoded[i])] = torch.tensor(encoded[i], dtype=torch.long)
+                attention_mask = input_ids != 0
+
+                logits = self.model(input_ids, attention_mask)
+
+                for i, label_index in zip(indexes, logits.argmax(-1).tolist()):
+                    predictions[i] = self.labels[label_index]
+
+        logging.info(f"{len(texts)} texts classified locally.")
+
+        return predictions
+
+    def classify_comments(self, issue_title, issue_body, comments):
+        labels = self.classify([body for _, _, body in comments])
+        return [(comment_id, label) for (comment_id, _, _), label in zip(comments, labels)]
@@ -0,0 +1,188 @@
+from labels import parse_label
+import json
+import logging
+import re
+
+
+BATCH_SYSTEM_PROMPT = (
+    "You are a GitHub issue sentiment analysis expert. "
+    "You receive the title and body of an issue followed by a JSON list of its comments. "
+    "Classify each comment's sentiment as 'positive', 'negative', or 'neutral'. "
+    "Answer only with a JSON object mapping every comment_id to its label, "
+    'for example {"123": "neutral", "456": "positive"}.'
+)
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def build_batch_prompt(issue_title, issue_body, comments):
+    """
+    Builds the single user message that carries the issue context and a batch of comments.
+
+    Parameters:
+        issue_title (str):
+            Title of the issue.
+        issue_body (str):
+            Body of the issue.
+        comments (list of tuple):
+            `(comment_id, created_at, body)` rows, as returned by `get_comments_by_issue_id`.
+    """
+    payload = [
+        {"comment_id": str(comment_id), "body": comment_body}
+        for comment_id, _, comment_body in comments
+    ]
+
+    return (
+        f"The title of the issue is: {issue_title}\n"
+        f"The body of the issue is: {issue_body}\n"
+        f"The comments are: {json.dumps(payload, ensure_ascii=False)}"
+    )
+
+
+def parse_batch_response(text, comment_ids):
+    """
+    Extracts the labels of `comment_ids` from a model answer.
+
+    The answer may be wrapped in prose or a ```json fence, and may be partial:
+    unknown ids and labels `labels.parse_label` cannot map to a `Sentiment` are ignored,
+    so the caller only gets the labels it can trust and can request the rest again.
+
+    Returns:
+        dict:
+            Mapping of comment_id (as given in `comment_ids`) to label.
+    """
+    match = _JSON_OBJECT.search(text or "")
+    if not match:
+        return {}
+
+    try:
+        answer = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+
+    if not isinstance(answer, dict):
+        return {}
+
+    labels = {}
+    for comment_id in comment_ids:
+        label = answer.get(str(comment_id))
+        if not isinstance(label, str):
+            continue
+
+        sentiment = parse_label(label)
+        if sentiment is not None:
+            labels[comment_id] = sentiment.value
+
+    return labels
+
+
+def classify_comments_batched(issue_title, issue_body, comments, complete, batch_size=20, max_attempts=3):
+    """
+    Classifies the comments of an issue with stateless requests of up to `batch_size` comments each.
+
+    Every request carries the issue context once plus its batch of comments, instead of
+    resending the whole conversation for every comment. Comments missing from a malformed
+    or partial answer are sent again in a new request, up to `max_attempts` times.
+
+    Parameters:
+        issue_title (str):
+            Title of the issue.
+        issue_body (str):
+            Body of the issue.
+        comments (list of tuple):
+            `(comment_id, created_at, body)` rows.
+        complete (callable):
+            `complete(system_prompt, user_prompt) -> str`, see `openai_completer` and `genai_completer`.
+        batch_size (int, optional):
+            Maximum number of comments per request.
+        max_attempts (int, optional):
+            Number of requests a comment can take part in before being left unlabelled.
+
+    Returns:
+        list of tuple:
+            `(comment_id, label)` pairs in the order of `comments`. The label is None for
+            comments that could not be classified.
+    """
+    labels = {}
+    pending = list(comments)
+
+    for attempt in range(max_attempts):
+        if not pending:
+            break
+
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            comment_ids = [comment_id for comment_id, _, _ in batch]
+
+            logging.info(f"Classifying {len(batch)} comments in one request (attempt {attempt + 1})...")
+
+            answer = complete(BATCH_SYSTEM_PROMPT, build_batch_prompt(issue_title, issue_body, batch))
+            labels.update(parse_batch_response(answer, comment_ids))
+
+        pending = [comment for comment in pending if comment[0] not in labels]
+
+        if pending:
+            logging.warning(f"{len(pending)} comments missing from the answers, sending them again.")
+
+    for comment_id, _, _ in pending:
+        logging.error(f"Comment {comment_id} could not be classified.")
+
+    return [(comment_id, labels.get(comment_id)) for comment_id, _, _ in comments]
+
+
+def openai_completer(client, model, temperature=0.2, json_mode=True):
+    """
+    Returns a `complete(system_prompt, user_prompt)` function for an OpenAI-compatible client
+    (OpenAI, DeepSeek through `base_url`, Ollama).
+    """
+    def complete(system_prompt, user_prompt):
+        kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+
+        response = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=temperature,
+            **kwargs
+        )
+
+        return response.choices[0].message.content
+
+    return complete
+
+
+def genai_completer(client, model, temperature=0.2):
+    """
+    Returns a `complete(system_prompt, user_prompt)` function for a `google.genai` client.
+    """
+    from google.genai import types
+
+    def complete(system_prompt, user_prompt):
+        response = client.models.generate_content(
+            model=model,
+            contents=user_prompt,
+            config=types.GenerateContentConfig(
+                temperature=temperature,
+                system_instruction=system_prompt,
+                response_mime_type="application/json"
+            )
+        )
+
+        return response.text
+
+    return complete
+
+
+def analyze_issue_sentiment_openai_batched(issue_title, issue_body, comments, client, model, batch_size=20):
+    """
+    Batched, stateless counterpart of `analyze_issue_sentiment_openai`, with the same arguments and result.
+    """
+    return classify_comments_batched(
+        issue_title=issue_title,
+        issue_body=issue_body,
+        comments=comments,
+        complete=openai_completer(client, model),
+        batch_size=batch_size
+    )
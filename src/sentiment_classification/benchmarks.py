@@ -0,0 +1,527 @@
+"""
+Benchmarks for the sentiment classification stage, run against local fake providers.
+
+Run from this directory, e.g.:
+
+    python benchmarks.py batching --issues 5 --comments 40 --batch-size 20
+    python benchmarks.py dispatch --issues 100 --concurrency 16
+    python benchmarks.py local --comments 5000 --threads 4
+    python benchmarks.py agreement --comments 1000000
+    python benchmarks.py context ../../data/issue_comments/*.xlsx
+    python benchmarks.py loader --dsn postgresql://localhost/postgres --comments 50000
+    python benchmarks.py dedup ../../data/issue_comments/*.xlsx
+    python benchmarks.py rules ../../data/issue_comments/*.xlsx --dsn postgresql://localhost/postgres
+"""
+import os
+import sys
+
+# text_pipeline, used by near_duplicates.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "preprocessing"))
+
+from agreement import MODELS, AgreementTracker, agreement_report, normalize_labels
+from backends import LocalTorchBackend
+from comment_rules import filter_comments_frame, filter_comments_sql, filter_report
+from batch_classification import BATCH_SYSTEM_PROMPT, build_batch_prompt, classify_comments_batched, openai_completer
+from dispatcher import Dispatcher
+from issue_context import IssueContext
+from issue_loader import iter_issues_with_comments
+from mock_llm import MockLLMServer, label_for
+from near_duplicates import NearDuplicateIndex
+import argparse
+import logging
+import numpy as np
+import openai
+import issue_loader
+import pandas as pd
+import psycopg2
+import time
+import utils
+
+
+def synthetic_issues(num_issues, comments_per_issue):
+    issues = []
+    for issue_id in range(1, num_issues + 1):
+        comments = [
+            (
+                issue_id * 1_000 + i,
+                None,
+                f"Comment {i} on issue {issue_id}: I tried the workaround and the build still fails on my machine.",
+            )
+            for i in range(comments_per_issue)
+        ]
+        issues.append((
+            issue_id,
+            f"Issue {issue_id}: crash when loading a saved model",
+            "Steps to reproduce: load the model, call predict, observe the stack trace. " * 10,
+            comments,
+        ))
+    return issues
+
+
+def benchmark_batching(num_issues, comments_per_issue, batch_size, latency, latency_per_token, drop_rate):
+    issues = synthetic_issues(num_issues, comments_per_issue)
+    expected = {
+        comment_id: label_for(body)
+        for _, _, _, comments in issues
+        for comment_id, _, body in comments
+    }
+
+    with MockLLMServer(latency, latency_per_token) as server:
+        client = openai.OpenAI(api_key="mock", base_url=server.url)
+
+        start = time.perf_counter()
+        conversational = {}
+        for _, title, body, comments in issues:
+            conversational.update(utils.analyze_issue_sentiment_openai(title, body, comments, client, "mock"))
+        conversational_time = time.perf_counter() - start
+        conversational_requests, conversational_tokens = server.request_count, server.prompt_tokens
+
+    with MockLLMServer(latency, latency_per_token, drop_rate) as server:
+        client = openai.OpenAI(api_key="mock", base_url=server.url)
+        complete = openai_completer(client, "mock")
+
+        start = time.perf_counter()
+        batched = {}
+        for _, title, body, comments in issues:
+            batched.update(classify_comments_batched(title, body, comments, complete, batch_size))
+        batched_time = time.perf_counter() - start
+        batched_requests, batched_tokens = server.request_count, server.prompt_tokens
+
+    assert conversational == expected, "Conversational labels differ from the fake provider's"
+    assert batched == expected, "Batched labels differ from the fake provider's"
+
+    print(f"Issues: {num_issues} | comments per issue: {comments_per_issue} | batch size: {batch_size}")
+    print(f"Conversational: {conversational_requests} requests, {conversational_tokens:,} prompt tokens, {conversational_time:.2f} s")
+    print(f"Batched:        {batched_requests} requests, {batched_tokens:,} prompt tokens, {batched_time:.2f} s")
+    print(f"Tokens saved:   {1 - batched_tokens / conversational_tokens:.0%}")
+
+
+def benchmark_dispatch(num_issues, comments_per_issue, concurrency, latency, requests_per_minute):
+    issues = synthetic_issues(num_issues, comments_per_issue)
+
+    with MockLLMServer(latency) as server:
+        client = openai.OpenAI(api_key="mock", base_url=server.url, max_retries=0)
+        complete = openai_completer(client, "mock")
+
+        start = time.perf_counter()
+        serial = {issue_id: classify_comments_batched(title, body, comments, complete) for issue_id, title, body, comments in issues}
+        serial_time = time.perf_counter() - start
+
+    failures = [429, 500, 503, 429]
+    with MockLLMServer(latency, failures=failures) as server:
+        client = openai.OpenAI(api_key="mock", base_url=server.url, max_retries=0)
+        dispatcher = Dispatcher(
+            openai_completer(client, "mock"),
+            provider="openai",
+            requests_per_minute=requests_per_minute,
+            max_concurrency=concurrency,
+            backoff_base=0.05
+        )
+
+        start = time.perf_counter()
+        dispatched = dispatcher.run(issues)
+        dispatch_time = time.perf_counter() - start
+        max_in_flight = server.max_in_flight
+
+    assert dispatched == serial, "Dispatcher labels differ from the serial run"
+    assert not dispatcher.failures, f"Issues failed despite retries: {dispatcher.failures}"
+
+    print(f"Issues: {num_issues} | comments per issue: {comments_per_issue} | injected failures: {failures}")
+    print(f"Serial:     {serial_time:.2f} s ({num_issues / serial_time:.1f} issues/s)")
+    print(f"Dispatcher: {dispatch_time:.2f} s ({num_issues / dispatch_time:.1f} issues/s), "
+          f"{max_in_flight} requests in flight at most, limit {requests_per_minute} requests/min")
+
+
+def benchmark_local(num_comments, batch_size, threads):
+    import torch
+
+    torch.manual_seed(0)
+    backend = LocalTorchBackend(batch_size=batch_size, num_threads=threads)
+
+    texts = [
+        ("Thanks, the fix works! " * (i % 7 + 1)) + ("Still failing on Windows with CUDA 12. " * (i % 13))
+        for i in range(num_comments)
+    ]
+
+    start = time.perf_counter()
+    one_by_one = [backend.classify([text])[0] for text in texts[:200]]
+    single_rate = 200 / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    batched = backend.classify(texts)
+    batched_time = time.perf_counter() - start
+
+    assert batched[:200] == one_by_one, "Batched predictions differ from single-text predictions"
+
+    print(f"Comments: {num_comments} | batch size: {batch_size} | threads: {torch.get_num_threads()}")
+    print(f"One by one: {single_rate:,.0f} comments/s")
+    print(f"Batched:    {num_comments / batched_time:,.0f} comments/s ({batched_time:.2f} s)")
+
+
+def benchmark_agreement(num_comments, relabelled, seed=0):
+    rng = np.random.default_rng(seed)
+    answers = np.array(["Negative.", "neutral", "Positive\n", "The sentiment is neutral", None, "positive or negative"], dtype=object)
+    truth = rng.integers(0, 3, num_comments)
+
+    raw = {}
+    for model in MODELS:
+        # Each model agrees with the others on about 70% of the comments, with some free-text noise.
+        codes = np.where(rng.random(num_comments) < 0.3, rng.integers(0, 3, num_comments), truth)
+        codes = np.where(rng.random(num_comments) < 0.05, rng.integers(3, 6, num_comments), codes)
+        raw[model] = answers[codes]
+
+    start = time.perf_counter()
+    labels = pd.DataFrame(
+        {"release": rng.choice(["2.12", "2.13", "2.14"], num_comments), **{model: normalize_labels(raw[model]) for model in MODELS}},
+        index=pd.RangeIndex(num_comments, name="comment_id")
+    )
+    normalize_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    report = agreement_report(labels)
+    report_time = time.perf_counter() - start
+
+    tracker = AgreementTracker()
+    tracker.update(labels)
+    changed = labels.iloc[:relabelled].copy()
+    changed[MODELS[0]] = 0
+
+    start = time.perf_counter()
+    tracker.update(changed)
+    update_time = time.perf_counter() - start
+
+    print(f"Comments: {num_comments} | models: {', '.join(MODELS)}")
+    print(f"Normalization:        {normalize_time:.2f} s")
+    print(f"Full report:          {report_time:.2f} s (Fleiss' kappa {report['fleiss_kappa']:.3f})")
+    print(f"Incremental update:   {update_time:.2f} s ({relabelled} relabelled comments)")
+
+
+def request_tokens(comments, count, batch_size):
+    """
+    Tokens of each request sent for the comments of one issue: the conversation of
+    `utils.analyze_issue_sentiment_openai` (each request resends the previous comments
+    and answers) and the batched prompt of `batch_classification`.
+    """
+    conversational = []
+    history = count(utils.SYSTEM_PROMPT)
+    for _, _, body in comments:
+        history += count(f"Classify the sentiment of this comment: {body}") + 1
+        conversational.append(history)
+
+    batched = [
+        count(BATCH_SYSTEM_PROMPT) + count(build_batch_prompt("", "", comments[start:start + batch_size]))
+        for start in range(0, len(comments), batch_size)
+    ]
+    return conversational, batched
+
+
+def benchmark_context(paths, budget, comment_budget, batch_size):
+    issue_context = IssueContext(budget, comment_budget)
+    count = issue_context.count
+
+    print(f"Comment budget: {comment_budget} tokens | batch size: {batch_size}")
+    for path in paths:
+        frame = pd.read_excel(path).dropna(subset=["body"]).sort_values(["issue_id", "created_at"])
+
+        sizes = {"conversational": ([], []), "batched": ([], [])}
+        start = time.perf_counter()
+        for _, issue in frame.groupby("issue_id", sort=False):
+            comments = list(zip(issue["comment_id"], issue["created_at"], issue["body"].astype(str)))
+            for before, after, kind in zip(
+                request_tokens(comments, count, batch_size),
+                request_tokens(issue_context.compress_comments(comments), count, batch_size),
+                sizes
+            ):
+                sizes[kind][0].extend(before)
+                sizes[kind][1].extend(after)
+        elapsed = time.perf_counter() - start
+
+        print(f"\n{path}: {len(frame)} comments, {frame['issue_id'].nunique()} issues ({elapsed:.2f} s)")
+        for kind, (before, after) in sizes.items():
+            before, after = pd.Series(before), pd.Series(after)
+            print(
+                f"  {kind:<15} requests: {len(before):>5} | mean {before.mean():>7,.0f} -> {after.mean():>7,.0f}"
+                f" | p95 {before.quantile(0.95):>7,.0f} -> {after.quantile(0.95):>7,.0f}"
+                f" | max {before.max():>7,.0f} -> {after.max():>7,.0f}"
+                f" | total {before.sum():>10,} -> {after.sum():>10,} ({1 - after.sum() / before.sum():.1%} saved)"
+            )
+
+
+def _create_release(conn, num_comments, comments_per_issue):
+    # Unindexed tables, as created by the collection notebooks, in a throwaway schema.
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        DROP SCHEMA IF EXISTS classification_benchmark CASCADE;
+        CREATE SCHEMA classification_benchmark;
+        SET search_path TO classification_benchmark;
+
+        CREATE TABLE issues_from_release (
+            issue_id BIGINT PRIMARY KEY,
+            release_number TEXT,
+            title TEXT,
+            body TEXT
+        );
+
+        CREATE TABLE issue_comments_from_release (
+            comment_id BIGINT PRIMARY KEY,
+            issue_id BIGINT,
+            created_at TIMESTAMP,
+            body TEXT
+        );
+        """
+    )
+
+    num_issues = num_comments // comments_per_issue
+    cursor.execute(
+        """
+        INSERT INTO issues_from_release
+        SELECT i, 'v2.12.0', 'Issue ' || i, repeat('Steps to reproduce the crash. ', 20)
+        FROM generate_series(1, %s) AS i;
+
+        INSERT INTO issue_comments_from_release
+        SELECT n, n %% %s + 1, timestamp '2024-01-01' + n * interval '1 minute', 'Comment ' || n || ', still failing here.'
+        FROM generate_series(1, %s) AS n;
+        """,
+        (num_issues, num_issues, num_issues * comments_per_issue)
+    )
+    conn.commit()
+    issue_loader._prepared.pop(conn, None)
+
+
+def _per_issue_loop(conn, release):
+    # Query per issue of the classification notebooks.
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT issue_id, title, body FROM issues_from_release WHERE release_number LIKE %s ORDER BY issue_id;",
+        (f"%{release}%",)
+    )
+
+    issues = []
+    for issue in cursor.fetchall():
+        cursor.execute(
+            "SELECT comment_id, created_at, body FROM issue_comments_from_release WHERE issue_id = %s ORDER BY created_at;",
+            (issue[0],)
+        )
+        issues.append((issue, cursor.fetchall()))
+
+    conn.commit()
+    return issues
+
+
+def benchmark_loader(dsn, num_comments, comments_per_issue, chunk_size):
+    with psycopg2.connect(dsn) as conn:
+        _create_release(conn, num_comments, comments_per_issue)
+
+        start = time.perf_counter()
+        expected = _per_issue_loop(conn, "2.12")
+        loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        issue_loader.ensure_comment_index(conn)
+        index_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _per_issue_loop(conn, "2.12")
+        indexed_loop_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        loaded = list(iter_issues_with_comments(conn, "2.12", chunk_size))
+        loader_time = time.perf_counter() - start
+
+        assert loaded == expected, "The loader returned different issues or comments"
+
+        print(f"Issues: {len(expected)} | comments: {num_comments} | chunk size: {chunk_size}")
+        print(f"Query per issue, no index:  {loop_time:6.2f} s")
+        print(f"Query per issue, indexed:   {indexed_loop_time:6.2f} s (index built in {index_time:.2f} s)")
+        print(f"Single streamed query:      {loader_time:6.2f} s, {loop_time / loader_time:.0f}x")
+
+        conn.cursor().execute("DROP SCHEMA classification_benchmark CASCADE;")
+
+
+def benchmark_dedup(paths, threshold, label_column):
+    print(f"Threshold: {threshold} | label agreement checked on {label_column}")
+    total_comments = total_calls = 0
+    for path in paths:
+        frame = pd.read_excel(path).dropna(subset=["body"]).sort_values(["issue_id", "created_at"])
+
+        index = NearDuplicateIndex(threshold=threshold)
+        start = time.perf_counter()
+        for comment_id, body in zip(frame["comment_id"], frame["body"].astype(str)):
+            index.add(comment_id, body)
+        elapsed = time.perf_counter() - start
+
+        # Propagates the stored label of each representative and compares it with the members' own labels.
+        stored = dict(zip(frame["comment_id"], frame[label_column]))
+        members = [
+            (stored[comment_id], stored[representative])
+            for comment_id, (representative, _) in index.assignments.items()
+            if comment_id != representative and pd.notna(stored[comment_id]) and pd.notna(stored[representative])
+        ]
+        agreement = np.mean([own == propagated for own, propagated in members]) if members else float("nan")
+
+        stats = index.stats()
+        total_comments += stats["comments"]
+        total_calls += stats["clusters"]
+        clusters = sorted(index.clusters().items(), key=lambda item: -len(item[1]))
+        bodies = dict(zip(frame["comment_id"], frame["body"].astype(str)))
+
+        print(f"\n{path}: {stats['comments']} comments in {elapsed:.2f} s")
+        print(
+            f"  LLM calls: {stats['comments']} -> {stats['clusters']}"
+            f" ({stats['calls_saved']} saved, {stats['saved_share']:.1%})"
+            f" | propagated label equal to the stored one: {agreement:.1%} of {len(members)} labelled members"
+        )
+        for representative, members in clusters[:3]:
+            print(f"  {len(members):>4} x {' '.join(bodies[representative].split())[:90]}")
+
+    print(f"\nTotal: {total_comments} comments -> {total_calls} LLM calls ({1 - total_calls / total_comments:.1%} saved)")
+
+
+def _load_corpora(conn, frame):
+    # The xlsx corpora as a release, in a throwaway schema.
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        DROP SCHEMA IF EXISTS rules_benchmark CASCADE;
+        CREATE SCHEMA rules_benchmark;
+        SET search_path TO rules_benchmark;
+
+        CREATE TABLE issues_from_release (
+            issue_id BIGINT PRIMARY KEY,
+            release_number TEXT,
+            repo_name TEXT
+        );
+
+        CREATE TABLE issue_comments_from_release (
+            comment_id BIGINT PRIMARY KEY,
+            issue_id BIGINT,
+            author TEXT,
+            body TEXT
+        );
+        """
+    )
+    issues = frame.drop_duplicates("issue_id")
+    cursor.executemany(
+        "INSERT INTO issues_from_release VALUES (%s, 'corpora', %s);",
+        list(zip(issues["issue_id"].astype(int).tolist(), issues["repo"]))
+    )
+    cursor.executemany(
+        "INSERT INTO issue_comments_from_release VALUES (%s, %s, %s, %s);",
+        list(zip(
+            frame["comment_id"].astype(int).tolist(), frame["issue_id"].astype(int).tolist(),
+            frame["author"].where(frame["author"].notna(), None), frame["body"].where(frame["body"].notna(), None)
+        ))
+    )
+    conn.commit()
+
+
+def benchmark_rules(paths, dsn):
+    frame = pd.concat(
+        [pd.read_excel(path).assign(repo=str(path).split("/")[-1].split("_")[0]) for path in paths],
+        ignore_index=True
+    )
+
+    start = time.perf_counter()
+    filtered = filter_comments_frame(frame)
+    pandas_time = time.perf_counter() - start
+
+    report = filter_report(filtered)
+    print(f"Comments: {len(frame)} | pandas pass: {pandas_time * 1000:.1f} ms")
+    print(report.to_string(formatters={"removed_share": "{:.1%}".format}))
+    print(filtered["rule"].value_counts().to_string())
+
+    if dsn is None:
+        return
+
+    with psycopg2.connect(dsn) as conn:
+        _load_corpora(conn, frame)
+
+        start = time.perf_counter()
+        filter_comments_sql(conn)
+        sql_time = time.perf_counter() - start
+
+        cursor = conn.cursor()
+        cursor.execute("SELECT comment_id, rule FROM comment_filters;")
+        flagged = dict(cursor.fetchall())
+
+        cursor.execute("DROP SCHEMA rules_benchmark CASCADE;")
+        conn.commit()
+
+    expected = dict(zip(filtered["comment_id"], filtered["rule"]))
+    expected = {int(comment_id): rule for comment_id, rule in expected.items() if rule is not None}
+    assert flagged == expected, "The SQL pass flagged different comments"
+    print(f"SQL pass: {sql_time * 1000:.1f} ms, same {len(flagged)} comments flagged")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    batching_parser = subparsers.add_parser("batching", help="Conversational vs batched classification")
+    batching_parser.add_argument("--issues", type=int, default=5)
+    batching_parser.add_argument("--comments", type=int, default=40)
+    batching_parser.add_argument("--batch-size", type=int, default=20)
+    batching_parser.add_argument("--latency", type=float, default=0.02)
+    batching_parser.add_argument("--latency-per-token", type=float, default=0.00001)
+    batching_parser.add_argument("--drop-rate", type=float, default=0.05)
+
+    dispatch_parser = subparsers.add_parser("dispatch", help="Serial loop vs async dispatcher")
+    dispatch_parser.add_argument("--issues", type=int, default=100)
+    dispatch_parser.add_argument("--comments", type=int, default=10)
+    dispatch_parser.add_argument("--concurrency", type=int, default=16)
+    dispatch_parser.add_argument("--latency", type=float, default=0.05)
+    dispatch_parser.add_argument("--requests-per-minute", type=int, default=6000)
+
+    local_parser = subparsers.add_parser("local", help="Local CPU backend throughput")
+    local_parser.add_argument("--comments", type=int, default=5000)
+    local_parser.add_argument("--batch-size", type=int, default=64)
+    local_parser.add_argument("--threads", type=int, default=None)
+
+    agreement_parser = subparsers.add_parser("agreement", help="Multi-model agreement over a synthetic corpus")
+    agreement_parser.add_argument("--comments", type=int, default=1_000_000)
+    agreement_parser.add_argument("--relabelled", type=int, default=10_000)
+
+    context_parser = subparsers.add_parser("context", help="Per-request tokens before and after context compression")
+    context_parser.add_argument("paths", nargs="+", help="*_data_issue_comments.xlsx files")
+    context_parser.add_argument("--budget", type=int, default=1024)
+    context_parser.add_argument("--comment-budget", type=int, default=512)
+    context_parser.add_argument("--batch-size", type=int, default=20)
+
+    loader_parser = subparsers.add_parser("loader", help="Query per issue vs single streamed query")
+    loader_parser.add_argument("--dsn", required=True)
+    loader_parser.add_argument("--comments", type=int, default=50_000)
+    loader_parser.add_argument("--comments-per-issue", type=int, default=10)
+    loader_parser.add_argument("--chunk-size", type=int, default=5000)
+
+    dedup_parser = subparsers.add_parser("dedup", help="LLM calls saved by near-duplicate clustering")
+    dedup_parser.add_argument("paths", nargs="+")
+    dedup_parser.add_argument("--threshold", type=float, default=0.8)
+    dedup_parser.add_argument("--label-column", default="sentimento_bertweet")
+
+    rules_parser = subparsers.add_parser("rules", help="Share of the comments removed by the bot/template rules")
+    rules_parser.add_argument("paths", nargs="+")
+    rules_parser.add_argument("--dsn")
+
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.benchmark == "batching":
+        benchmark_batching(
+            args.issues, args.comments, args.batch_size, args.latency, args.latency_per_token, args.drop_rate
+        )
+    elif args.benchmark == "dispatch":
+        benchmark_dispatch(args.issues, args.comments, args.concurrency, args.latency, args.requests_per_minute)
+    elif args.benchmark == "local":
+        benchmark_local(args.comments, args.batch_size, args.threads)
+    elif args.benchmark == "agreement":
+        benchmark_agreement(args.comments, args.relabelled)
+    elif args.benchmark == "context":
+        benchmark_context(args.paths, args.budget, args.comment_budget, args.batch_size)
+    elif args.benchmark == "rules":
+        benchmark_rules(args.paths, args.dsn)
+    elif args.benchmark == "dedup":
+        benchmark_dedup(args.paths, args.threshold, args.label_column)
+    elif args.benchmark == "loader":
+        benchmark_loader(args.dsn, args.comments, args.comments_per_issue, args.chunk_size)
@@ -0,0 +1,284 @@
+from labels import Sentiment
+from sentiment_store import ensure_sentiments_table
+import logging
+import pandas as pd
+
+
+# Rules applied before any comment reaches an LLM, the first matching rule winning.
+# `exclude` drops the comment from classification and from the sentiment counts of
+# `data_visualization.aggregation`, `label` gives it a fixed label. Patterns are matched
+# case-insensitively, and are valid both as Python and as PostgreSQL (`~*`) regular expressions.
+RULES = [
+    {
+        "name": "bot_account",
+        "field": "author",
+        "pattern": r"\[bot\]$",
+        "action": "exclude",
+        "label": None,
+    },
+    {
+        "name": "known_bot",
+        "field": "author",
+        "pattern": (
+            r"^(?:grafanabot|tensorflow-?bot|tensorflowbutler|google-ml-butler|googlebot|copybara-service"
+            r"|vscodebot|vscode-triage-bot|vs-code-engineering|github-actions|stale|dependabot|codecov)$"
+        ),
+        "action": "exclude",
+        "label": None,
+    },
+    {
+        "name": "me_too",
+        "field": "body",
+        "pattern": r"^\s*(?:\+1|:\+1:|me too|same here)[.!]*\s*$",
+        "action": "exclude",
+        "label": None,
+    },
+    {
+        "name": "stale_notice",
+        "field": "body",
+        "pattern": r"(?:is|marked as) stale because|closed because it has been inactive",
+        "action": "label",
+        "label": Sentiment.NEUTRAL,
+    },
+    {
+        "name": "inactivity_closing",
+        "field": "body",
+        "pattern": r"closing this issue due to inactivity",
+        "action": "label",
+        "label": Sentiment.NEUTRAL,
+    },
+    {
+        "name": "satisfaction_survey",
+        "field": "body",
+        "pattern": r"are you satisfied with the resolution of your issue",
+        "action": "label",
+        "label": Sentiment.NEUTRAL,
+    },
+    {
+        "name": "duplicate_notice",
+        "field": "body",
+        "pattern": r"^\s*(?:duplicate of|closing as (?:a )?duplicate of) #?[0-9]+",
+        "action": "label",
+        "label": Sentiment.NEUTRAL,
+    },
+]
+
+
+def ensure_filters_table(cursor):
+    # Not cached per connection: callers run it inside their own transaction, which may
+    # still be rolled back, and `IF NOT EXISTS` is cheap once the table exists.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS comment_filters (
+            comment_id BIGINT PRIMARY KEY,
+            rule TEXT,
+            action TEXT,
+            label TEXT,
+            filtered_at TIMESTAMP DEFAULT now()
+        );
+        """
+    )
+
+
+def _label(rule):
+    return rule["label"].value if rule["label"] is not None else None
+
+
+def filter_comments_sql(conn, release=None, rules=RULES):
+    """
+    Flags the comments matched by `rules` in `comment_filters`, with a single
+    `INSERT ... SELECT` joining `issue_comments_from_release` with the rules.
+
+    Flagged comments are then skipped by `issue_loader.iter_issues_with_comments` and
+    `work_queue.create_run` (with `skip_filtered=True`), and the fixed labels are saved
+    for a model with `apply_rule_labels`. Comments that no longer match any rule keep
+    their previous flag until `comment_filters` is cleared.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        release (str, optional):
+            Release to filter (matched with `LIKE '%release%'`). Defaults to every comment.
+        rules (list of dict, optional):
+            Rules to apply, in priority order.
+
+    Returns:
+        dict:
+            Number of comments flagged by each rule.
+    """
+    cursor = conn.cursor()
+    ensure_filters_table(cursor)
+
+    placeholders = ", ".join(["(%s::int, %s, %s, %s, %s, %s)"] * len(rules))
+    params = [
+        value
+        for priority, rule in enumerate(rules)
+        for value in (priority, rule["name"], rule["field"], rule["pattern"], rule["action"], _label(rule))
+    ]
+
+    release_clause = ""
+    if release is not None:
+        release_clause = """
+            AND c.issue_id IN (
+                SELECT issue_id FROM issues_from_release WHERE release_number LIKE %s
+            )
+        """
+        params.append(f"%{release}%")
+
+    cursor.execute(
+        f"""
+        INSERT INTO comment_filters (comment_id, rule, action, label)
+        SELECT DISTINCT ON (c.comment_id)
+            c.comment_id, r.rule, r.action, r.label
+        FROM
+            issue_comments_from_release c
+        JOIN
+            (VALUES {placeholders}) AS r(priority, rule, field, pattern, action, label)
+            ON (r.field = 'author' AND c.author ~* r.pattern) OR (r.field = 'body' AND c.body ~* r.pattern)
+        WHERE
+            TRUE {release_clause}
+        ORDER BY
+            c.comment_id, r.priority
+        ON CONFLICT (comment_id) DO UPDATE SET
+            rule = EXCLUDED.rule,
+            action = EXCLUDED.action,
+            label = EXCLUDED.label,
+            filtered_at = now()
+        RETURNING rule;
+        """,
+        params
+    )
+    flagged = pd.Series([row[0] for row in cursor.fetchall()], dtype=object).value_counts().to_dict()
+
+    conn.commit()
+
+    logging.info(f"{sum(flagged.values())} comments flagged by the rules: {flagged}")
+
+    return flagged
+
+
+def apply_rule_labels(cursor, model, release=None):
+    """
+    Saves the fixed label of every comment flagged with a `label` rule as its label for
+    `model` in `comment_sentiments` (with `rule:<name>` as the raw answer), so the counts
+    of the model cover them without a request. Labels already given by the model are kept.
+
+    Returns:
+        int:
+            Number of labels saved. The caller commits.
+    """
+    ensure_sentiments_table(cursor)
+    ensure_filters_table(cursor)
+
+    params = [model]
+    release_clause = ""
+    if release is not None:
+        release_clause = """
+            AND c.issue_id IN (
+                SELECT issue_id FROM issues_from_release WHERE release_number LIKE %s
+            )
+        """
+        params.append(f"%{release}%")
+
+    cursor.execute(
+        f"""
+        INSERT INTO comment_sentiments (comment_id, model, label, raw_label)
+        SELECT
+            f.comment_id, %s, f.label, 'rule:' || f.rule
+        FROM
+            comment_filters f
+        JOIN
+            issue_comments_from_release c ON c.comment_id = f.comment_id
+        WHERE
+            f.action = 'label' {release_clause}
+        ON CONFLICT (comment_id, model) DO NOTHING;
+        """,
+        params
+    )
+    saved = cursor.rowcount
+
+    logging.info(f"{saved} rule labels saved for model {model}.")
+
+    return saved
+
+
+def filter_comments_frame(frame, rules=RULES):
+    """
+    Vectorized version of `filter_comments_sql` for a DataFrame with `author` and `body`
+    columns (ex.: the xlsx corpora or a Parquet snapshot).
+
+    Returns:
+        pandas.DataFrame:
+            A copy of `frame` with the `rule`, `action` and `rule_label` of the first matching
+            rule, or None in the three columns for the comments to classify.
+    """
+    frame = frame.copy()
+    frame["rule"] = None
+    frame["action"] = None
+    frame["rule_label"] = None
+
+    unmatched = pd.Series(True, index=frame.index)
+    for rule in rules:
+        values = frame[rule["field"]].astype("string")
+        matched = unmatched & values.str.contains(rule["pattern"], case=False, regex=True, na=False)
+
+        frame.loc[matched, "rule"] = rule["name"]
+        frame.loc[matched, "action"] = rule["action"]
+        frame.loc[matched, "rule_label"] = _label(rule)
+        unmatched &= ~matched
+
+    return frame
+
+
+def filter_report(frame, by="repo"):
+    """
+    Share of the comments of each `by` group removed from the LLM traffic.
+
+    Parameters:
+        frame (pandas.DataFrame):
+            Output of `filter_comments_frame`, with a `by` column.
+
+    Returns:
+        pandas.DataFrame:
+            `comments`, `excluded`, `labelled`, `to_classify` and `removed_share` per group.
+    """
+    report = frame.groupby(by).agg(
+        comments=("action", "size"),
+        excluded=("action", lambda action: (action == "exclude").sum()),
+        labelled=("action", lambda action: (action == "label").sum()),
+    )
+    report["to_classify"] = report["comments"] - report["excluded"] - report["labelled"]
+    report["removed_share"] = (report["excluded"] + report["labelled"]) / report["comments"]
+    return report
+
+
+def filter_report_sql(conn):
+    """
+    `filter_report` of the flagged comments of `issue_comments_from_release`, per repository.
+    """
+    cursor = conn.cursor()
+    ensure_filters_table(cursor)
+
+    cursor.execute(
+        """
+        SELECT
+            i.repo_name,
+            COUNT(*) AS comments,
+            COUNT(*) FILTER (WHERE f.action = 'exclude') AS excluded,
+            COUNT(*) FILTER (WHERE f.action = 'label') AS labelled
+        FROM
+            issue_comments_from_release c
+        JOIN
+            issues_from_release i ON i.issue_id = c.issue_id
+        LEFT JOIN
+            comment_filters f ON f.comment_id = c.comment_id
+        GROUP BY
+            i.repo_name
+        ORDER BY
+            i.repo_name;
+        """
+    )
+    report = pd.DataFrame(cursor.fetchall(), columns=["repo", "comments", "excluded", "labelled"]).set_index("repo")
+    report["to_classify"] = report["comments"] - report["excluded"] - report["labelled"]
+    report["removed_share"] = (report["excluded"] + report["labelled"]) / report["comments"]
+    return report
@@ -0,0 +1,214 @@
+from batch_classification import classify_comments_batched
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+import logging
+import random
+import time
+
+
+# Default per-provider limits (requests/min, tokens/min). None means unlimited.
+PROVIDER_LIMITS = {
+    "openai": (500, 200_000),
+    "deepseek": (300, 1_000_000),
+    "gemini": (2_000, 4_000_000),
+    "ollama": (None, None),
+}
+
+TRANSIENT_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (about 4 characters per token) used for throttling."""
+    return len(text) // 4 + 1
+
+
+def is_transient(error):
+    """
+    Tells whether an error raised by a provider client is worth retrying:
+    rate limits, server errors, timeouts and dropped connections.
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if status in TRANSIENT_STATUSES:
+        return True
+
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    name = type(error).__name__
+    return "Connection" in name or "Timeout" in name
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket refilled continuously at `per_minute` units per minute.
+
+    Parameters:
+        per_minute (int or None):
+            Refill rate. None disables the limit.
+    """
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.available = per_minute
+        self.updated = time.monotonic()
+        self._lock = None
+
+    async def acquire(self, amount=1):
+        if self.per_minute is None:
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        amount = min(amount, self.capacity)
+        rate = self.per_minute / 60
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * rate)
+                self.updated = now
+
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+
+                await asyncio.sleep((amount - self.available) / rate)
+
+
+class Dispatcher:
+    """
+    Classifies many issues concurrently while respecting the provider's rate limits.
+
+    Each issue runs `classify_comments_batched` in a worker thread. Every request
+    it makes first takes one unit from the requests/min bucket and its estimated
+    prompt size from the tokens/min bucket. Transient errors are retried with
+    jittered exponential backoff. An issue that still fails is recorded in
+    `failures` and does not stop the others.
+
+    Parameters:
+        complete (callable):
+            `complete(system_prompt, user_prompt) -> str`, see `batch_classification`.
+        provider (str, optional):
+            Key of `PROVIDER_LIMITS` giving the default limits.
+        requests_per_minute (int, optional):
+            Overrides the provider's requests/min limit.
+        tokens_per_minute (int, optional):
+            Overrides the provider's tokens/min limit.
+        max_concurrency (int, optional):
+            Maximum number of issues being classified at the same time.
+        max_retries (int, optional):
+            Retries of a request before its issue is marked as failed.
+        backoff_base (float, optional):
+            Base delay, in seconds, of the exponential backoff.
+        batch_size (int, optional):
+            Comments per request, see `classify_comments_batched`.
+        issue_context (IssueContext, optional):
+            Compresses the issues and comments to its token budgets before they are sent.
+    """
+
+    def __init__(
+        self,
+        complete,
+        provider="openai",
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_concurrency=16,
+        max_retries=5,
+        backoff_base=1.0,
+        batch_size=20,
+        issue_context=None,
+    ):
+        default_rpm, default_tpm = PROVIDER_LIMITS[provider]
+
+        self.complete = complete
+        self.requests = TokenBucket(requests_per_minute or default_rpm)
+        self.tokens = TokenBucket(tokens_per_minute or default_tpm)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.batch_size = batch_size
+        self.issue_context = issue_context
+
+        self.results = {}
+        self.failures = {}
+
+    def _throttled_complete(self, loop):
+        def complete(system_prompt, user_prompt):
+            tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+
+            for attempt in range(self.max_retries + 1):
+                asyncio.run_coroutine_threadsafe(self._acquire(tokens), loop).result()
+
+                try:
+                    return self.complete(system_prompt, user_prompt)
+                except Exception as e:
+                    if not is_transient(e) or attempt == self.max_retries:
+                        raise
+
+                    delay = random.uniform(0, self.backoff_base * 2 ** attempt)
+                    logging.warning(f"Transient error from the provider ({e}), retrying in {delay:.1f}s")
+                    time.sleep(delay)
+
+        return complete
+
+    async def _acquire(self, tokens):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+    async def _classify_issue(self, issue, semaphore, executor, complete):
+        issue_id, issue_title, issue_body, comments = issue
+        loop = asyncio.get_running_loop()
+
+        if self.issue_context is not None:
+            issue_title, issue_body = self.issue_context.compress_issue(issue_id, issue_title, issue_body)
+            comments = self.issue_context.compress_comments(comments)
+
+        async with semaphore:
+            try:
+                self.results[issue_id] = await loop.run_in_executor(
+                    executor,
+                    partial(
+                        classify_comments_batched,
+                        issue_title,
+                        issue_body,
+                        comments,
+                        complete,
+                        self.batch_size
+                    )
+                )
+                logging.info(f"Issue {issue_id} classified ({len(comments)} comments).")
+            except Exception as e:
+                self.failures[issue_id] = e
+                logging.error(f"Error when classifying issue {issue_id}: {e}")
+
+    async def dispatch(self, issues):
+        """
+        Classifies `issues`, a list of `(issue_id, title, body, comments)` tuples.
+
+        Returns:
+            dict:
+                Mapping of issue_id to its list of `(comment_id, label)` pairs.
+                Failed issues are left out and listed in `self.failures`.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        complete = self._throttled_complete(loop)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            await asyncio.gather(
+                *(self._classify_issue(issue, semaphore, executor, complete) for issue in issues)
+            )
+
+        logging.info(f"{len(self.results)} issues classified, {len(self.failures)} failed.")
+
+        return self.results
+
+    def run(self, issues):
+        """
+        Synchronous entry point of `dispatch`, for scripts. Inside a notebook, where an
+        event loop is already running, use `await dispatcher.dispatch(issues)` instead.
+        """
+        return asyncio.run(self.dispatch(issues))
@@ -0,0 +1,208 @@
+from collections import OrderedDict
+import logging
+import math
+import re
+import threading
+
+
+# Pieces of the GPT pre-tokenizer (words with their leading space, 1-3 digit numbers,
+# punctuation runs, whitespace); common English pieces are one token each.
+_PIECES = re.compile(r" ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|\s+(?!\S)|\s+")
+
+# Parts of a log line that change between otherwise repeated lines: numbers, hex ids, timestamps.
+_VOLATILE = re.compile(r"0x[0-9a-fA-F]+|[0-9a-fA-F]{8,}|\d+(?:[.:]\d+)*")
+
+_BLANK_LINES = re.compile(r"\n\s*\n(?:\s*\n)+")
+
+
+def approximate_tokens(text):
+    """
+    Token estimate from the pieces of the GPT pre-tokenizer, used when tiktoken is not available.
+    A piece counts for at least one token per 4 characters, so a long unbroken run (a base64
+    blob, a hash, a minified log line) is not counted as a single token.
+    """
+    return sum(math.ceil(len(piece) / 4) for piece in _PIECES.findall(text)) if text else 0
+
+
+def load_tokenizer(encoding="o200k_base"):
+    """
+    Returns a `count(text) -> int` function backed by a local tiktoken encoding
+    (o200k_base is the one of gpt-4o-mini).
+
+    Falls back to `approximate_tokens` when tiktoken or its encoding file is not
+    available (the file is downloaded on first use).
+    """
+    try:
+        import tiktoken
+
+        encode = tiktoken.get_encoding(encoding).encode_ordinary
+    except Exception as e:
+        logging.warning(f"tiktoken encoding {encoding} unavailable ({e}), token counts are estimated.")
+        return approximate_tokens
+
+    return lambda text: len(encode(text)) if text else 0
+
+
+def collapse_repeated_lines(text, min_repeats=2):
+    """
+    Collapses runs of log lines that differ only in numbers, addresses or timestamps
+    into their first line and a `[... repeated N more times]` note, and runs of blank
+    lines into a single one. Runs shorter than `min_repeats` repeats are kept as they are.
+    """
+    lines = _BLANK_LINES.sub("\n\n", text).split("\n")
+
+    collapsed = []
+    run = []
+    for line in lines + [None]:
+        shape = _VOLATILE.sub("0", line.strip()) if line is not None else None
+        if run and shape and shape == run[0][0]:
+            run.append((shape, line))
+            continue
+
+        if len(run) > min_repeats:
+            collapsed.append(run[0][1])
+            collapsed.append(f"[... repeated {len(run) - 1} more times]")
+        else:
+            collapsed.extend(line for _, line in run)
+        run = [(shape, line)]
+
+    return "\n".join(collapsed)
+
+
+def _cut(line, tokens, budget, from_end=False):
+    # Characters in proportion of the budget; a long line is usually a single log record.
+    chars = len(line) * budget // max(tokens, 1)
+    return line[len(line) - chars:] if from_end else line[:chars]
+
+
+def compress_text(text, budget, count=approximate_tokens, head_share=0.6):
+    """
+    Fits a text in `budget` tokens.
+
+    Repeated log lines are collapsed first; if the text is still too long, its first
+    and last lines are kept (`head_share` of the budget for the head) and the middle is
+    replaced by a `[... N lines omitted ...]` note.
+
+    Parameters:
+        text (str):
+            Text to compress. Non-string values (ex.: an issue without body) are returned unchanged.
+        budget (int):
+            Maximum number of tokens of the result.
+        count (callable, optional):
+            `count(text) -> int`, see `load_tokenizer`.
+        head_share (float, optional):
+            Share of the budget given to the beginning of the text.
+    """
+    if not isinstance(text, str) or count(text) <= budget:
+        return text
+
+    text = collapse_repeated_lines(text)
+    if count(text) <= budget:
+        return text
+
+    lines = text.split("\n")
+    tokens = [count(line) + 1 for line in lines]
+    budget -= count("[... 100000 lines omitted ...]") + 2
+
+    head, head_budget = [], int(budget * head_share)
+    for line, line_tokens in zip(lines, tokens):
+        if line_tokens > head_budget:
+            if not head:
+                head.append(_cut(line, line_tokens, head_budget))
+                head_budget = 0
+            break
+        head.append(line)
+        head_budget -= line_tokens
+
+    tail, tail_budget = [], budget - int(budget * head_share) + max(head_budget, 0)
+    for line, line_tokens in zip(reversed(lines[len(head):]), reversed(tokens[len(head):])):
+        if line_tokens > tail_budget:
+            if not tail:
+                tail.append(_cut(line, line_tokens, tail_budget, from_end=True))
+            break
+        tail.append(line)
+        tail_budget -= line_tokens
+    tail.reverse()
+
+    omitted = len(lines) - len(head) - len(tail)
+    note = f"[... {omitted} lines omitted ...]" if omitted > 0 else "[...]"
+    return "\n".join(head + [note] + tail)
+
+
+class IssueContext:
+    """
+    Builds the issue context sent with every classification request within a token budget.
+
+    Long bodies (tracebacks, build logs) are compressed with `compress_text`, and the
+    result is kept per issue_id, so the comments of an issue (and later models) reuse it.
+    The counters `original_tokens` and `compressed_tokens` track the effect of the budget.
+
+    Parameters:
+        budget (int, optional):
+            Maximum tokens of the issue title and body.
+        comment_budget (int, optional):
+            Maximum tokens of each comment, see `compress_comments`. None (the default)
+            sends the comments unchanged, since they are the text being classified.
+        count (callable, optional):
+            `count(text) -> int`. Defaults to `load_tokenizer()`.
+        max_issues (int, optional):
+            Issues kept in the cache; the least recently used are dropped.
+    """
+
+    def __init__(self, budget=1024, comment_budget=None, count=None, max_issues=10_000):
+        self.budget = budget
+        self.comment_budget = comment_budget
+        self.count = count or load_tokenizer()
+        self.max_issues = max_issues
+        self.hits = 0
+        self.misses = 0
+        self.original_tokens = 0
+        self.compressed_tokens = 0
+        self._issues = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compress_issue(self, issue_id, issue_title, issue_body):
+        """
+        Returns the `(issue_title, issue_body)` to send for an issue, compressed to the budget.
+        The body gets the budget left by the title.
+        """
+        fingerprint = hash((issue_title, issue_body))
+
+        with self._lock:
+            cached = self._issues.get(issue_id)
+            if cached is not None and cached[0] == fingerprint:
+                self._issues.move_to_end(issue_id)
+                self.hits += 1
+                return cached[1]
+
+        title = compress_text(issue_title, self.budget // 4, self.count)
+        body = compress_text(issue_body, self.budget - self.count(title or ""), self.count)
+        original = self.count(issue_title or "") + self.count(issue_body or "")
+        compressed = self.count(title or "") + self.count(body or "")
+
+        with self._lock:
+            self.misses += 1
+            self.original_tokens += original
+            self.compressed_tokens += compressed
+            self._issues[issue_id] = (fingerprint, (title, body))
+            self._issues.move_to_end(issue_id)
+            while len(self._issues) > self.max_issues:
+                self._issues.popitem(last=False)
+
+        if compressed < original:
+            logging.info(f"Context of issue {issue_id} compressed from {original} to {compressed} tokens.")
+
+        return title, body
+
+    def compress_comments(self, comments):
+        """
+        Returns `(comment_id, created_at, body)` rows with each body compressed to `comment_budget`,
+        or the rows unchanged when no `comment_budget` is set.
+        """
+        if self.comment_budget is None:
+            return comments
+
+        return [
+            (comment_id, created_at, compress_text(body, self.comment_budget, self.count))
+            for comment_id, created_at, body in comments
+        ]
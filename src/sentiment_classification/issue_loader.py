@@ -0,0 +1,113 @@
+from comment_rules import ensure_filters_table
+from itertools import groupby
+import logging
+import weakref
+
+
+# Connections on which the comment index was already created, so the DDL runs once per session.
+_prepared = weakref.WeakKeyDictionary()
+
+
+def ensure_comment_index(conn):
+    """
+    Creates the `(issue_id, created_at)` index of `issue_comments_from_release`, once per
+    connection. It serves both the per-issue lookups of `get_comments_by_issue_id` and the
+    ordered join of `iter_issues_with_comments`.
+    """
+    if _prepared.get(conn):
+        return
+
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS issue_comments_from_release_issue_created
+            ON issue_comments_from_release (issue_id, created_at);
+        """
+    )
+    conn.commit()
+
+    _prepared[conn] = True
+
+
+def _rows(cursor, chunk_size):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def iter_issues_with_comments(conn, release, chunk_size=5000, skip_filtered=False):
+    """
+    Streams the issues of a release with their comments, from a single joined query.
+
+    Replaces the `get_comments_by_issue_id` call per issue of the notebooks: rows come
+    from a named (server-side) cursor in chunks of `chunk_size`, ordered by issue and
+    comment date, and are grouped by issue_id as they arrive, so memory holds one chunk
+    and one issue at a time. The cursor is WITH HOLD, so the caller can commit (ex.:
+    save the labels of each issue) or roll back while iterating.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        release (str):
+            Release to load (matched with `LIKE '%release%'`, as in the notebooks).
+        chunk_size (int, optional):
+            Rows fetched per round trip.
+        skip_filtered (bool, optional):
+            Leave out the comments flagged by `comment_rules.filter_comments_sql`
+            (bot accounts, templates), so they never reach the LLM.
+
+    Yields:
+        tuple:
+            `((issue_id, issue_title, issue_body), comments)`, where comments is the list of
+            `(comment_id, created_at, body)` rows of the issue (as returned by
+            `get_comments_by_issue_id`), empty for issues without comments.
+    """
+    ensure_comment_index(conn)
+
+    filter_clause = ""
+    if skip_filtered:
+        ensure_filters_table(conn.cursor())
+        filter_clause = """
+            AND NOT EXISTS (SELECT 1 FROM comment_filters f WHERE f.comment_id = c.comment_id)
+        """
+
+    cursor = conn.cursor(name="issues_with_comments", withhold=True)
+    cursor.itersize = chunk_size
+    cursor.execute(
+        f"""
+        SELECT
+            i.issue_id,
+            i.title,
+            i.body,
+            c.comment_id,
+            c.created_at,
+            c.body
+        FROM
+            issues_from_release i
+        LEFT JOIN
+            issue_comments_from_release c ON c.issue_id = i.issue_id {filter_clause}
+        WHERE
+            i.release_number LIKE %s
+        ORDER BY
+            i.issue_id, c.created_at;
+        """,
+        (f"%{release}%",)
+    )
+    # A WITH HOLD cursor survives later rollbacks only once the transaction declaring it
+    # has committed, so the caller can roll back a failed save and go on with the next issue.
+    conn.commit()
+
+    issues = 0
+    try:
+        for issue, rows in groupby(_rows(cursor, chunk_size), key=lambda row: row[:3]):
+            # The LEFT JOIN yields one row without comment_id for issues without comments.
+            comments = [row[3:] for row in rows if row[3] is not None]
+            issues += 1
+            yield issue, comments
+    finally:
+        cursor.close()
+        conn.commit()
+
+    logging.info(f"{issues} issues of release {release} loaded.")
@@ -0,0 +1,58 @@
+from enum import Enum
+import re
+
+
+class Sentiment(str, Enum):
+    """Canonical labels stored in `comment_sentiments.label`."""
+
+    NEGATIVE = "negative"
+    NEUTRAL = "neutral"
+    POSITIVE = "positive"
+
+
+# The canonical labels as text, in the order of `Sentiment`.
+LABELS = tuple(sentiment.value for sentiment in Sentiment)
+
+# Exact answers (after trimming spaces, quotes and punctuation) resolved without a regex,
+# including the short labels of the BERTweet columns of the xlsx corpora.
+_EXACT = {
+    **{sentiment.value: sentiment for sentiment in Sentiment},
+    "neg": Sentiment.NEGATIVE,
+    "neu": Sentiment.NEUTRAL,
+    "pos": Sentiment.POSITIVE,
+}
+
+_TRIM = " \t\r\n\"'`*.,;:!?()[]{}"
+
+# Any mention of a class as a whole word, as in "sentiment: negative" or "The comment is neutral."
+_MENTION = re.compile(r"\b(negative|neutral|positive)\b")
+
+
+def parse_label(answer):
+    """
+    Maps a raw model answer to its `Sentiment`.
+
+    Returns:
+        Sentiment or None:
+            None when the answer is empty, names no class, or names more than one
+            (ex.: "positive or negative"), so the comment can be classified again.
+    """
+    if not isinstance(answer, str):
+        return None
+
+    answer = answer.lower()
+    sentiment = _EXACT.get(answer.strip(_TRIM))
+    if sentiment is not None:
+        return sentiment
+
+    mentioned = set(_MENTION.findall(answer))
+    if len(mentioned) == 1:
+        return Sentiment(mentioned.pop())
+
+    return None
+
+
+def canonical_label(answer):
+    """`parse_label` as the text stored in the database, or None when unparseable."""
+    sentiment = parse_label(answer)
+    return sentiment.value if sentiment is not None else None
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    """Collapses whitespace, so comments differing only in spacing share a cache entry."""
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+class LLMCache:
+    """
+    Persistent, content-addressed cache of LLM answers backed by SQLite.
+
+    Entries are keyed by a SHA-256 of the model, temperature, system prompt, context
+    and normalized comment text, and stored as JSON (never `eval`-ed). When the stored
+    answers exceed `max_bytes`, the least recently used entries are evicted.
+
+    Lookups only read: the size of the stored answers is kept in memory, and the
+    `last_used` times of the hits are written in batches of `touch_batch`, at the
+    next `put` or on `close`.
+
+    Parameters:
+        path (str, optional):
+            SQLite file of the cache.
+        max_bytes (int, optional):
+            Size budget of the stored answers.
+        touch_batch (int, optional):
+            Number of hits whose `last_used` time is written in one transaction.
+    """
+
+    def __init__(self, path="llm_cache.sqlite", max_bytes=256 * 1024 * 1024, touch_batch=256):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT,
+                size INTEGER,
+                last_used REAL
+            );
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used);")
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache;").fetchone()[0]
+
+    @staticmethod
+    def make_key(model, temperature, system_prompt, context, text):
+        payload = json.dumps(
+            [model, temperature, system_prompt, normalize_text(context), normalize_text(text)],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM llm_cache WHERE key = ?;", (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched()
+                self._db.commit()
+
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        serialized = json.dumps(value, ensure_ascii=False)
+
+        with self._lock:
+            replaced = self._db.execute("SELECT size FROM llm_cache WHERE key = ?;", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, last_used) VALUES (?, ?, ?, ?);",
+                (key, serialized, len(serialized), time.time())
+            )
+            self._touched.pop(key, None)
+            self._total += len(serialized) - (replaced[0] if replaced else 0)
+            self._flush_touched()
+            self._evict()
+            self._db.commit()
+
+    def _flush_touched(self):
+        if self._touched:
+            self._db.executemany(
+                "UPDATE llm_cache SET last_used = ? WHERE key = ?;",
+                [(last_used, key) for key, last_used in self._touched.items()]
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        if self._total <= self.max_bytes:
+            return
+
+        # Free some headroom, so eviction does not run on every insert.
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for key, size in self._db.execute("SELECT key, size FROM llm_cache ORDER BY last_used;").fetchall():
+            if self._total <= target:
+                break
+            self._db.execute("DELETE FROM llm_cache WHERE key = ?;", (key,))
+            self._total -= size
+            evicted += 1
+
+        logging.info(f"{evicted} entries evicted from the LLM cache.")
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM llm_cache;").fetchone()[0]
+            size = self._total
+
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._db.commit()
+            self._db.close()
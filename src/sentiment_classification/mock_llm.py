@@ -0,0 +1,149 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from labels import LABELS
+import hashlib
+import json
+import random
+import threading
+import time
+
+
+COMMENT_PREFIX = "Classify the sentiment of this comment: "
+BATCH_MARKER = "The comments are: "
+
+
+def label_for(text):
+    """Deterministic fake sentiment of a comment body."""
+    return LABELS[hashlib.sha1(text.encode()).digest()[0] % len(LABELS)]
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class MockLLMServer:
+    """
+    Local fake of an OpenAI-compatible `/chat/completions` endpoint, used by the benchmarks.
+
+    It answers the one-comment prompt of `classify_comment_sentiment_openai` with a single
+    word, and the batch prompt of `batch_classification` with a JSON object of labels.
+    Prompt tokens are approximated by whitespace-separated words and reported in `usage`.
+    Each response takes `latency + prompt_tokens * latency_per_token` seconds.
+
+    Parameters:
+        latency (float):
+            Fixed delay, in seconds, of every request.
+        latency_per_token (float):
+            Extra delay, in seconds, per prompt token.
+        drop_rate (float):
+            Probability of leaving a comment out of a batch answer, to simulate partial answers.
+        failures (list of int):
+            Status codes answered, in order, to the first requests (e.g. `[429, 500]`).
+    """
+
+    def __init__(self, latency=0.05, latency_per_token=0.0, drop_rate=0.0, failures=()):
+        self.latency = latency
+        self.latency_per_token = latency_per_token
+        self.drop_rate = drop_rate
+        self.failures = list(failures)
+        self.request_count = 0
+        self.prompt_tokens = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(0)
+        self._server = _Server(("127.0.0.1", 0), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def answer(self, messages):
+        prompt = messages[-1]["content"]
+
+        if BATCH_MARKER in prompt:
+            comments = json.loads(prompt.split(BATCH_MARKER, 1)[1])
+            with self._lock:
+                kept = [c for c in comments if self._random.random() >= self.drop_rate]
+            return json.dumps({c["comment_id"]: label_for(c["body"]) for c in kept})
+
+        return label_for(prompt.split(COMMENT_PREFIX, 1)[-1])
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length))
+                messages = request["messages"]
+                prompt_tokens = sum(len(str(m["content"]).split()) for m in messages)
+
+                with mock._lock:
+                    mock.request_count += 1
+                    mock._in_flight += 1
+                    mock.max_in_flight = max(mock.max_in_flight, mock._in_flight)
+                    failure = mock.failures.pop(0) if mock.failures else None
+
+                try:
+                    time.sleep(mock.latency + prompt_tokens * mock.latency_per_token)
+
+                    if failure is not None:
+                        self._send(failure, {"error": {"message": "injected failure"}})
+                        return
+
+                    with mock._lock:
+                        mock.prompt_tokens += prompt_tokens
+
+                    content = mock.answer(messages)
+                    self._send(200, {
+                        "id": "mock",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model", "mock"),
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": {
+                            "prompt_tokens": prompt_tokens,
+                            "completion_tokens": len(content.split()),
+                            "total_tokens": prompt_tokens + len(content.split()),
+                        },
+                    })
+                finally:
+                    with mock._lock:
+                        mock._in_flight -= 1
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
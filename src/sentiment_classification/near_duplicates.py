@@ -0,0 +1,294 @@
+from collections import defaultdict
+from text_pipeline import preprocess
+import hashlib
+import logging
+import numpy as np
+import re
+
+
+# Mersenne prime of the MinHash permutations: shingle hashes and coefficients stay below
+# 2 ** 31, so `a * x + b` fits in 64 bits.
+_PRIME = (1 << 31) - 1
+
+_MENTION = re.compile(r"@[\w-]+")
+# Numbers, issue references and versions; '+1' and '-1' are kept.
+_NUMBER = re.compile(r"(?<![+\-\w])#?\d+(?:\.\d+)*")
+_WORD = re.compile(r"<\w+>|[+-]?\w+")
+
+
+def normalize_comment(text):
+    """
+    Text the shingles are taken from: the preprocessed comment (`text_pipeline.preprocess`),
+    lowercased, with mentions and numbers (issue references, versions, day counts) replaced,
+    so the notices of a bot differing only in those are near-duplicates.
+    """
+    text = preprocess(text) if isinstance(text, str) else ""
+    text = _MENTION.sub("<user>", text)
+    text = _NUMBER.sub("<num>", text)
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def shingles(text, k=3):
+    """
+    Hashes of the word k-grams of a normalized comment. Comments shorter than `k` words
+    are a single shingle, so '+1' and 'thanks!' only match themselves.
+    """
+    words = text.split()
+    grams = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+    return np.array(
+        [int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), "little") % _PRIME for gram in grams],
+        dtype=np.uint64,
+    )
+
+
+class MinHasher:
+    """
+    MinHash signatures of shingle sets: the share of equal positions of two signatures
+    estimates the Jaccard similarity of the sets.
+
+    Parameters:
+        num_perm (int, optional):
+            Length of the signatures.
+        seed (int, optional):
+            Seed of the permutations; signatures are only comparable with the same seed.
+    """
+
+    def __init__(self, num_perm=128, seed=1):
+        generator = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = generator.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self.b = generator.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, hashes):
+        if len(hashes) == 0:
+            return np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        return ((np.outer(self.a, hashes) + self.b[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(first, second):
+    """Jaccard similarity estimated from two signatures."""
+    return float(np.mean(first == second))
+
+
+class NearDuplicateIndex:
+    """
+    Groups near-duplicate comments (bot notices, templates, '+1') around a representative,
+    so only the representatives are sent to the LLM.
+
+    Comments are added in order. Each one is compared, through an LSH index of the
+    representatives' signatures (`bands` bands of `num_perm / bands` rows), with the
+    representatives sharing a band, and joins the most similar one if their estimated
+    Jaccard similarity reaches `threshold`; otherwise it becomes a new representative.
+    Members are compared with the representative itself, never with other members, so
+    clusters do not drift through chains of small edits. Every assignment is kept with its
+    similarity, for auditing (`audit`).
+
+    Usage:
+        index = NearDuplicateIndex()
+        for comment_id, _, body in comments:
+            index.add(comment_id, body)
+        to_classify = index.representatives()
+        ...
+        index.set_label(representative_id, label)
+        labels = index.labels()
+
+    Parameters:
+        threshold (float, optional):
+            Minimum estimated Jaccard similarity of the shingles with the representative.
+        num_perm (int, optional):
+            Length of the MinHash signatures.
+        bands (int, optional):
+            LSH bands; pairs above about `(1 / bands) ** (bands / num_perm)` similarity
+            are likely to be compared.
+        k (int, optional):
+            Words per shingle.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, bands=16, k=3, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.k = k
+        self.hasher = MinHasher(num_perm, seed)
+
+        self._buckets = [defaultdict(list) for _ in range(bands)]
+        self._signatures = {}
+        # comment_id -> (representative_id, similarity)
+        self.assignments = {}
+        self._labels = {}
+
+    def _bands(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, comment_id, text):
+        """
+        Returns:
+            tuple:
+                `(representative_id, similarity)`: the comment's own id and 1.0 when it
+                starts a new cluster.
+        """
+        if comment_id in self.assignments:
+            return self.assignments[comment_id]
+
+        signature = self.hasher.signature(shingles(normalize_comment(text), self.k))
+
+        candidates = {
+            representative
+            for band, key in self._bands(signature)
+            for representative in self._buckets[band].get(key, ())
+        }
+
+        best, best_similarity = None, 0.0
+        for representative in sorted(candidates):
+            value = similarity(signature, self._signatures[representative])
+            if value > best_similarity:
+                best, best_similarity = representative, value
+
+        if best is not None and best_similarity >= self.threshold:
+            self.assignments[comment_id] = (best, best_similarity)
+        else:
+            self._signatures[comment_id] = signature
+            for band, key in self._bands(signature):
+                self._buckets[band][key].append(comment_id)
+            self.assignments[comment_id] = (comment_id, 1.0)
+
+        return self.assignments[comment_id]
+
+    def representative(self, comment_id):
+        return self.assignments[comment_id][0]
+
+    def representatives(self):
+        return list(self._signatures)
+
+    def clusters(self):
+        """
+        Returns:
+            dict:
+                Members (representative included) of every representative, in insertion order.
+        """
+        clusters = defaultdict(list)
+        for comment_id, (representative, _) in self.assignments.items():
+            clusters[representative].append(comment_id)
+        return dict(clusters)
+
+    def set_label(self, representative_id, label):
+        self._labels[representative_id] = label
+
+    def label(self, comment_id):
+        """Label of the comment's representative, or None if it was not classified yet."""
+        return self._labels.get(self.representative(comment_id))
+
+    def labels(self):
+        """Labels of every comment whose representative was classified."""
+        return {
+            comment_id: self._labels[representative]
+            for comment_id, (representative, _) in self.assignments.items()
+            if representative in self._labels
+        }
+
+    def audit(self):
+        """
+        Returns:
+            list of tuple:
+                `(comment_id, representative_id, similarity, cluster_size, label)` of every
+                comment, the members of a cluster next to each other.
+        """
+        clusters = self.clusters()
+        return [
+            (comment_id, representative, self.assignments[comment_id][1], len(members), self._labels.get(representative))
+            for representative, members in clusters.items()
+            for comment_id in members
+        ]
+
+    def stats(self):
+        comments = len(self.assignments)
+        representatives = len(self._signatures)
+        return {
+            "comments": comments,
+            "clusters": representatives,
+            "calls_saved": comments - representatives,
+            "saved_share": (comments - representatives) / comments if comments else 0.0,
+        }
+
+
+def analyze_with_near_duplicates(issue_title, issue_body, comments, analyze, index, **kwargs):
+    """
+    Classifies only the comments that are not near-duplicates of an already classified
+    comment, and copies the label of their cluster to the others.
+
+    Meant to wrap `utils.analyze_issue_sentiment_openai` / `analyze_issue_sentiment_genai`
+    while a release is classified issue by issue: the index is shared by all the issues,
+    so a bot notice is sent once per release. The label is the one given to the
+    representative in its own issue, as with `LLMCache(cache_context=False)`.
+
+    Parameters:
+        comments (list of tuple):
+            `(comment_id, created_at, body)` rows of the issue.
+        analyze (callable):
+            `analyze(issue_title, issue_body, comments, **kwargs)`, returning
+            `(comment_id, sentiment)` pairs.
+        index (NearDuplicateIndex or None):
+            Index shared by the issues of the run. With None, every comment is classified
+            (the default of the notebooks: propagated labels can differ from the ones the
+            comments would get on their own).
+
+    Returns:
+        list of tuple:
+            `(comment_id, sentiment)` for every comment, in the order of `comments`.
+    """
+    if index is None:
+        return analyze(issue_title, issue_body, comments, **kwargs)
+
+    to_classify = []
+    clusters = set()
+    for comment in comments:
+        comment_id, _, body = comment
+        representative, _ = index.add(comment_id, body)
+        # The first comment of a cluster without a label (ex.: its issue failed) stands in for it.
+        if index.label(comment_id) is None and representative not in clusters:
+            to_classify.append(comment)
+            clusters.add(representative)
+
+    if to_classify:
+        for comment_id, sentiment in analyze(issue_title, issue_body, to_classify, **kwargs):
+            index.set_label(index.representative(comment_id), sentiment)
+
+    propagated = len(comments) - len(to_classify)
+    if propagated:
+        logging.info(f"{propagated} near-duplicate comments labelled from their representatives.")
+
+    return [(comment_id, index.label(comment_id)) for comment_id, _, _ in comments]
+
+
+def save_near_duplicates(cursor, index):
+    """
+    Writes the cluster of every comment to `comment_near_duplicates`, so the propagated
+    labels can be audited (ex.: join with `comment_sentiments` on representative_id).
+    """
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS comment_near_duplicates (
+            comment_id BIGINT PRIMARY KEY,
+            representative_id BIGINT,
+            similarity REAL
+        );
+        """
+    )
+
+    cursor.executemany(
+        """
+        INSERT INTO comment_near_duplicates (comment_id, representative_id, similarity)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (comment_id) DO UPDATE SET
+            representative_id = EXCLUDED.representative_id,
+            similarity = EXCLUDED.similarity;
+        """,
+        [
+            (int(comment_id), int(representative), similarity)
+            for comment_id, (representative, similarity) in index.assignments.items()
+        ],
+    )
@@ -0,0 +1,287 @@
+from itertools import islice
+from labels import Sentiment, canonical_label
+import logging
+
+
+# Per-model columns of issue_comments_from_release that the existing analyses read.
+LEGACY_COLUMNS = {
+    "gpt-4o-mini": "sentiment_gpt_4o_mini",
+    "deepseek-chat": "sentiment_deepseek_v3",
+    "gemini-2.0-flash": "sentiment_gemini_2_0_flash",
+}
+
+
+def _add_column(cursor, table, column):
+    # ADD COLUMN IF NOT EXISTS locks the table exclusively even when the column exists,
+    # which would serialize concurrent writers, so the catalog is checked first.
+    cursor.execute(
+        """
+        SELECT 1
+        FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attname = %s AND attnum > 0 AND NOT attisdropped;
+        """,
+        (table, column)
+    )
+    if cursor.fetchone() is None:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} TEXT;")
+
+
+def existing_legacy_columns(cursor):
+    """
+    Returns the entries of `LEGACY_COLUMNS` whose column exists in `issue_comments_from_release`
+    (older databases lack some of them).
+    """
+    cursor.execute(
+        """
+        SELECT attname
+        FROM pg_attribute
+        WHERE attrelid = to_regclass('issue_comments_from_release')
+            AND attnum > 0 AND NOT attisdropped AND attname = ANY(%s);
+        """,
+        (list(LEGACY_COLUMNS.values()),)
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    return {model: column for model, column in LEGACY_COLUMNS.items() if column in existing}
+
+
+def ensure_sentiments_table(cursor):
+    # Not cached per connection: callers run it inside their own transaction, which may
+    # still be rolled back, and both statements are cheap once the schema is in place.
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS comment_sentiments (
+            comment_id BIGINT,
+            model TEXT,
+            label TEXT,
+            classified_at TIMESTAMP DEFAULT now(),
+            raw_label TEXT,
+            PRIMARY KEY (comment_id, model)
+        );
+        """
+    )
+    _add_column(cursor, "comment_sentiments", "raw_label")
+
+
+def _batches(sentiments, batch_size):
+    iterator = iter(sentiments)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        # A comment labelled twice keeps its last label (ON CONFLICT cannot touch a row twice).
+        yield list(dict(batch).items())
+
+
+def _values(batch):
+    width = len(batch[0])
+    placeholders = ", ".join([f"(%s::bigint{', %s::text' * (width - 1)})"] * len(batch))
+    params = [value for row in batch for value in row]
+    return placeholders, params
+
+
+def update_sentiment_column(cursor, column, sentiments, batch_size=1000):
+    """
+    Writes labels into a per-model column of `issue_comments_from_release`
+    with one `UPDATE ... FROM (VALUES ...)` per batch.
+
+    Parameters:
+        cursor:
+            Cursor of an active psycopg2/psycopg connection. The caller commits.
+        column (str):
+            Name of the sentiment column (created if missing).
+        sentiments (iterable of tuple):
+            `(comment_id, label)` pairs.
+        batch_size (int, optional):
+            Number of labels per statement.
+    """
+    _add_column(cursor, "issue_comments_from_release", column)
+    _write_column(cursor, column, sentiments, batch_size)
+
+
+def _write_column(cursor, column, sentiments, batch_size):
+    for batch in _batches(sentiments, batch_size):
+        placeholders, params = _values(batch)
+
+        cursor.execute(
+            f"""
+            UPDATE
+                issue_comments_from_release AS c
+            SET
+                {column} = v.label
+            FROM
+                (VALUES {placeholders}) AS v(comment_id, label)
+            WHERE
+                c.comment_id = v.comment_id;
+            """,
+            params
+        )
+
+        logging.info(f"{len(batch)} sentiments saved in {column}.")
+
+
+def save_sentiments(cursor, model, sentiments, batch_size=1000):
+    """
+    Saves the labels of a model into the normalized `comment_sentiments` table,
+    one multi-row `INSERT ... ON CONFLICT DO UPDATE` per batch, so adding a model
+    needs no schema change. For the models in `LEGACY_COLUMNS` the labels are also
+    written to their column of `issue_comments_from_release`.
+
+    Raw answers are normalized with `labels.parse_label`: the canonical label goes to
+    `label` and the answer as received to `raw_label`. Unparseable answers are saved
+    with a NULL label, so `work_queue.create_run` enqueues them again.
+
+    Parameters:
+        cursor:
+            Cursor of an active psycopg2/psycopg connection. The caller commits.
+        model (str):
+            Model identifier (ex.: 'gpt-4o-mini').
+        sentiments (iterable of tuple):
+            `(comment_id, answer)` pairs, the answer being the raw model output.
+        batch_size (int, optional):
+            Number of labels per statement.
+
+    Returns:
+        int:
+            Number of labels saved.
+    """
+    ensure_sentiments_table(cursor)
+
+    legacy_column = LEGACY_COLUMNS.get(model)
+    if legacy_column:
+        _add_column(cursor, "issue_comments_from_release", legacy_column)
+
+    saved = _write_sentiments(cursor, model, legacy_column, sentiments, batch_size)
+
+    logging.info(f"{saved} sentiments saved for model {model}.")
+
+    return saved
+
+
+def _write_sentiments(cursor, model, legacy_column, sentiments, batch_size):
+    saved = 0
+    unparseable = 0
+    for batch in _batches(sentiments, batch_size):
+        rows = [(comment_id, canonical_label(answer), answer) for comment_id, answer in batch]
+        placeholders, params = _values(rows)
+
+        cursor.execute(
+            f"""
+            INSERT INTO comment_sentiments (comment_id, model, label, raw_label)
+            SELECT
+                v.comment_id, %s, v.label, v.raw_label
+            FROM
+                (VALUES {placeholders}) AS v(comment_id, label, raw_label)
+            ON CONFLICT (comment_id, model) DO UPDATE SET
+                label = EXCLUDED.label,
+                raw_label = EXCLUDED.raw_label,
+                classified_at = now();
+            """,
+            [model] + params
+        )
+
+        if legacy_column:
+            _write_column(
+                cursor, legacy_column, [(comment_id, label) for comment_id, label, _ in rows], batch_size
+            )
+
+        saved += len(batch)
+        unparseable += sum(1 for _, label, _ in rows if label is None)
+
+    if unparseable:
+        logging.warning(f"{unparseable} unparseable answers of model {model} saved without label.")
+
+    return saved
+
+
+def normalize_stored_labels(conn):
+    """
+    Fixes the labels saved before answers were normalized, in bulk.
+
+    Labels found only in the legacy columns are first copied to `comment_sentiments`.
+    Then every distinct non-canonical label is parsed once and all its rows are rewritten
+    with a single `UPDATE ... FROM (VALUES ...)`, keeping the original text in `raw_label`;
+    unparseable ones become NULL, so the next classification run picks them up. Finally the
+    legacy columns are synced with the normalized labels.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+
+    Returns:
+        dict:
+            Number of rows `fixed` (mapped to a canonical label) and `unparseable`.
+    """
+    cursor = conn.cursor()
+
+    try:
+        ensure_sentiments_table(cursor)
+
+        legacy = existing_legacy_columns(cursor)
+
+        for model, column in legacy.items():
+            cursor.execute(
+                f"""
+                INSERT INTO comment_sentiments (comment_id, model, label, raw_label)
+                SELECT comment_id, %s, {column}, {column}
+                FROM issue_comments_from_release
+                WHERE {column} IS NOT NULL
+                ON CONFLICT (comment_id, model) DO NOTHING;
+                """,
+                (model,)
+            )
+
+        canonical = [sentiment.value for sentiment in Sentiment]
+        cursor.execute(
+            "SELECT DISTINCT label FROM comment_sentiments WHERE label IS NOT NULL AND label <> ALL(%s);",
+            (canonical,)
+        )
+        mapping = [(answer, canonical_label(answer)) for (answer,) in cursor.fetchall()]
+
+        fixed = unparseable = 0
+        if mapping:
+            placeholders = ", ".join(["(%s::text, %s::text)"] * len(mapping))
+            cursor.execute(
+                f"""
+                UPDATE
+                    comment_sentiments s
+                SET
+                    raw_label = COALESCE(s.raw_label, s.label),
+                    label = v.label
+                FROM
+                    (VALUES {placeholders}) AS v(answer, label)
+                WHERE
+                    s.label = v.answer
+                RETURNING
+                    v.label IS NULL;
+                """,
+                [value for row in mapping for value in row]
+            )
+            flags = [row[0] for row in cursor.fetchall()]
+            unparseable = sum(flags)
+            fixed = len(flags) - unparseable
+
+        for model, column in legacy.items():
+            cursor.execute(
+                f"""
+                UPDATE
+                    issue_comments_from_release c
+                SET
+                    {column} = s.label
+                FROM
+                    comment_sentiments s
+                WHERE
+                    s.comment_id = c.comment_id
+                    AND s.model = %s
+                    AND c.{column} IS DISTINCT FROM s.label;
+                """,
+                (model,)
+            )
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    logging.info(f"{fixed} stored labels normalized, {unparseable} unparseable set to NULL.")
+
+    return {"fixed": fixed, "unparseable": unparseable}
@@ -1,9 +1,17 @@
 import logging
+from issue_loader import ensure_comment_index
 from log_config import configure_logging
+from sentiment_store import save_sentiments
 
 configure_logging()
 
 def get_comments_by_issue_id(issue_id, cursor):
+    """
+    Comments of one issue, ordered by date. To go through a whole release, prefer
+    `issue_loader.iter_issues_with_comments`, which loads every issue with a single query.
+    """
+    ensure_comment_index(cursor.connection)
+
     cursor.execute(
         """
         SELECT 
@@ -23,7 +31,16 @@ def get_comments_by_issue_id(issue_id, cursor):
     return comments
 
 
-def classify_comment_sentiment_openai(comment_body, messages, client, model):
+SYSTEM_PROMPT = (
+    "You are a GitHub issue sentiment analysis expert. "
+    "Classify each comment's sentiment as 'positive', 'negative', or 'neutral'. "
+    "Answer with one word only."
+)
+
+TEMPERATURE = 0.2
+
+
+def classify_comment_sentiment_openai(comment_body, messages, client, model, cache=None, context=""):
     prompt = f"Classify the sentiment of this comment: {comment_body}"
 
     # Appending this prompt to messages
@@ -31,16 +48,28 @@ def classify_comment_sentiment_openai(comment_body, messages, client, model):
         "role": "user",
         "content": prompt
     })
-    
-    # Sends the prompt and gets the response
-    response = client.chat.completions.create(
-        model = model,
-        messages = messages,
-        temperature = 0.2
-    )
 
-    # Gets the content (sentiment) of the response
-    comment_sentiment = response.choices[0].message.content.lower()
+    # Reuses a previous answer for the same model, prompt, context and comment
+    cache_key = None
+    comment_sentiment = None
+    if cache is not None:
+        cache_key = cache.make_key(model, TEMPERATURE, messages[0]["content"], context, comment_body)
+        comment_sentiment = cache.get(cache_key)
+
+    if comment_sentiment is None:
+        # Sends the prompt and gets the response
+        response = client.chat.completions.create(
+            model = model,
+            messages = messages,
+            temperature = TEMPERATURE
+        )
+
+        # Gets the content (sentiment) of the response
+        comment_sentiment = response.choices[0].message.content.lower()
+
+        if cache is not None:
+            cache.put(cache_key, comment_sentiment)
+
     logging.info(f"Sentiment of the comment is: {comment_sentiment}")
 
     # Appending the sentiment to the context of the conversation
@@ -52,15 +81,31 @@ def classify_comment_sentiment_openai(comment_body, messages, client, model):
     return comment_sentiment
 
 
-def analyze_issue_sentiment_openai(issue_title, issue_body, comments, client, model):
+def analyze_issue_sentiment_openai(
+    issue_title, issue_body, comments, client, model, cache=None, cache_context=True, issue_context=None, issue_id=None
+):
+    """
+    Classifies the comments of an issue in a single conversation with an OpenAI-compatible model.
+
+    Parameters:
+        cache (LLMCache, optional):
+            Cache consulted before every request.
+        cache_context (bool, optional):
+            Whether the issue title and body are part of the cache key. With False,
+            identical comments (bot notices, templates) share one answer across issues.
+        issue_context (IssueContext, optional):
+            Compresses the issue and the comments to its token budgets before they are sent.
+        issue_id (int, optional):
+            Key of the compressed issue in `issue_context`.
+    """
+    if issue_context is not None:
+        issue_title, issue_body = issue_context.compress_issue(issue_id, issue_title, issue_body)
+        comments = issue_context.compress_comments(comments)
+
     messages = [
         {
             "role": "system",
-            "content": (
-                "You are a GitHub issue sentiment analysis expert. "
-                "Classify each comment's sentiment as 'positive', 'negative', or 'neutral'. "
-                "Answer with one word only."
-            )
+            "content": SYSTEM_PROMPT
         },
         {
             "role": "user",
@@ -72,6 +117,8 @@ def analyze_issue_sentiment_openai(issue_title, issue_body, comments, client, mo
         }
     ]
 
+    context = f"{issue_title}\n{issue_body}" if cache_context else ""
+
     results = []
     for comment in comments:
         comment_id, _, comment_body = comment
@@ -81,7 +128,9 @@ def analyze_issue_sentiment_openai(issue_title, issue_body, comments, client, mo
             comment_body=comment_body, 
             messages=messages, 
             client=client, 
-            model=model
+            model=model,
+            cache=cache,
+            context=context
         )
 
         results.append((comment_id, comment_sentiment))
@@ -89,99 +138,100 @@ def analyze_issue_sentiment_openai(issue_title, issue_body, comments, client, mo
     return results
 
 
-def save_sentiments_gpt(sentiments,cursor):
-    cursor.execute(
-        """
-        ALTER TABLE
-            issue_comments_from_release
-        ADD COLUMN IF NOT EXISTS
-            sentiment_gpt_4o_mini TEXT;
-        """
-    )
+def classify_comment_sentiment_genai(comment_body, chat_session, cache=None, cache_key=None):
+    prompt = f"Classify the sentiment of this comment: {comment_body}"
 
-    for sentiment in sentiments:
-        try:
-            comment_id, comment_sentiment = sentiment
-
-            cursor.execute(
-                """
-                UPDATE 
-                    issue_comments_from_release
-                SET 
-                    sentiment_gpt_4o_mini = %s
-                WHERE
-                    comment_id = %s;
-                """,
-                (comment_sentiment, comment_id)
+    if cache is not None:
+        comment_sentiment = cache.get(cache_key)
+        if comment_sentiment is not None:
+            from google.genai.types import ModelContent, Part, UserContent
+
+            # Recorded as if it had been sent, so the next comments get the same context
+            # as with `classify_comment_sentiment_openai`.
+            chat_session.record_history(
+                user_input=UserContent(parts=[Part(text=prompt)]),
+                model_output=[ModelContent(parts=[Part(text=comment_sentiment)])],
+                automatic_function_calling_history=[],
+                is_valid=True
             )
-        except Exception as e:
-            logging.error(f"Error occurred with comment {sentiment}: {e}")
-            continue
+            logging.info(f"Sentiment of the comment is: {comment_sentiment} (cached)")
+            return comment_sentiment
 
+    response = chat_session.send_message(prompt)
+    
+    comment_sentiment = response.text.lower()
 
-def save_sentiments_ds(sentiments,cursor):
-    cursor.execute(
-        """
-        ALTER TABLE
-            issue_comments_from_release
-        ADD COLUMN IF NOT EXISTS
-            sentiment_deepseek_v3 TEXT;
-        """
-    )
+    if cache is not None:
+        cache.put(cache_key, comment_sentiment)
 
-    for sentiment in sentiments:
-        try:
-            comment_id, comment_sentiment = sentiment
-
-            cursor.execute(
-                """
-                UPDATE 
-                    issue_comments_from_release
-                SET 
-                    sentiment_deepseek_v3 = %s
-                WHERE
-                    comment_id = %s;
-                """,
-                (comment_sentiment, comment_id)
-            )
-        except Exception as e:
-            logging.error(f"Error occurred with comment {sentiment}: {e}")
-            continue
-        
+    logging.info(f"Sentiment of the comment is: {comment_sentiment}")
 
-def save_sentiments_gemini(sentiments,cursor):
-    try:
-        cursor.execute(
-            """
-            ALTER TABLE
-                issue_comments_from_release
-            ADD COLUMN IF NOT EXISTS
-                sentiment_gemini_2_0_flash TEXT;
-            """
+    return comment_sentiment
+
+
+def analyze_issue_sentiment_genai(
+    issue_title, issue_body, comments, client, model, cache=None, cache_context=True, issue_context=None, issue_id=None
+):
+    """
+    Classifies the comments of an issue in a single Gemini chat session.
+
+    Parameters:
+        cache (LLMCache, optional):
+            Cache consulted before every request.
+        cache_context (bool, optional):
+            Whether the issue title and body are part of the cache key.
+        issue_context (IssueContext, optional):
+            Compresses the issue and the comments to its token budgets before they are sent.
+        issue_id (int, optional):
+            Key of the compressed issue in `issue_context`.
+    """
+    from google.genai import types
+    from google.genai.types import Part, UserContent
+
+    if issue_context is not None:
+        issue_title, issue_body = issue_context.compress_issue(issue_id, issue_title, issue_body)
+        comments = issue_context.compress_comments(comments)
+
+    issue_chat_session = client.chats.create(
+        model=model,
+        history=[
+            UserContent(parts=[Part(text=f"The title of the issue is: {issue_title}")]),
+            UserContent(parts=[Part(text=f"The body of the issue is: {issue_body}")])
+        ],
+        config=types.GenerateContentConfig(
+            temperature=TEMPERATURE,
+            system_instruction=SYSTEM_PROMPT
         )
-    except Exception as e:
-        logging.error(f"Error occurred when altering the table: {e}")
-        
+    )
+
+    context = f"{issue_title}\n{issue_body}" if cache_context else ""
+
+    results = []
     i = 1
-    for sentiment in sentiments:
-        logging.info(f"Trying to save sentiment ({i}/{len(sentiments)})...")
-        try:
-            comment_id, comment_sentiment = sentiment
-
-            cursor.execute(
-                """
-                UPDATE 
-                    issue_comments_from_release
-                SET 
-                    sentiment_gemini_2_0_flash = %s
-                WHERE
-                    comment_id = %s;
-                """,
-                (comment_sentiment, comment_id)
-            )
+    for comment in comments:
+        comment_id, _, comment_body = comment
+
+        logging.info(f"Classifying comment {comment_id} ({i}/{len(comments)})...")
 
-            logging.info("saved!")
-            i += 1
-        except Exception as e:
-            logging.error(f"Error occurred with comment {sentiment}: {e}")
-            continue
\ No newline at end of file
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(model, TEMPERATURE, SYSTEM_PROMPT, context, comment_body)
+
+        comment_sentiment = classify_comment_sentiment_genai(comment_body, issue_chat_session, cache, cache_key)
+
+        results.append((comment_id, comment_sentiment))
+
+        i += 1
+    return results
+
+
+def save_sentiments_gpt(sentiments,cursor):
+    save_sentiments(cursor, "gpt-4o-mini", sentiments)
+
+
+def save_sentiments_ds(sentiments,cursor):
+    save_sentiments(cursor, "deepseek-chat", sentiments)
+        
+
+def save_sentiments_gemini(sentiments,cursor):
+    save_sentiments(cursor, "gemini-2.0-flash", sentiments)
@@ -0,0 +1,340 @@
+from batch_classification import classify_comments_batched
+from comment_rules import ensure_filters_table
+from itertools import groupby
+from labels import parse_label
+from sentiment_store import ensure_sentiments_table, save_sentiments
+import logging
+
+
+def ensure_queue_tables(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS classification_runs (
+            run_id BIGSERIAL PRIMARY KEY,
+            model TEXT,
+            release TEXT,
+            created_at TIMESTAMP DEFAULT now()
+        );
+
+        CREATE TABLE IF NOT EXISTS classification_queue (
+            run_id BIGINT,
+            comment_id BIGINT,
+            issue_id BIGINT,
+            model TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            leased_until TIMESTAMP,
+            last_error TEXT,
+            PRIMARY KEY (run_id, comment_id)
+        );
+
+        CREATE INDEX IF NOT EXISTS classification_queue_claim
+            ON classification_queue (run_id, status, issue_id);
+        """
+    )
+
+
+def create_run(conn, model, release, skip_labelled=True, skip_filtered=False):
+    """
+    Creates a classification run and enqueues the comments of a release.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            An active PostgreSQL database connection.
+        model (str):
+            Model identifier the labels are saved under (ex.: 'gpt-4o-mini').
+        release (str):
+            Release whose comments are enqueued (matched with `LIKE '%release%'`, as in the notebooks).
+        skip_labelled (bool, optional):
+            Leave out the comments that already have a label of `model` in `comment_sentiments`.
+            Comments whose saved answer could not be parsed (NULL label) are enqueued again.
+        skip_filtered (bool, optional):
+            Leave out the comments flagged by `comment_rules.filter_comments_sql`.
+
+    Returns:
+        int:
+            The id of the new run.
+    """
+    cursor = conn.cursor()
+    ensure_queue_tables(cursor)
+
+    cursor.execute(
+        "INSERT INTO classification_runs (model, release) VALUES (%s, %s) RETURNING run_id;",
+        (model, release)
+    )
+    run_id = cursor.fetchone()[0]
+
+    skip_clause = ""
+    if skip_labelled:
+        ensure_sentiments_table(cursor)
+        skip_clause = """
+            AND NOT EXISTS (
+                SELECT 1 FROM comment_sentiments s
+                WHERE s.comment_id = c.comment_id AND s.model = %(model)s AND s.label IS NOT NULL
+            )
+        """
+
+    if skip_filtered:
+        ensure_filters_table(cursor)
+        skip_clause += """
+            AND NOT EXISTS (SELECT 1 FROM comment_filters f WHERE f.comment_id = c.comment_id)
+        """
+
+    cursor.execute(
+        f"""
+        INSERT INTO classification_queue (run_id, comment_id, issue_id, model)
+        SELECT
+            %(run_id)s, c.comment_id, c.issue_id, %(model)s
+        FROM
+            issue_comments_from_release c
+        JOIN
+            issues_from_release i ON i.issue_id = c.issue_id
+        WHERE
+            i.release_number LIKE %(release)s
+            {skip_clause}
+        ON CONFLICT DO NOTHING;
+        """,
+        {"run_id": run_id, "model": model, "release": f"%{release}%"}
+    )
+    enqueued = cursor.rowcount
+
+    conn.commit()
+
+    logging.info(f"Run {run_id} created with {enqueued} comments for model {model}.")
+
+    return run_id
+
+
+def claim_batch(conn, run_id, batch_size=50, lease_seconds=300, max_attempts=3):
+    """
+    Leases up to `batch_size` pending comments of a run to the calling worker.
+
+    `FOR UPDATE SKIP LOCKED` lets concurrent workers claim disjoint batches, and
+    comments whose lease expired (a worker died) are claimed again, or marked as
+    failed if that lease was their last attempt.
+
+    Returns:
+        list of tuple:
+            `(issue_id, issue_title, issue_body, comment_id, created_at, comment_body)` rows,
+            ordered by issue and comment date.
+    """
+    cursor = conn.cursor()
+
+    # Expired leases that used the last attempt can no longer be claimed, so they are
+    # closed here; otherwise they would stay 'leased' and the run would never finish.
+    cursor.execute(
+        """
+        UPDATE classification_queue
+        SET
+            status = 'failed',
+            leased_until = NULL,
+            last_error = 'lease expired on the last attempt'
+        WHERE
+            run_id = %s
+            AND status = 'leased'
+            AND leased_until < now()
+            AND attempts >= %s;
+        """,
+        (run_id, max_attempts)
+    )
+
+    cursor.execute(
+        """
+        WITH claimable AS (
+            SELECT
+                run_id, comment_id
+            FROM
+                classification_queue
+            WHERE
+                run_id = %s
+                AND attempts < %s
+                AND (status = 'pending' OR (status = 'leased' AND leased_until < now()))
+            ORDER BY
+                issue_id, comment_id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE
+            classification_queue q
+        SET
+            status = 'leased',
+            attempts = q.attempts + 1,
+            leased_until = now() + make_interval(secs => %s)
+        FROM
+            claimable
+        WHERE
+            q.run_id = claimable.run_id AND q.comment_id = claimable.comment_id
+        RETURNING
+            q.comment_id;
+        """,
+        (run_id, max_attempts, batch_size, lease_seconds)
+    )
+    comment_ids = [row[0] for row in cursor.fetchall()]
+
+    conn.commit()
+
+    if not comment_ids:
+        return []
+
+    cursor.execute(
+        """
+        SELECT
+            i.issue_id,
+            i.title,
+            i.body,
+            c.comment_id,
+            c.created_at,
+            c.body
+        FROM
+            issue_comments_from_release c
+        JOIN
+            issues_from_release i ON i.issue_id = c.issue_id
+        WHERE
+            c.comment_id = ANY(%s)
+        ORDER BY
+            i.issue_id, c.created_at;
+        """,
+        (comment_ids,)
+    )
+    rows = cursor.fetchall()
+
+    conn.commit()
+
+    return rows
+
+
+def complete_batch(conn, run_id, model, sentiments, max_attempts=3):
+    """
+    Saves the labels of a claimed batch and marks those comments as done, in one transaction.
+    Comments left without a label, or whose answer `labels.parse_label` cannot parse (its raw
+    text is still saved), go back to the queue, or to 'failed' once they used their
+    `max_attempts` claims.
+    """
+    cursor = conn.cursor()
+
+    answered = [(comment_id, answer) for comment_id, answer in sentiments if answer is not None]
+    labelled = [comment_id for comment_id, answer in answered if parse_label(answer) is not None]
+    unparseable = [comment_id for comment_id, answer in answered if parse_label(answer) is None]
+    unlabelled = [comment_id for comment_id, answer in sentiments if answer is None]
+
+    if answered:
+        save_sentiments(cursor, model, answered)
+
+    if labelled:
+        cursor.execute(
+            """
+            UPDATE classification_queue
+            SET status = 'done', leased_until = NULL, last_error = NULL
+            WHERE run_id = %s AND comment_id = ANY(%s);
+            """,
+            (run_id, labelled)
+        )
+
+    if unparseable:
+        release_batch(cursor, run_id, unparseable, "unparseable label", max_attempts)
+
+    if unlabelled:
+        release_batch(cursor, run_id, unlabelled, "no label in the answer", max_attempts)
+
+    conn.commit()
+
+
+def release_batch(cursor, run_id, comment_ids, error, max_attempts=3):
+    """Returns leased comments to the queue, or marks them as failed once out of attempts."""
+    cursor.execute(
+        """
+        UPDATE classification_queue
+        SET
+            status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+            leased_until = NULL,
+            last_error = %s
+        WHERE run_id = %s AND comment_id = ANY(%s);
+        """,
+        (max_attempts, error, run_id, comment_ids)
+    )
+
+
+def run_worker(
+    conn, run_id, model, complete, batch_size=50, lease_seconds=300, max_attempts=3, comments_per_request=20,
+    issue_context=None
+):
+    """
+    Claims and classifies batches of a run until the queue is drained.
+
+    Several workers (processes or machines, each with its own connection) can run
+    on the same `run_id`; labels are committed as each batch completes, so an
+    interrupted run resumes where it stopped by starting the worker again.
+
+    Parameters:
+        conn (psycopg2.connection or psycopg.Connection):
+            Connection owned by this worker.
+        run_id (int):
+            Run created by `create_run`.
+        model (str):
+            Model identifier the labels are saved under.
+        complete (callable):
+            `complete(system_prompt, user_prompt) -> str`, see `batch_classification`.
+        batch_size (int, optional):
+            Comments claimed per lease.
+        lease_seconds (int, optional):
+            Time after which the comments of an unfinished batch can be claimed by another worker.
+        max_attempts (int, optional):
+            Claims of a comment before it is marked as failed.
+        comments_per_request (int, optional):
+            Comments sent per LLM request.
+        issue_context (IssueContext, optional):
+            Compresses the issues and comments to its token budgets before they are sent.
+
+    Returns:
+        int:
+            Number of comments labelled by this worker.
+    """
+    labelled = 0
+
+    while True:
+        rows = claim_batch(conn, run_id, batch_size, lease_seconds, max_attempts)
+        if not rows:
+            break
+
+        for (issue_id, issue_title, issue_body), issue_rows in groupby(rows, key=lambda row: row[:3]):
+            comments = [(comment_id, created_at, body) for _, _, _, comment_id, created_at, body in issue_rows]
+
+            try:
+                if issue_context is not None:
+                    issue_title, issue_body = issue_context.compress_issue(issue_id, issue_title, issue_body)
+                    comments = issue_context.compress_comments(comments)
+
+                sentiments = classify_comments_batched(
+                    issue_title, issue_body, comments, complete, comments_per_request
+                )
+                complete_batch(conn, run_id, model, sentiments, max_attempts)
+                labelled += sum(1 for _, answer in sentiments if parse_label(answer) is not None)
+            except Exception as e:
+                conn.rollback()
+                logging.error(f"Error when classifying issue {issue_id} of run {run_id}: {e}")
+                release_batch(conn.cursor(), run_id, [c[0] for c in comments], str(e), max_attempts)
+                conn.commit()
+
+        logging.info(f"Run {run_id}: {labelled} comments labelled by this worker so far.")
+
+    return labelled
+
+
+def run_progress(conn, run_id):
+    """Returns the number of comments of a run in each status."""
+    cursor = conn.cursor()
+
+    cursor.execute(
+        """
+        SELECT status, COUNT(*)
+        FROM classification_queue
+        WHERE run_id = %s
+        GROUP BY status;
+        """,
+        (run_id,)
+    )
+    progress = dict(cursor.fetchall())
+
+    conn.commit()
+
+    return progress
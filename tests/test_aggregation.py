@@ -0,0 +1,49 @@
+from datetime import datetime
+import os
+import pyarrow as pa
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.extend(os.path.join(SRC, package) for package in ("data_collection", "data_visualization", "sentiment_classification"))
+from aggregation import count_labels_snapshot
+from snapshot import write_dataset
+
+
+def write(root, dataset, columns):
+    rows = len(columns["comment_id"])
+    table = pa.table({"repo": ["grafana/grafana"] * rows, "release": ["12.0.x"] * rows, **columns})
+    write_dataset(root, dataset, table.to_batches(), table.schema)
+
+
+def test_excluded_comments_are_not_counted(tmp_path):
+    write(tmp_path, "comments", {
+        "comment_id": [1, 2, 3, 4],
+        "author": ["alice", "bob", "carol", "grafanabot"],
+        "created_at": [datetime(2025, 5, day) for day in range(1, 5)],
+        "body": ["Thanks!", "Still broken.", "Closing this issue due to inactivity", "Please add labels."],
+        "sentiment_gpt_4o_mini": ["positive", "negative", "neutral", "negative"],
+    })
+    write(tmp_path, "sentiments", {
+        "comment_id": [1, 4],
+        "model": ["local-tiny-transformer", "local-tiny-transformer"],
+        "label": ["positive", "negative"],
+    })
+
+    before = count_labels_snapshot(tmp_path)
+    assert before.loc[("grafana/grafana", "12.0.x", "gpt-4o-mini"), "negative"] == 2
+    assert before.loc[("grafana/grafana", "12.0.x", "local-tiny-transformer"), "negative"] == 1
+
+    write(tmp_path, "filters", {
+        "comment_id": [3, 4],
+        "rule": ["inactivity_closing", "known_bot"],
+        "action": ["label", "exclude"],
+        "label": ["neutral", None],
+    })
+
+    after = count_labels_snapshot(tmp_path)
+    assert after.loc[("grafana/grafana", "12.0.x", "gpt-4o-mini")].to_dict() == {
+        "negative": 1, "neutral": 1, "positive": 1
+    }
+    assert after.loc[("grafana/grafana", "12.0.x", "local-tiny-transformer")].to_dict() == {
+        "negative": 0, "neutral": 0, "positive": 1
+    }
@@ -0,0 +1,40 @@
+import os
+import sys
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "sentiment_classification"))
+from backends import LocalTorchBackend
+from labels import LABELS
+
+
+COMMENTS = [
+    (1, None, "Thanks, the fix works!"),
+    (2, None, "Still broken on 2.18 after the upgrade, the build fails with the same error as before."),
+    (3, None, ""),
+    (4, None, "+1"),
+    (5, None, "Could you share the full traceback and the output of pip list? " * 8),
+    (6, None, "Closing as a duplicate of #123."),
+    (7, None, "This is a regression, it worked in the previous release and now every import crashes."),
+]
+
+
+def test_batched_and_one_by_one_labels_match():
+    torch.manual_seed(0)
+    backend = LocalTorchBackend(batch_size=3, num_threads=1)
+    texts = [body for _, _, body in COMMENTS]
+
+    batched = backend.classify(texts)
+    one_by_one = [backend.classify([text])[0] for text in texts]
+
+    assert batched == one_by_one
+    assert set(batched) <= set(LABELS)
+
+
+def test_classify_comments_keeps_the_comment_ids():
+    torch.manual_seed(0)
+    backend = LocalTorchBackend(batch_size=4, num_threads=1)
+
+    sentiments = backend.classify_comments("Title", "Body", COMMENTS)
+
+    assert [comment_id for comment_id, _ in sentiments] == [comment_id for comment_id, _, _ in COMMENTS]
+    assert all(label in LABELS for _, label in sentiments)
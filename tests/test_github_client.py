@@ -0,0 +1,144 @@
+from email.utils import formatdate
+import logging
+import os
+import pytest
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "data_collection"))
+from github_client import SECONDARY_RATE_LIMIT_WAIT, ETagCache, GitHubAPIError, GitHubClient, _parse_retry_after
+from mock_github import MockGitHubServer
+
+
+def comments_path(number):
+    return f"/repos/mock/mock/issues/{number}/comments"
+
+
+def test_retries_transient_failures():
+    failures = [(502, {}), (503, {}), (500, {}), (429, {"Retry-After": "0"})]
+
+    with MockGitHubServer(num_issues=5, latency=0, failures=failures) as server:
+        client = GitHubClient(base_url=server.url, backoff_base=0.01)
+        page = client.get("/search/issues", params={"q": "repo:mock/mock is:issue"})
+
+        assert len(page.data["items"]) == 5
+        assert server.request_count == len(failures) + 1
+
+
+def test_backoff_is_jittered_and_capped():
+    client = GitHubClient(backoff_base=0.5, backoff_max=3.0)
+
+    delays = [client._backoff(attempt) for attempt in range(6) for _ in range(50)]
+
+    assert all(0 <= delay <= 3.0 for delay in delays)
+    assert all(0 <= client._backoff(1) <= 1.0 for _ in range(50))
+    assert len(set(delays)) > 1
+
+
+def test_retry_after_as_http_date():
+    assert _parse_retry_after("120") == 120.0
+    assert _parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+    assert 1.0 <= _parse_retry_after(formatdate(time.time() + 3, usegmt=True)) <= 3.0
+
+    retry_at = formatdate(time.time() + 2, usegmt=True)
+    with MockGitHubServer(num_issues=1, latency=0, failures=[(503, {"Retry-After": retry_at})]) as server:
+        client = GitHubClient(base_url=server.url, backoff_base=0.01)
+
+        start = time.perf_counter()
+        client.get(comments_path(1))
+
+        assert time.perf_counter() - start >= 0.9
+        assert server.request_count == 2
+
+
+def test_permission_403_is_not_retried():
+    with MockGitHubServer(num_issues=1, latency=0, failures=[(403, {})]) as server:
+        client = GitHubClient(base_url=server.url, backoff_base=0.01)
+
+        with pytest.raises(GitHubAPIError) as error:
+            client.get(comments_path(1))
+
+        assert error.value.status_code == 403
+        assert server.request_count == 1
+
+
+def test_rate_limit_403_is_retried():
+    failures = [
+        (403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(int(time.time()))}),
+        (403, {"Retry-After": "0"}),
+    ]
+
+    with MockGitHubServer(num_issues=1, latency=0, failures=failures) as server:
+        client = GitHubClient(base_url=server.url, backoff_base=0.01)
+        client.get(comments_path(1))
+
+        assert server.request_count == 3
+
+
+def test_secondary_rate_limit_403_waits_a_minute(monkeypatch):
+    body = '{"message": "You have exceeded a secondary rate limit. Please wait a few minutes before you try again."}'
+    sleeps = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+
+    with MockGitHubServer(num_issues=1, latency=0, failures=[(403, {}, body)]) as server:
+        client = GitHubClient(base_url=server.url, backoff_base=0.01)
+        client.get(comments_path(1))
+
+        assert server.request_count == 2
+        assert max(sleeps) >= SECONDARY_RATE_LIMIT_WAIT
+
+
+def test_etag_cache_is_bounded():
+    cache = ETagCache(max_entries=3)
+    for number in range(5):
+        cache.put(f"/page/{number}", f'"{number}"', {"number": number}, {})
+    cache.put("/page/4", '"4b"', {"number": 4}, {})
+
+    assert len(cache) == 3
+    assert cache.get("/page/0") is None and cache.get("/page/1") is None
+    assert cache.get("/page/4")[0] == '"4b"'
+
+
+def test_low_quota_is_logged_once_per_window(caplog):
+    with MockGitHubServer(num_issues=5, latency=0, rate_limit=100) as server:
+        client = GitHubClient(base_url=server.url, min_remaining=100)
+        client._wait_for_quota = lambda: None
+
+        with caplog.at_level(logging.WARNING):
+            for number in range(1, 6):
+                client.get(comments_path(number), use_cache=False)
+
+        assert sum("requests left" in record.message for record in caplog.records) == 1
+
+
+def test_pauses_when_the_quota_is_spent():
+    with MockGitHubServer(num_issues=4, latency=0, rate_limit=3, rate_limit_window=1.5) as server:
+        client = GitHubClient(base_url=server.url, min_remaining=0, backoff_base=0.01)
+
+        start = time.perf_counter()
+        for number in range(1, 5):
+            client.get(comments_path(number))
+
+        # The fourth request waits for the window to reset instead of hitting the limit.
+        assert time.perf_counter() - start >= 1.0
+        assert server.rate_limited_count == 0
+        assert server.request_count == 4
+
+
+def test_etag_recrawl_at_zero_quota():
+    num_issues = 10
+
+    with MockGitHubServer(num_issues=num_issues, latency=0, rate_limit=num_issues) as server:
+        client = GitHubClient(base_url=server.url, min_remaining=0)
+        first = [client.get(comments_path(number)) for number in range(1, num_issues + 1)]
+        assert server.remaining == 0
+
+        start = time.perf_counter()
+        recrawl = [client.get(comments_path(number)) for number in range(1, num_issues + 1)]
+
+        assert time.perf_counter() - start < 1.0
+        assert [page.data for page in recrawl] == [page.data for page in first]
+        assert all(page.from_cache for page in recrawl)
+        assert server.not_modified_count == num_issues
+        assert server.rate_limited_count == 0
+        assert server.remaining == 0
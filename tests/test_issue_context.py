@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "sentiment_classification"))
+from issue_context import IssueContext, approximate_tokens, compress_text
+
+
+def test_long_unbroken_text_is_not_one_token():
+    assert approximate_tokens("x" * 5000) >= 1250
+    assert approximate_tokens("The build fails on Windows.") < 15
+
+
+def test_unbroken_text_is_capped_to_the_budget():
+    for text in ["x" * 5000, "A" * 2000 + "==", "0123456789abcdef" * 300]:
+        compressed = compress_text(text, 100, approximate_tokens)
+
+        assert compressed != text
+        assert approximate_tokens(compressed) <= 100
+
+
+def test_repeated_log_lines_are_collapsed():
+    log = "\n".join(f"step {i}: loss 0.{i:03d}" for i in range(500))
+
+    compressed = compress_text(log, 50, approximate_tokens)
+
+    assert "[... repeated 499 more times]" in compressed
+    assert approximate_tokens(compressed) <= 50
+
+
+def test_comments_are_unchanged_by_default():
+    comments = [(1, "2025-01-01", "x" * 5000)]
+
+    assert IssueContext(count=approximate_tokens).compress_comments(comments) == comments
+
+    compressed = IssueContext(comment_budget=100, count=approximate_tokens).compress_comments(comments)
+    assert approximate_tokens(compressed[0][2]) <= 100
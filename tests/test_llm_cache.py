@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "sentiment_classification"))
+from llm_cache import LLMCache
+
+
+def stored_size(cache):
+    return cache._db.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache;").fetchone()[0]
+
+
+def test_running_size_matches_the_table(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"), max_bytes=200)
+
+    for i in range(30):
+        cache.put(f"key-{i % 12}", "neutral" * (1 + i % 3))
+
+    assert cache.stats()["bytes"] == stored_size(cache) <= 200
+    cache.close()
+
+    reopened = LLMCache(str(tmp_path / "cache.sqlite"), max_bytes=200)
+    assert reopened.stats()["bytes"] == stored_size(reopened)
+
+
+def test_hits_update_last_used_in_batches(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"), touch_batch=3)
+    for i in range(3):
+        cache.put(f"key-{i}", "positive")
+    before = dict(cache._db.execute("SELECT key, last_used FROM llm_cache;").fetchall())
+
+    assert cache.get("key-0") == "positive" and cache.get("key-1") == "positive"
+    assert dict(cache._db.execute("SELECT key, last_used FROM llm_cache;").fetchall()) == before
+
+    cache.get("key-2")
+    after = dict(cache._db.execute("SELECT key, last_used FROM llm_cache;").fetchall())
+    assert all(after[key] > before[key] for key in before)
+
+
+def test_evicts_the_least_recently_used(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.sqlite"), max_bytes=60, touch_batch=100)
+    for i in range(3):
+        cache.put(f"key-{i}", "x" * 18)
+    cache.get("key-0")
+
+    cache.put("key-3", "x" * 18)
+
+    assert cache.get("key-0") is not None
+    assert cache.get("key-1") is None